@@ -0,0 +1,172 @@
+"""
+Maintenance commands
+
+Usage: python -m app.cli <command>
+"""
+import argparse
+import asyncio
+import json
+from itertools import islice
+from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import ValidationError
+from .config import settings
+from .dependencies.indexes import sync_indexes, check_query_plans
+from .routers import auth, loans, admin  # Registers declared indexes and queries
+from .utils.borrower_history import rebuild_borrower_summaries
+from .utils.loan_stats import reconcile_loan_stats
+from .utils.applications import apply_batch
+from .utils.simulation import simulate_policy
+from .utils.status_history import archive_status_history
+from .models.simulation import SimulationRequest
+
+async def rebuild_borrower_summaries_command(db, args):
+    borrowers = await rebuild_borrower_summaries(db)
+    print(f"Rebuilt summaries for {borrowers} borrowers")
+
+async def check_indexes_command(db, args):
+    if args.sync:
+        await sync_indexes(db, drop_stale=settings.INDEX_DROP_STALE)
+    failures = await check_query_plans(db)
+    for query, stages in failures:
+        print(f"COLLSCAN on {query.collection}: filter={query.filter} sort={query.sort} plan={stages}")
+    if failures:
+        raise SystemExit(1)
+    print("Every declared query is served by an index")
+
+async def reconcile_stats_command(db, args):
+    report = await reconcile_loan_stats(db, fix=args.fix)
+    if not report["totals"] and not report["daily"]:
+        print("Loan stats match the loans collection")
+        return
+    print(f"Status totals drift (stored - recomputed): {report['totals']}")
+    for day, drift in report["daily"].items():
+        print(f"{day}: {drift}")
+    print("Stored stats replaced" if args.fix else "Run with --fix to replace the stored stats")
+
+async def bulk_apply_command(db, args):
+    # Runs with direct database access, so records may be for any active borrower
+    submitter = {"email": args.submitted_by, "is_admin": True}
+    histories = {}
+    created = failed = 0
+    with open(args.file) as file:
+        lines = ((number, line) for number, line in enumerate(file, start=1) if line.strip())
+        while True:
+            chunk = list(islice(lines, settings.BULK_APPLY_BATCH_SIZE))
+            if not chunk:
+                break
+            numbers, records = [], []
+            for number, line in chunk:
+                try:
+                    records.append(json.loads(line))
+                    numbers.append(number)
+                except json.JSONDecodeError as e:
+                    failed += 1
+                    print(f"line {number}: invalid JSON: {e}")
+            for result in await apply_batch(db, records, submitter, histories):
+                if result["ok"]:
+                    created += 1
+                else:
+                    failed += 1
+                    print(f"line {numbers[result['index']]}: {result['error']}")
+    print(f"Created {created} loans, {failed} records failed")
+    if failed:
+        raise SystemExit(1)
+
+def _print_outcome(label: str, outcome, bin_edges):
+    print(f"{label}: policy {outcome.policy_version}, threshold {outcome.threshold:g}, "
+          f"mean score {outcome.mean_score}")
+    print(f"  passed {outcome.passed}, rejected {outcome.rejected}")
+    for low, high, count in zip(bin_edges, bin_edges[1:], outcome.histogram):
+        print(f"  {low:6.1f}-{high:6.1f} {count:10}")
+
+async def simulate_policy_command(db, args):
+    with open(args.policy) as file:
+        policy = json.load(file)
+    try:
+        request = SimulationRequest(
+            policy=policy,
+            status=args.status,
+            created_from=args.created_from,
+            created_to=args.created_to,
+            sample_size=args.sample,
+            bin_width=args.bin_width,
+            max_flips=args.max_flips
+        )
+    except ValidationError as e:
+        raise SystemExit(f"Invalid simulation: {e}")
+    result = await simulate_policy(db, request)
+    print(f"Scored {result.loans} {'sampled ' if result.sampled else ''}loans in {result.elapsed_seconds}s")
+    _print_outcome("Active", result.current, result.bin_edges)
+    _print_outcome("Candidate", result.candidate, result.bin_edges)
+    print(f"Decisions flipped: {result.flips_to_rejected} to rejected, {result.flips_to_passed} to passed")
+    for flip in result.flips:
+        print(f"  {flip.loan_id} {flip.email} {flip.current_score} -> {flip.candidate_score}")
+
+async def archive_status_history_command(db, args):
+    archived, trimmed = await archive_status_history(db, args.batch_size)
+    print(f"Archived {archived} status changes to loan_events, trimmed {trimmed} loans "
+          f"to their last {settings.STATUS_HISTORY_LIMIT} changes")
+
+COMMANDS = {
+    "rebuild-borrower-summaries": rebuild_borrower_summaries_command,
+    "check-indexes": check_indexes_command,
+    "reconcile-stats": reconcile_stats_command,
+    "bulk-apply": bulk_apply_command,
+    "simulate-policy": simulate_policy_command,
+    "archive-status-history": archive_status_history_command,
+}
+
+async def run(args):
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    try:
+        await COMMANDS[args.command](client[settings.DB_NAME], args)
+    finally:
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "rebuild-borrower-summaries",
+        help="Recompute per-borrower loan counts from the loans collection"
+    )
+    check_indexes_parser = subparsers.add_parser(
+        "check-indexes",
+        help="Fail if any declared query plan uses a COLLSCAN"
+    )
+    check_indexes_parser.add_argument(
+        "--sync", action="store_true",
+        help="first reconcile indexes with their declarations (run once per deploy)"
+    )
+    reconcile_parser = subparsers.add_parser(
+        "reconcile-stats",
+        help="Recompute loan stats counters and report drift"
+    )
+    reconcile_parser.add_argument("--fix", action="store_true", help="replace the stored counters")
+    bulk_apply_parser = subparsers.add_parser(
+        "bulk-apply",
+        help="Apply for loans from an NDJSON file, one application per line"
+    )
+    bulk_apply_parser.add_argument("file", help="NDJSON file of {amount, purpose, duration_months, user_email}")
+    bulk_apply_parser.add_argument("--submitted-by", required=True, help="email recorded as the submitter")
+    simulate_parser = subparsers.add_parser(
+        "simulate-policy",
+        help="Compare a candidate scoring policy with the active one over the stored loans"
+    )
+    simulate_parser.add_argument("policy", help="candidate scoring policy JSON file")
+    simulate_parser.add_argument("--status", help="only loans in this status")
+    simulate_parser.add_argument("--created-from", help="only loans created at or after this ISO date")
+    simulate_parser.add_argument("--created-to", help="only loans created before this ISO date")
+    simulate_parser.add_argument("--sample", type=int, help="score a random sample of this many loans")
+    simulate_parser.add_argument("--bin-width", type=float, default=10, help="score histogram bin width")
+    simulate_parser.add_argument("--max-flips", type=int, default=20, help="flipped loans to list")
+    archive_parser = subparsers.add_parser(
+        "archive-status-history",
+        help="Copy embedded status histories to loan_events and cap them at STATUS_HISTORY_LIMIT"
+    )
+    archive_parser.add_argument("--batch-size", type=int, default=1000, help="loans per batch")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,39 @@ from fastapi.encoders import jsonable_encoder
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from fastapi_cache.decorator import cache
+from redis import asyncio as aioredis
+from ..config import settings
 
 async def get_database(request: Request):
-    return request.app.mongodb 
+    return request.app.mongodb
 
-async def create_indexes(db):
-    # Create indexes for frequently queried fields
-    await db.users.create_index("email", unique=True)
-    await db.loans.create_index("email")
-    await db.loans.create_index("status")
-    await db.loans.create_index([("email", 1), ("status", 1)]) 
\ No newline at end of file
+def create_mongo_client(event_listeners=()) -> AsyncIOMotorClient:
+    """A Motor client with the pool limits from settings"""
+    return AsyncIOMotorClient(
+        settings.MONGODB_URL,
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        event_listeners=list(event_listeners)
+    )
+
+def redis_url() -> str:
+    return settings.REDIS_URL or f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}"
+
+def create_redis() -> aioredis.Redis:
+    """
+    A Redis client on a bounded pool; when every connection is busy callers
+    wait up to REDIS_POOL_TIMEOUT_SECONDS instead of opening more
+    """
+    pool = aioredis.BlockingConnectionPool.from_url(
+        redis_url(),
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT_SECONDS,
+        # No read timeout: the event feed's subscription waits on its socket indefinitely
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_SECONDS,
+        encoding="utf8",
+        decode_responses=True
+    )
+    return aioredis.Redis(connection_pool=pool)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    options: dict
+
+    @property
+    def name(self) -> str:
+        # Same naming scheme as pymongo, so indexes created by hand are recognised
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+class QuerySpec(NamedTuple):
+    collection: str
+    filter: dict
+    sort: Optional[Tuple[Tuple[str, int], ...]]
+
+# Indexes and query shapes are declared by the modules that run the queries
+_indexes: Dict[str, Dict[str, IndexSpec]] = {}
+_queries: List[QuerySpec] = []
+
+# Options compared when deciding whether an existing index matches its declaration
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+def declare_index(collection: str, keys: List[Tuple[str, int]], **options) -> IndexSpec:
+    spec = IndexSpec(collection, tuple(keys), options)
+    _indexes.setdefault(collection, {})[spec.name] = spec
+    return spec
+
+def declare_query(collection: str, filter: dict, sort: Optional[List[Tuple[str, int]]] = None) -> QuerySpec:
+    """
+    Register the shape of a query, with sample values, so that
+    check_query_plans can verify it is served by an index
+    """
+    spec = QuerySpec(collection, filter, tuple(sort) if sort else None)
+    _queries.append(spec)
+    return spec
+
+def declared_indexes() -> Dict[str, Dict[str, IndexSpec]]:
+    return _indexes
+
+def declared_queries() -> List[QuerySpec]:
+    return list(_queries)
+
+def _matches(spec: IndexSpec, existing: dict) -> bool:
+    if tuple((field, int(direction)) for field, direction in existing["key"]) != spec.keys:
+        return False
+    return all(existing.get(option) == spec.options.get(option) for option in _COMPARED_OPTIONS)
+
+async def build_missing_indexes(db, unique_only: bool = False):
+    """
+    Build the declared indexes that do not exist yet, in the background
+    Never drops anything, so every worker can run it at startup; an
+    identical index built by another worker meanwhile is a no-op
+    """
+    for collection, specs in _indexes.items():
+        existing = await db[collection].index_information()
+        for name, spec in specs.items():
+            if name in existing or (unique_only and not spec.options.get("unique")):
+                continue
+            logger.info("Building index %s.%s", collection, name)
+            await db[collection].create_index(
+                list(spec.keys), name=name, background=True, **spec.options
+            )
+
+async def sync_indexes(db, drop_stale: bool = False):
+    """
+    Reconcile the indexes of every collection with a declaration
+    Changed indexes are dropped and rebuilt, missing ones built, and
+    undeclared ones dropped when drop_stale is set. While it runs a
+    changed index is missing, unique ones included, so run it once
+    from the CLI rather than from every worker
+    """
+    for collection, specs in _indexes.items():
+        existing = await db[collection].index_information()
+
+        for name, info in existing.items():
+            if name == "_id_":
+                continue
+            spec = specs.get(name)
+            if spec is None and not drop_stale:
+                continue
+            if spec is None or not _matches(spec, info):
+                logger.info("Dropping index %s.%s", collection, name)
+                await db[collection].drop_index(name)
+    await build_missing_indexes(db)
+
+def start_index_build(db) -> asyncio.Task:
+    """Run build_missing_indexes without holding up startup, logging any failure"""
+    async def run():
+        try:
+            await build_missing_indexes(db)
+        except Exception:
+            logger.exception("Building missing indexes failed")
+    return asyncio.create_task(run())
+
+def _plan_stages(plan) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+async def check_query_plans(db) -> List[Tuple[QuerySpec, List[str]]]:
+    """
+    Explain every declared query
+    Returns the queries whose winning plan contains a COLLSCAN,
+    with the stages of that plan
+    """
+    failures = []
+    for query in _queries:
+        command = {"find": query.collection, "filter": query.filter}
+        if query.sort:
+            command["sort"] = dict(query.sort)
+        explanation = await db.command("explain", command, verbosity="queryPlanner")
+        stages = _plan_stages(explanation["queryPlanner"]["winningPlan"])
+        if "COLLSCAN" in stages:
+            failures.append((query, stages))
+    return failures
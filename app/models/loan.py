@@ -10,6 +10,18 @@ class LoanStatus(str, Enum):
     APPROVED = "approved"
     REJECTED = "rejected"
 
+class ScoringState(str, Enum):
+    QUEUED = "queued"  # Waiting for the scoring worker
+    FAILED = "failed"  # Gave up after SCORING_MAX_ATTEMPTS; an admin can score it by hand
+
+# Statuses a batch review may move a loan to, by its current status
+REVIEW_TRANSITIONS = {
+    LoanStatus.PENDING: {LoanStatus.IN_REVIEW, LoanStatus.APPROVED, LoanStatus.REJECTED},
+    LoanStatus.IN_REVIEW: {LoanStatus.PENDING, LoanStatus.APPROVED, LoanStatus.REJECTED},
+    LoanStatus.APPROVED: set(),
+    LoanStatus.REJECTED: set()
+}
+
 class StatusChange(BaseModel):
     status: LoanStatus
     changed_at: datetime
@@ -35,6 +47,8 @@ class Loan(LoanBase):
     user_email: str = Field(..., alias="email")
     status: LoanStatus = LoanStatus.PENDING
     credit_score: Optional[float] = None
+    score_policy_version: Optional[str] = None  # Scoring policy that produced credit_score
+    scoring_state: Optional[ScoringState] = None  # Set while a queued application has no score
     created_at: datetime
     updated_at: Optional[datetime] = None
     status_history: List[StatusChange] = []
@@ -55,11 +69,98 @@ class Loan(LoanBase):
             duration_months=data.get("duration_months", 0),
             status=data.get("status", LoanStatus.PENDING),
             credit_score=data.get("credit_score"),
+            score_policy_version=data.get("score_policy_version"),
+            scoring_state=data.get("scoring_state"),
             created_at=data.get("created_at", datetime.utcnow()),
             updated_at=data.get("updated_at"),
             status_history=data.get("status_history", [])
         )
 
+    @classmethod
+    def dump_mongo(cls, data: dict) -> dict:
+        """
+        Response dict for a document read from our own loans collection,
+        shaped like from_mongo(data).model_dump(by_alias=True) but without
+        validating anything; only use it for trusted documents
+        """
+        credit_score = data.get("credit_score")
+        return {
+            "amount": float(data.get("amount", 0)),
+            "purpose": data.get("purpose", "Not specified"),
+            "duration_months": data.get("duration_months", 0),
+            "email": data.get("user_email", data.get("email", "Unknown")),
+            "_id": str(data["_id"]),
+            "status": data.get("status", LoanStatus.PENDING),
+            "credit_score": float(credit_score) if credit_score is not None else None,
+            "score_policy_version": data.get("score_policy_version"),
+            "scoring_state": data.get("scoring_state"),
+            "created_at": data.get("created_at") or datetime.utcnow(),
+            "updated_at": data.get("updated_at"),
+            "status_history": [
+                {
+                    "status": change["status"],
+                    "changed_at": change["changed_at"],
+                    "changed_by": change["changed_by"],
+                    "notes": change.get("notes")
+                }
+                for change in data.get("status_history", [])
+            ]
+        }
+
 class LoanStatusUpdate(BaseModel):
     status: LoanStatus
     notes: Optional[str] = None
+
+class BatchReviewItem(LoanStatusUpdate):
+    loan_id: str
+
+class BatchReviewRequest(BaseModel):
+    items: List[BatchReviewItem] = Field(..., min_length=1, max_length=500)
+
+class BatchReviewResult(BaseModel):
+    loan_id: str
+    ok: bool
+    previous_status: Optional[LoanStatus] = None
+    status: Optional[LoanStatus] = None
+    error: Optional[str] = None
+
+class BatchReviewResponse(BaseModel):
+    updated: int
+    failed: int
+    results: List[BatchReviewResult]
+
+class LoanSortField(str, Enum):
+    CREATED_AT = "created_at"
+    STATUS = "status"
+    AMOUNT = "amount"
+    CREDIT_SCORE = "credit_score"
+
+class LoanPage(BaseModel):
+    items: List[Loan]
+    next_cursor: Optional[str] = None
+
+class StatusHistoryPage(BaseModel):
+    items: List[StatusChange]  # Oldest first
+    next_cursor: Optional[str] = None
+
+class LoanFilter(BaseModel):
+    status: Optional[LoanStatus] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+class BulkApplyResult(BaseModel):
+    index: int  # Position of the record in the submission
+    ok: bool
+    loan_id: Optional[str] = None
+    status: Optional[LoanStatus] = None
+    credit_score: Optional[float] = None
+    error: Optional[str] = None
+
+class BulkApplyResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkApplyResult]
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
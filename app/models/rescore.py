@@ -0,0 +1,48 @@
+from pydantic import BaseModel, Field, ConfigDict
+from typing import Optional
+from datetime import datetime
+from enum import Enum
+from .loan import LoanFilter
+
+class RescoreJobStatus(str, Enum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class RescoreFilter(LoanFilter):
+    batch_size: Optional[int] = Field(default=None, gt=0, le=10000)
+
+class RescoreJob(BaseModel):
+    id: str = Field(alias="_id")
+    filter: RescoreFilter
+    status: RescoreJobStatus
+    created_by: str
+    total: int = 0
+    processed: int = 0
+    updated: int = 0
+    last_id: Optional[str] = None
+    started_at: datetime
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    @classmethod
+    def from_mongo(cls, data: dict) -> Optional["RescoreJob"]:
+        if not data:
+            return None
+        return cls(
+            id=str(data["_id"]),
+            filter=data.get("filter", {}),
+            status=data["status"],
+            created_by=data["created_by"],
+            total=data.get("total", 0),
+            processed=data.get("processed", 0),
+            updated=data.get("updated", 0),
+            last_id=str(data["last_id"]) if data.get("last_id") else None,
+            started_at=data["started_at"],
+            updated_at=data.get("updated_at"),
+            finished_at=data.get("finished_at"),
+            error=data.get("error")
+        )
@@ -0,0 +1,55 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List
+
+class BandTable(BaseModel):
+    """A value scores scores[i] for the first breakpoints[i] it does not exceed, else scores[-1]"""
+    breakpoints: List[float]
+    scores: List[float]
+
+    @model_validator(mode="after")
+    def check_bands(self) -> "BandTable":
+        if len(self.scores) != len(self.breakpoints) + 1:
+            raise ValueError("scores needs exactly one entry more than breakpoints")
+        if any(a >= b for a, b in zip(self.breakpoints, self.breakpoints[1:])):
+            raise ValueError("breakpoints must be strictly increasing")
+        if any(score < 0 for score in self.scores):
+            raise ValueError("scores must not be negative")
+        return self
+
+class PurposeTable(BaseModel):
+    scores: Dict[str, float]  # Keyed by lower-case purpose
+    default: float = Field(..., ge=0)
+
+    @model_validator(mode="after")
+    def check_scores(self) -> "PurposeTable":
+        if any(score < 0 for score in self.scores.values()):
+            raise ValueError("scores must not be negative")
+        return self
+
+class HistoryTable(BaseModel):
+    new_borrower: float = Field(..., ge=0)  # No previous loans
+    proven: float = Field(..., ge=0)  # At least proven_after approved loans
+    proven_after: int = Field(..., ge=2)
+    some_approvals: float = Field(..., ge=0)  # Between 1 and proven_after - 1 approved loans
+    no_approvals: float = Field(..., ge=0)
+
+class ScoringPolicyDocument(BaseModel):
+    version: str = Field(..., min_length=1)
+    threshold: float  # Scores below it are rejected automatically
+    amount: BandTable
+    duration: BandTable
+    purpose: PurposeTable
+    history: HistoryTable
+
+    @model_validator(mode="after")
+    def check_best_score(self) -> "ScoringPolicyDocument":
+        # Scores are normalised by the best possible raw score, so it must be positive
+        best = (
+            max(self.amount.scores)
+            + max(self.duration.scores)
+            + max([*self.purpose.scores.values(), self.purpose.default])
+            + max(self.history.new_borrower, self.history.proven, self.history.some_approvals, self.history.no_approvals)
+        )
+        if best <= 0:
+            raise ValueError("the best score of every component adds up to 0; at least one must be positive")
+        return self
@@ -0,0 +1,37 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from .loan import LoanFilter, LoanStatus
+from .scoring_policy import ScoringPolicyDocument
+
+class SimulationRequest(LoanFilter):
+    policy: ScoringPolicyDocument  # Candidate policy, compared with the active one
+    sample_size: Optional[int] = Field(default=None, gt=0)  # Random sample of the matched loans
+    bin_width: float = Field(default=10, gt=0, le=50)  # Score histogram bin width
+    max_flips: int = Field(default=100, ge=0, le=10000)  # Flipped loans listed in the result
+
+class PolicyOutcome(BaseModel):
+    policy_version: str
+    threshold: float
+    passed: int  # Scored at or above the threshold, so sent to review
+    rejected: int  # Scored below the threshold, so rejected automatically
+    mean_score: Optional[float] = None
+    histogram: List[int]  # Loans per bin of SimulationResult.bin_edges
+
+class DecisionFlip(BaseModel):
+    loan_id: str
+    email: Optional[str] = None
+    status: Optional[LoanStatus] = None
+    stored_score: Optional[float] = None
+    current_score: float
+    candidate_score: float
+
+class SimulationResult(BaseModel):
+    loans: int
+    sampled: bool
+    bin_edges: List[float]
+    current: PolicyOutcome
+    candidate: PolicyOutcome
+    flips_to_rejected: int  # Passed under the active policy, rejected under the candidate
+    flips_to_passed: int
+    flips: List[DecisionFlip]  # At most max_flips of the flipped loans
+    elapsed_seconds: float
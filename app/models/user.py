@@ -23,6 +23,10 @@ class UserInDB(UserBase):
     is_active: bool = True
     is_admin: bool = False
 
+class UserAdminUpdate(BaseModel):
+    is_active: Optional[bool] = None
+    is_admin: Optional[bool] = None
+
 class User(UserBase):
     created_at: datetime
     is_active: bool = True
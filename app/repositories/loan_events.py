@@ -0,0 +1,77 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from ..dependencies.indexes import declare_index, declare_query
+from ..utils.pagination import keyset_filter_after
+
+# Append-only log of every status change of every loan, including the
+# automatic one at creation. Loans only embed their latest
+# STATUS_HISTORY_LIMIT changes; this collection has all of them.
+declare_index("loan_events", [("loan_id", 1), ("changed_at", 1), ("_id", 1)])
+declare_query("loan_events", {"loan_id": ObjectId()}, sort=[("changed_at", 1), ("_id", 1)])
+declare_query("loan_events", {"loan_id": {"$in": [ObjectId()]}}, sort=[("loan_id", 1), ("changed_at", 1), ("_id", 1)])
+
+# Fields that identify one status change, so archiving it twice is harmless
+EVENT_KEY = ("loan_id", "changed_at", "status", "changed_by")
+declare_query("loan_events", {"loan_id": ObjectId(), "changed_at": datetime(2024, 1, 1), "status": "pending", "changed_by": "system"})
+
+def loan_event(loan: dict, change: dict, previous_status=None) -> dict:
+    """The loan_events document for one status change (a StatusChange dump) of a loan"""
+    return {
+        "loan_id": loan["_id"],
+        "user_email": loan.get("user_email", loan.get("email")),
+        "amount": loan.get("amount", 0),
+        "previous_status": previous_status,
+        "status": change["status"],
+        "changed_at": change["changed_at"],
+        "changed_by": change["changed_by"],
+        "notes": change.get("notes")
+    }
+
+async def insert_loan_events(db, events: List[dict]):
+    if events:
+        await db.loan_events.insert_many(events, ordered=False)
+
+async def archive_loan_events(db, events: List[dict]) -> int:
+    """
+    Insert the events that are not stored yet, matching on EVENT_KEY
+    Returns the number of events inserted
+    """
+    if not events:
+        return 0
+    result = await db.loan_events.bulk_write(
+        [
+            UpdateOne(
+                {field: event[field] for field in EVENT_KEY},
+                {"$setOnInsert": event},
+                upsert=True
+            )
+            for event in events
+        ],
+        ordered=False
+    )
+    return result.upserted_count
+
+async def find_loan_events(db, loan_id: ObjectId, limit: int, after: Optional[tuple] = None) -> List[dict]:
+    """
+    Status changes of a loan, oldest first
+    after is the (changed_at, _id) of the last event of the previous page
+    """
+    query = {"loan_id": loan_id}
+    if after is not None:
+        query = {"$and": [query, keyset_filter_after("changed_at", *after)]}
+    cursor = db.loan_events.find(query, {"loan_id": 0, "user_email": 0, "amount": 0}) \
+        .sort([("changed_at", 1), ("_id", 1)]) \
+        .limit(limit)
+    return await cursor.to_list(length=limit)
+
+async def find_events_for_loans(db, loan_ids: List[ObjectId]) -> Dict[ObjectId, List[dict]]:
+    """Every status change of each of these loans, oldest first, in one query"""
+    events = defaultdict(list)
+    cursor = db.loan_events.find({"loan_id": {"$in": loan_ids}}, {"user_email": 0, "amount": 0}) \
+        .sort([("loan_id", 1), ("changed_at", 1), ("_id", 1)])
+    async for event in cursor:
+        events[event["loan_id"]].append(event)
+    return events
@@ -0,0 +1,248 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from ..config import settings
+from ..dependencies.indexes import declare_query
+from ..models.loan import LoanFilter, LoanStatus, ScoringState, StatusChange
+
+# Fields of a queued application that go away once it is scored
+SCORING_FIELDS = {"scoring_state": "", "scoring_attempts": "", "scoring_due_at": ""}
+
+# Query shapes of the bulk reads and writes below; the indexes are declared by
+# the routers and the scoring queue
+SAMPLE_IDS = {"$in": [ObjectId()]}
+declare_query("loans", {"_id": SAMPLE_IDS})
+declare_query("loans", {"_id": SAMPLE_IDS, "review_batch_id": ObjectId()})
+declare_query("loans", {"_id": ObjectId(), "status": "pending"})
+declare_query("loans", {"_id": SAMPLE_IDS, "scoring_state": ScoringState.QUEUED.value})
+declare_query("loans", {"_id": ObjectId(), "scoring_state": ScoringState.QUEUED.value})
+declare_query("loans", {"_id": ObjectId(), "scoring_state": ScoringState.QUEUED.value, "status": "pending"})
+
+def _loan_filter(loan_id: str, owner_email: Optional[str] = None) -> dict:
+    query = {"_id": ObjectId(loan_id)}
+    if owner_email is not None:
+        query["user_email"] = owner_email
+    return query
+
+def build_loan_query(loan_filter: LoanFilter) -> dict:
+    query = {}
+    if loan_filter.status:
+        query["status"] = loan_filter.status
+    if loan_filter.created_from or loan_filter.created_to:
+        query["created_at"] = {}
+        if loan_filter.created_from:
+            query["created_at"]["$gte"] = loan_filter.created_from
+        if loan_filter.created_to:
+            query["created_at"]["$lt"] = loan_filter.created_to
+    return query
+
+# One LoanFilter of each shape build_loan_query produces, for declare_query
+SAMPLE_LOAN_FILTERS = [
+    LoanFilter(),
+    LoanFilter(status=LoanStatus.PENDING),
+    LoanFilter(created_from=datetime(2024, 1, 1), created_to=datetime(2024, 2, 1)),
+    LoanFilter(status=LoanStatus.PENDING, created_from=datetime(2024, 1, 1), created_to=datetime(2024, 2, 1))
+]
+
+async def find_loan(db, loan_id: str, owner_email: Optional[str] = None, projection: dict = None) -> Optional[dict]:
+    return await db.loans.find_one(_loan_filter(loan_id, owner_email), projection)
+
+async def find_loans(db, loan_ids: List[ObjectId], projection: dict = None) -> List[dict]:
+    return await db.loans.find({"_id": {"$in": loan_ids}}, projection).to_list(length=None)
+
+async def insert_loan(db, loan: dict) -> dict:
+    """Insert a loan and return the stored document without reading it back"""
+    await db.loans.insert_one(loan)  # Sets loan["_id"]
+    return loan
+
+async def insert_loans(db, loans: List[dict]) -> Dict[int, str]:
+    """
+    Insert a batch of loans without stopping at the first failure
+    Returns {position in loans: error message} for the loans that were not inserted
+    """
+    if not loans:
+        return {}
+    try:
+        await db.loans.insert_many(loans, ordered=False)  # Sets every loan["_id"]
+    except BulkWriteError as e:
+        return {error["index"]: error.get("errmsg", "Insert failed") for error in e.details["writeErrors"]}
+    return {}
+
+async def transition_status(
+    db,
+    loan_id: str,
+    status_change: StatusChange,
+    owner_email: Optional[str] = None
+) -> Optional[Tuple[Optional[str], dict]]:
+    """
+    Set a loan's status and record the change in one round trip
+    Returns (previous status, updated loan), or None if no loan matched
+    """
+    change = status_change.model_dump()
+    loan = await db.loans.find_one_and_update(
+        _loan_filter(loan_id, owner_email),
+        {
+            "$set": {
+                "status": status_change.status,
+                "updated_at": status_change.changed_at
+            },
+            "$push": {
+                "status_history": {"$each": [change], "$slice": -settings.STATUS_HISTORY_LIMIT}
+            }
+        },
+        return_document=ReturnDocument.BEFORE
+    )
+    if loan is None:
+        return None
+
+    # Apply the update to the previous version instead of reading the loan again
+    previous_status = loan.get("status")
+    loan["status"] = status_change.status
+    loan["updated_at"] = status_change.changed_at
+    loan["status_history"] = (loan.get("status_history", []) + [change])[-settings.STATUS_HISTORY_LIMIT:]
+    return previous_status, loan
+
+async def apply_status_changes(
+    db,
+    changes: List[Tuple[ObjectId, str, StatusChange]],
+    batch_id: Optional[ObjectId] = None
+) -> int:
+    """
+    Move many loans to new statuses with one bulk_write
+    Each (loan id, expected status, change) only applies while the loan still
+    has the expected status, and marks the loan with batch_id when given, so
+    find_loans_changed_by_batch can tell which did. Returns the number of loans changed.
+    """
+    if not changes:
+        return 0
+    marker = {"review_batch_id": batch_id} if batch_id is not None else {}
+    result = await db.loans.bulk_write(
+        [
+            UpdateOne(
+                {"_id": loan_id, "status": expected_status},
+                {
+                    "$set": {
+                        "status": status_change.status,
+                        "updated_at": status_change.changed_at,
+                        **marker
+                    },
+                    "$push": {
+                        "status_history": {
+                            "$each": [status_change.model_dump()],
+                            "$slice": -settings.STATUS_HISTORY_LIMIT
+                        }
+                    }
+                }
+            )
+            for loan_id, expected_status, status_change in changes
+        ],
+        ordered=False
+    )
+    return result.modified_count
+
+async def find_loans_changed_by_batch(db, loan_ids: List[ObjectId], batch_id: ObjectId) -> List[ObjectId]:
+    """The ids among loan_ids whose last batch status change was the one marked batch_id"""
+    cursor = db.loans.find({"_id": {"$in": loan_ids}, "review_batch_id": batch_id}, {"_id": 1})
+    return [loan["_id"] async for loan in cursor]
+
+async def set_credit_score(db, loan_id: str, credit_score: float, policy_version: str) -> Optional[dict]:
+    """Store a loan's credit score and return the updated loan, or None if there is no such loan"""
+    return await db.loans.find_one_and_update(
+        _loan_filter(loan_id),
+        {
+            "$set": {
+                "credit_score": credit_score,
+                "score_policy_version": policy_version,
+                "updated_at": datetime.utcnow()
+            },
+            "$unset": SCORING_FIELDS
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+async def find_queued_loans(db, loan_ids: List[ObjectId], projection: dict = None) -> List[dict]:
+    """The loans among loan_ids still waiting for a credit score"""
+    return await db.loans.find(
+        {"_id": {"$in": loan_ids}, "scoring_state": ScoringState.QUEUED},
+        projection
+    ).to_list(length=None)
+
+async def apply_queued_scores(
+    db,
+    scores: List[Tuple[dict, float, str, Optional[StatusChange]]],
+    scored_at: datetime
+) -> int:
+    """
+    Store the scores of queued loans with one bulk_write
+    Each (loan, credit score, policy version, change) only applies while
+    the loan is still queued and has the status it was read with; the
+    change, if any, is the automatic status that follows from the score.
+    Returns the number of loans updated.
+    """
+    if not scores:
+        return 0
+    operations = []
+    for loan, credit_score, policy_version, status_change in scores:
+        update = {
+            "$set": {
+                "credit_score": credit_score,
+                "score_policy_version": policy_version,
+                "updated_at": scored_at
+            },
+            "$unset": SCORING_FIELDS
+        }
+        if status_change is not None:
+            update["$set"]["status"] = status_change.status
+            update["$push"] = {
+                "status_history": {
+                    "$each": [status_change.model_dump()],
+                    "$slice": -settings.STATUS_HISTORY_LIMIT
+                }
+            }
+        operations.append(UpdateOne(
+            {"_id": loan["_id"], "scoring_state": ScoringState.QUEUED, "status": loan["status"]},
+            update
+        ))
+    result = await db.loans.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+async def claim_due_queued_loans(db, now: datetime, limit: int) -> List[ObjectId]:
+    """
+    Queued loans whose lease ran out, oldest first, leased again for
+    SCORING_LEASE_SECONDS so that the next sweep leaves them alone
+    """
+    loans = await db.loans.find(
+        {"scoring_state": ScoringState.QUEUED, "scoring_due_at": {"$lte": now}},
+        {"_id": 1}
+    ).sort("scoring_due_at", 1).limit(limit).to_list(length=None)
+    loan_ids = [loan["_id"] for loan in loans]
+    if loan_ids:
+        await db.loans.update_many(
+            {"_id": {"$in": loan_ids}, "scoring_state": ScoringState.QUEUED},
+            {"$set": {"scoring_due_at": now + timedelta(seconds=settings.SCORING_LEASE_SECONDS)}}
+        )
+    return loan_ids
+
+async def record_scoring_failures(db, loan_ids: List[ObjectId], now: datetime) -> Tuple[int, int]:
+    """
+    Count a failed scoring attempt against each queued loan: it is due again
+    after SCORING_RETRY_SECONDS, doubled per attempt, until SCORING_MAX_ATTEMPTS
+    when it is marked as failed. Returns (retried, failed).
+    """
+    loans = await find_queued_loans(db, loan_ids, {"scoring_attempts": 1})
+    operations = []
+    failed = 0
+    for loan in loans:
+        attempts = loan.get("scoring_attempts", 0) + 1
+        if attempts >= settings.SCORING_MAX_ATTEMPTS:
+            failed += 1
+            update = {"scoring_state": ScoringState.FAILED, "scoring_attempts": attempts, "updated_at": now}
+        else:
+            delay = settings.SCORING_RETRY_SECONDS * 2 ** (attempts - 1)
+            update = {"scoring_attempts": attempts, "scoring_due_at": now + timedelta(seconds=delay)}
+        operations.append(UpdateOne({"_id": loan["_id"], "scoring_state": ScoringState.QUEUED}, {"$set": update}))
+    if operations:
+        await db.loans.bulk_write(operations, ordered=False)
+    return len(operations) - failed, failed
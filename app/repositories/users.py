@@ -0,0 +1,39 @@
+from typing import Iterable, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from ..dependencies.indexes import declare_query
+from ..models.user import UserInDB
+
+# Query shapes beyond the email lookup declared by the auth router, which indexes users.email
+declare_query("users", {"email": {"$in": ["user@example.com"]}})
+declare_query("users", {"_id": ObjectId(), "hashed_password": "hash"})
+
+async def find_user(db, email: str, projection: dict = None) -> Optional[dict]:
+    return await db.users.find_one({"email": email}, projection)
+
+async def find_users(db, emails: Iterable[str], projection: dict = None) -> List[dict]:
+    return await db.users.find({"email": {"$in": list(emails)}}, projection).to_list(length=None)
+
+async def insert_user(db, user: UserInDB) -> dict:
+    """
+    Insert a user and return the stored document without reading it back
+    Raises pymongo.errors.DuplicateKeyError when the email is taken
+    """
+    document = user.model_dump()
+    await db.users.insert_one(document)  # Sets document["_id"]
+    return document
+
+async def update_user_fields(db, email: str, changes: dict) -> Optional[dict]:
+    """Apply changes to a user and return the updated document, or None if there is no such user"""
+    return await db.users.find_one_and_update(
+        {"email": email},
+        {"$set": changes},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def update_password_hash(db, user: dict, new_hash: str):
+    # Only replace the hash that was verified, in case the password changed meanwhile
+    await db.users.update_one(
+        {"_id": user["_id"], "hashed_password": user["hashed_password"]},
+        {"$set": {"hashed_password": new_hash}}
+    )
@@ -1,32 +1,135 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import List
 from datetime import datetime
 from bson import ObjectId
-from ..models.loan import Loan, LoanStatus, LoanStatusUpdate, StatusChange
+from ..models.loan import BatchReviewRequest, BatchReviewResponse, ExportFormat, Loan, LoanFilter, LoanPage, LoanSortField, LoanStatus, LoanStatusUpdate, StatusChange
+from ..models.rescore import RescoreFilter, RescoreJob
+from ..models.simulation import SimulationRequest, SimulationResult
+from ..models.user import User, UserAdminUpdate
 from ..dependencies.database import get_database
-from ..utils.auth import get_current_admin
-from ..utils.credit_scoring import calculate_credit_score, calculate_amount_score, calculate_duration_score, calculate_purpose_score, calculate_history_score
-from fastapi_cache.decorator import cache
+from ..dependencies.indexes import declare_index, declare_query
+from ..utils.auth import get_current_admin, invalidate_user, auth_cache_stats
+from ..utils.credit_scoring import score_application, calculate_amount_score, calculate_duration_score, calculate_purpose_score, calculate_history_score_from_counts
+from ..repositories.loans import find_loan, transition_status, set_credit_score
+from ..repositories.users import update_user_fields
+from ..utils.borrower_history import get_previous_history
+from ..utils.loan_hooks import after_status_change, after_loan_scored
+from ..utils.loan_stats import read_loan_stats, read_daily_stats, reconcile_loan_stats
+from ..utils.pagination import encode_cursor, decode_cursor, keyset_filter
+from ..utils.rescoring import create_rescore_job, claim_rescore_job, run_rescore_job
+from ..utils.cache import versioned_cache, invalidate_loans, cache_stats, LOANS_NAMESPACE
+from ..utils.serialization import FastJSONResponse, ResponseCoder
+from ..utils.export import stream_loans, export_media_type, export_filename
+from ..utils.review import review_loans_batch
+from ..utils.events import event_stream, publish, RESYNC
+from ..utils.scoring_policy import current_policy, reload_policy
+from ..utils.simulation import simulate_policy
+from ..utils.profiling import profile_store
+from ..config import settings
 
 router = APIRouter(
     prefix="/admin",
     tags=["admin"]
 )
 
-@router.get("/loans", response_model=List[Loan])
-@cache(expire=60)  # Cache for 60 seconds
+# Indexes and query shapes used by this router
+declare_index("loans", [("created_at", -1), ("_id", -1)])
+declare_index("loans", [("status", 1), ("created_at", -1), ("_id", -1)])
+declare_index("loans", [("status", 1), ("_id", 1)])
+declare_index("loans", [("amount", -1), ("_id", -1)])
+declare_index("loans", [("credit_score", -1), ("_id", -1)])
+# GET /admin/loans: every sort, with and without a status filter, first page and after a cursor
+for sort_field in LoanSortField:
+    for listing_query in ({}, {"status": LoanStatus.PENDING.value}):
+        sort = [(sort_field.value, -1), ("_id", -1)]
+        declare_query("loans", listing_query, sort=sort)
+        declare_query("loans", {"$and": [listing_query, keyset_filter(sort_field.value, 1, ObjectId())]}, sort=sort)
+declare_query("loans", {"_id": ObjectId()})
+
+@router.get("/events")
+async def loan_events(current_admin: dict = Depends(get_current_admin)):
+    """Server-sent events for every loan change, with stats deltas"""
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/loans", response_model=LoanPage)
+@versioned_cache(
+    expire=settings.CACHE_TTL_SECONDS,
+    namespaces=lambda kwargs: [LOANS_NAMESPACE],
+    coder=ResponseCoder
+)
 async def get_all_loans(
     status: LoanStatus = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str = None,
+    sort_by: LoanSortField = LoanSortField.CREATED_AT,
+    include_history: bool = False,
     current_admin: dict = Depends(get_current_admin),
     db = Depends(get_database)
 ):
+    """
+    List loans newest (or highest) first, one page at a time
+    Pass the returned next_cursor to get the following page
+    """
     query = {}
     if status:
         query["status"] = status
-        
-    cursor = db.loans.find(query)
-    loans = await cursor.to_list(length=None)
-    return [Loan.from_mongo(loan) for loan in loans]
+    if cursor:
+        try:
+            sort_value, last_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid cursor"
+            )
+        query = {"$and": [query, keyset_filter(sort_by.value, sort_value, last_id)]}
+
+    projection = None if include_history else {"status_history": 0}
+    loans = await db.loans.find(query, projection) \
+        .sort([(sort_by.value, -1), ("_id", -1)]) \
+        .limit(limit + 1) \
+        .to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(loans) > limit:
+        loans = loans[:limit]
+        last = loans[-1]
+        next_cursor = encode_cursor(last.get(sort_by.value), last["_id"])
+
+    # Documents come straight from our collection, so skip model validation
+    return FastJSONResponse({
+        "items": [Loan.dump_mongo(loan) for loan in loans],
+        "next_cursor": next_cursor
+    })
+
+@router.get("/loans/export")
+async def export_loans(
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    status: LoanStatus = None,
+    created_from: datetime = None,
+    created_to: datetime = None,
+    flatten_history: bool = False,
+    gzip: bool = False,
+    current_admin: dict = Depends(get_current_admin),
+    db = Depends(get_database)
+):
+    """
+    Stream every matching loan, oldest first, as NDJSON or CSV
+    The response is written batch by batch from a Mongo cursor; with
+    flatten_history there is one record per status change in loan_events
+    """
+    loan_filter = LoanFilter(status=status, created_from=created_from, created_to=created_to)
+    return StreamingResponse(
+        stream_loans(db, loan_filter, export_format, flatten_history=flatten_history, compress=gzip),
+        media_type=export_media_type(export_format, gzip),
+        headers={
+            "Content-Disposition": f'attachment; filename="{export_filename(export_format, gzip)}"'
+        }
+    )
 
 @router.patch("/loans/{loan_id}/review", response_model=Loan)
 async def review_loan(
@@ -36,13 +139,6 @@ async def review_loan(
     db = Depends(get_database)
 ):
     try:
-        loan = await db.loans.find_one({"_id": ObjectId(loan_id)})
-        if not loan:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Loan not found"
-            )
-        
         status_change = StatusChange(
             status=status_update.status,
             changed_at=datetime.utcnow(),
@@ -50,26 +146,16 @@ async def review_loan(
             notes=status_update.notes
         )
         
-        result = await db.loans.update_one(
-            {"_id": ObjectId(loan_id)},
-            {
-                "$set": {
-                    "status": status_update.status,
-                    "updated_at": datetime.utcnow()
-                },
-                "$push": {
-                    "status_history": status_change.model_dump()
-                }
-            }
-        )
-        
-        if result.modified_count == 0:
+        # Update the loan, reading the previous status in the same operation
+        result = await transition_status(db, loan_id, status_change)
+        if result is None:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Loan review failed"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Loan not found"
             )
         
-        updated_loan = await db.loans.find_one({"_id": ObjectId(loan_id)})
+        previous_status, updated_loan = result
+        await after_status_change(db, updated_loan, previous_status, status_change)
         return Loan.from_mongo(updated_loan)
         
     except Exception as e:
@@ -78,13 +164,27 @@ async def review_loan(
             detail=f"Error processing request: {str(e)}"
         )
 
+@router.post("/loans/batch-review", response_model=BatchReviewResponse)
+async def batch_review_loans(
+    batch: BatchReviewRequest,
+    current_admin: dict = Depends(get_current_admin),
+    db = Depends(get_database)
+):
+    """
+    Review up to 500 loans in one request
+    Only pending and in-review loans can be reviewed; each item gets its own outcome
+    """
+    results = await review_loans_batch(db, batch.items, current_admin["email"])
+    updated = sum(1 for result in results if result["ok"])
+    return BatchReviewResponse(updated=updated, failed=len(results) - updated, results=results)
+
 @router.get("/loans/{loan_id}", response_model=Loan)
 async def get_loan_details(
     loan_id: str,
     current_admin: dict = Depends(get_current_admin),
     db = Depends(get_database)
 ):
-    loan = await db.loans.find_one({"_id": ObjectId(loan_id)})
+    loan = await find_loan(db, loan_id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -93,26 +193,32 @@ async def get_loan_details(
     return Loan.from_mongo(loan)
 
 @router.get("/stats")
+@versioned_cache(expire=settings.CACHE_TTL_SECONDS, namespaces=lambda kwargs: [LOANS_NAMESPACE])
 async def get_loan_stats(
     current_admin: dict = Depends(get_current_admin),
     db = Depends(get_database)
 ):
-    pipeline = [
-        {
-            "$group": {
-                "_id": "$status",
-                "count": {"$sum": 1},
-                "total_amount": {"$sum": "$amount"}
-            }
-        }
-    ]
-    
-    stats = await db.loans.aggregate(pipeline).to_list(length=None)
-    return {
-        "loan_stats": stats,
-        "total_loans": sum(stat["count"] for stat in stats),
-        "total_amount": sum(stat["total_amount"] for stat in stats)
-    }
+    return await read_loan_stats(db)
+
+@router.get("/stats/daily")
+async def get_daily_loan_stats(
+    days: int = Query(30, ge=1, le=366),
+    current_admin: dict = Depends(get_current_admin),
+    db = Depends(get_database)
+):
+    return await read_daily_stats(db, days)
+
+@router.post("/stats/reconcile")
+async def reconcile_stats(
+    fix: bool = False,
+    current_admin: dict = Depends(get_current_admin),
+    db = Depends(get_database)
+):
+    report = await reconcile_loan_stats(db, fix=fix)
+    if fix:
+        await invalidate_loans()
+        await publish(RESYNC)
+    return report
 
 @router.post("/loans/{loan_id}/calculate-score", response_model=Loan)
 async def calculate_loan_score(
@@ -121,7 +227,7 @@ async def calculate_loan_score(
     db = Depends(get_database)
 ):
     # Get the current loan
-    loan = await db.loans.find_one({"_id": ObjectId(loan_id)})
+    loan = await find_loan(db, loan_id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -129,39 +235,21 @@ async def calculate_loan_score(
         )
     
     current_loan = Loan.from_mongo(loan)
-    previous_loans = []
-    
-    # Get previous loans only if email exists
-    if "email" in loan:
-        previous_loans_cursor = db.loans.find({
-            "email": loan["email"],
-            "_id": {"$ne": ObjectId(loan_id)}
-        })
-        previous_loans = await previous_loans_cursor.to_list(length=None)
-        previous_loans = [Loan.from_mongo(loan) for loan in previous_loans]
+    previous_count, approved_count = await get_previous_history(db, loan)
     
     # Calculate credit score
-    credit_score = await calculate_credit_score(current_loan, previous_loans)
+    policy = current_policy()
+    credit_score = await score_application(current_loan, previous_count, approved_count, policy)
     
-    # Update loan with credit score
-    result = await db.loans.update_one(
-        {"_id": ObjectId(loan_id)},
-        {
-            "$set": {
-                "credit_score": credit_score,
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
-    
-    if result.modified_count == 0:
+    # Update loan with credit score and get the updated loan back
+    updated_loan = await set_credit_score(db, loan_id, credit_score, policy.version)
+    if updated_loan is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Failed to update credit score"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Loan not found"
         )
+    await after_loan_scored(db, updated_loan)
     
-    # Get updated loan
-    updated_loan = await db.loans.find_one({"_id": ObjectId(loan_id)})
     return Loan.from_mongo(updated_loan)
 
 @router.get("/loans/{loan_id}/score-details")
@@ -170,7 +258,7 @@ async def get_loan_score_details(
     current_admin: dict = Depends(get_current_admin),
     db = Depends(get_database)
 ):
-    loan = await db.loans.find_one({"_id": ObjectId(loan_id)})
+    loan = await find_loan(db, loan_id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -178,31 +266,167 @@ async def get_loan_score_details(
         )
     
     current_loan = Loan.from_mongo(loan)
+    previous_count, approved_count = await get_previous_history(db, loan)
     
-    # Check if email exists in the loan document
-    if "email" not in loan:
-        return {
-            "amount_score": calculate_amount_score(current_loan.amount),
-            "duration_score": calculate_duration_score(current_loan.duration_months),
-            "purpose_score": calculate_purpose_score(current_loan.purpose),
-            "history_score": 0,  # No history score without email
-            "total_score": current_loan.credit_score,
-            "previous_loans_count": 0
-        }
-    
-    # Get previous loans only if email exists
-    previous_loans_cursor = db.loans.find({
-        "email": loan["email"],
-        "_id": {"$ne": ObjectId(loan_id)}
-    })
-    previous_loans = await previous_loans_cursor.to_list(length=None)
-    previous_loans = [Loan.from_mongo(loan) for loan in previous_loans]
-    
+    # Components come from the active policy; total_score from the one that scored the loan
+    policy = current_policy()
     return {
-        "amount_score": calculate_amount_score(current_loan.amount),
-        "duration_score": calculate_duration_score(current_loan.duration_months),
-        "purpose_score": calculate_purpose_score(current_loan.purpose),
-        "history_score": calculate_history_score(previous_loans),
+        "amount_score": calculate_amount_score(current_loan.amount, policy),
+        "duration_score": calculate_duration_score(current_loan.duration_months, policy),
+        "purpose_score": calculate_purpose_score(current_loan.purpose, policy),
+        "history_score": calculate_history_score_from_counts(previous_count, approved_count, policy),
         "total_score": current_loan.credit_score,
-        "previous_loans_count": len(previous_loans)
+        "policy_version": policy.version,
+        "score_policy_version": current_loan.score_policy_version,
+        "previous_loans_count": previous_count
     }
+
+@router.post("/loans/rescore", response_model=RescoreJob, status_code=status.HTTP_202_ACCEPTED)
+async def rescore_loans(
+    loan_filter: RescoreFilter,
+    background_tasks: BackgroundTasks,
+    current_admin: dict = Depends(get_current_admin),
+    db = Depends(get_database)
+):
+    job = await create_rescore_job(db, loan_filter, current_admin["email"])
+    background_tasks.add_task(run_rescore_job, db, job["_id"])
+    return RescoreJob.from_mongo(job)
+
+@router.get("/rescore-jobs/{job_id}", response_model=RescoreJob)
+async def get_rescore_job(
+    job_id: str,
+    current_admin: dict = Depends(get_current_admin),
+    db = Depends(get_database)
+):
+    job = await db.rescore_jobs.find_one({"_id": ObjectId(job_id)})
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Rescore job not found"
+        )
+    return RescoreJob.from_mongo(job)
+
+@router.post("/rescore-jobs/{job_id}/resume", response_model=RescoreJob, status_code=status.HTTP_202_ACCEPTED)
+async def resume_rescore_job(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    current_admin: dict = Depends(get_current_admin),
+    db = Depends(get_database)
+):
+    job = await claim_rescore_job(db, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Rescore job not found, already completed or still running"
+        )
+    background_tasks.add_task(run_rescore_job, db, job["_id"])
+    return RescoreJob.from_mongo(job)
+
+@router.get("/cache-stats")
+async def get_cache_stats(
+    current_admin: dict = Depends(get_current_admin)
+):
+    stats = await cache_stats()
+    if stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Cache is not initialised"
+        )
+    return stats
+
+@router.get("/auth-cache-stats")
+async def get_auth_cache_stats(
+    current_admin: dict = Depends(get_current_admin)
+):
+    return await auth_cache_stats()
+
+@router.patch("/users/{email}", response_model=User)
+async def update_user(
+    email: str,
+    user_update: UserAdminUpdate,
+    current_admin: dict = Depends(get_current_admin),
+    db = Depends(get_database)
+):
+    """Activate, deactivate, promote or demote a user"""
+    changes = user_update.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No changes requested"
+        )
+    user = await update_user_fields(db, email, changes)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    await invalidate_user(email)
+    return User.from_mongo(user)
+
+@router.get("/scoring-policy")
+async def get_scoring_policy(
+    current_admin: dict = Depends(get_current_admin)
+):
+    """The scoring policy this worker is scoring with"""
+    return current_policy().document
+
+@router.post("/scoring-policy/reload")
+async def reload_scoring_policy(
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Reload the scoring policy file on this worker; the others pick the
+    change up within SCORING_POLICY_RELOAD_SECONDS
+    """
+    try:
+        policy = await reload_policy()
+    except (OSError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid scoring policy, keeping version {current_policy().version}: {e}"
+        )
+    return policy.document
+
+@router.post("/scoring-policy/simulate", response_model=SimulationResult)
+async def simulate_scoring_policy(
+    simulation: SimulationRequest,
+    current_admin: dict = Depends(get_current_admin),
+    db = Depends(get_database)
+):
+    """
+    Score the stored loans under a candidate policy and the active one and
+    compare the decisions; nothing is written
+    """
+    return await simulate_policy(db, simulation)
+
+@router.get("/profiles")
+async def list_profiles(
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Summaries of the profiles this worker has kept, newest first"""
+    return {
+        "enabled": settings.PROFILING_ENABLED,
+        "sample_rate": settings.PROFILE_SAMPLE_RATE,
+        "profiles": profile_store.list()
+    }
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    folded: bool = Query(False, description="Every stack as flamegraph folded text"),
+    top: int = Query(50, ge=1, le=1000),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    One profile: time breakdown, Mongo round trips and the hottest stacks,
+    or every stack in flamegraph folded format
+    """
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found; it may have left the buffer or been taken by another worker"
+        )
+    if folded:
+        return PlainTextResponse(profile.folded())
+    return profile.report(top)
@@ -1,58 +1,67 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordRequestForm
+from pymongo.errors import DuplicateKeyError
 from ..models.user import UserCreate, User, UserInDB
-from passlib.context import CryptContext
 from datetime import timedelta
 from ..dependencies.database import get_database
+from ..repositories.users import find_user, insert_user, update_password_hash
+from ..utils.passwords import password_hasher
+from ..dependencies.indexes import declare_index, declare_query
 from ..utils.auth import (
     create_access_token,
     get_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES,
 )
+from ..utils.rate_limit import limit_login
 
 router = APIRouter(
     prefix="/auth",
     tags=["authentication"]
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Indexes and query shapes used by this router
+declare_index("users", [("email", 1)], unique=True)
+declare_query("users", {"email": "user@example.com"})
+
+async def _reject_registered_email(db, email: str):
+    """400 for a taken email, checked before paying for a password hash"""
+    if await find_user(db, email, {"_id": 1}):
+        raise HTTPException(
+            status_code=400,
+            detail="Email already registered"
+        )
 
 @router.post("/register", response_model=User)
 async def register_user(
     user: UserCreate,
     db = Depends(get_database)
 ):
-    # Check if user already exists
-    existing_user = await db.users.find_one({"email": user.email})
-    if existing_user:
-        raise HTTPException(
-            status_code=400,
-            detail="Email already registered"
-        )
-    
+    await _reject_registered_email(db, user.email)
+
     # Create user document
     user_in_db = UserInDB(
         email=user.email,
         full_name=user.full_name,
-        hashed_password=pwd_context.hash(user.password)
+        hashed_password=await password_hasher.hash(user.password)
     )
     
-    # Insert into database
-    result = await db.users.insert_one(user_in_db.model_dump())
-    
-    # Fetch and return created user
-    created_user = await db.users.find_one({"_id": result.inserted_id})
-    if created_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
+    # Insert into database; the unique email index rejects concurrent registrations
+    try:
+        created_user = await insert_user(db, user_in_db)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=400,
+            detail="Email already registered"
+        )
     
     return User.from_mongo(created_user)
 
-@router.post("/token")
+@router.post("/token", dependencies=[Depends(limit_login)])
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db = Depends(get_database)
 ):
-    user = await db.users.find_one({"email": form_data.username})
+    user = await find_user(db, form_data.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -60,13 +69,18 @@ async def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if not pwd_context.verify(form_data.password, user["hashed_password"]):
+    valid, new_hash = await password_hasher.verify_and_update(form_data.password, user["hashed_password"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Rehash passwords stored with an outdated cost factor
+    if new_hash:
+        await update_password_hash(db, user, new_hash)
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user["email"]}, expires_delta=access_token_expires
@@ -83,21 +97,21 @@ async def create_admin_user(
     db = Depends(get_database)
 ):
     # In production, you should secure this endpoint
-    # Check if user already exists
-    existing_user = await db.users.find_one({"email": user.email})
-    if existing_user:
-        raise HTTPException(
-            status_code=400,
-            detail="Email already registered"
-        )
-    
+    await _reject_registered_email(db, user.email)
+
     # Create admin user
     user_in_db = UserInDB(
         email=user.email,
         full_name=user.full_name,
-        hashed_password=pwd_context.hash(user.password),
+        hashed_password=await password_hasher.hash(user.password),
         is_admin=True
     )
     
-    result = await db.users.insert_one(user_in_db.model_dump())
+    try:
+        await insert_user(db, user_in_db)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=400,
+            detail="Email already registered"
+        )
     return {"message": "Admin user created successfully"}
@@ -0,0 +1,29 @@
+import asyncio
+import os
+from fastapi import APIRouter, Request, status
+from fastapi.responses import JSONResponse
+from ..utils.health import check_mongo, check_redis
+
+router = APIRouter(
+    prefix="/health",
+    tags=["health"]
+)
+
+@router.get("/live")
+async def liveness():
+    """
+    The worker is running and its event loop answers
+    Dependencies are not checked, so an outage does not get every worker restarted
+    """
+    return {"status": "ok", "pid": os.getpid()}
+
+@router.get("/ready")
+async def readiness(request: Request):
+    """Whether this worker can serve traffic: MongoDB and Redis answer through their pools"""
+    mongodb, redis = await asyncio.gather(check_mongo(request.app.mongodb), check_redis(request.app.redis))
+    checks = {"mongodb": mongodb, "redis": redis}
+    ready = all(check["ok"] for check in checks.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "unavailable", "pid": os.getpid(), "checks": checks},
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
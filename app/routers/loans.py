@@ -1,31 +1,55 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Body, Query, status
+from fastapi.responses import StreamingResponse
+from typing import Any, List, Optional
 from datetime import datetime
 from bson import ObjectId
-from ..models.loan import LoanCreate, Loan, LoanStatus, LoanStatusUpdate, StatusChange
+from ..models.loan import BulkApplyResponse, LoanCreate, Loan, LoanStatusUpdate, StatusChange, StatusHistoryPage
 from ..dependencies.database import get_database
+from ..dependencies.indexes import declare_index, declare_query
+from ..repositories.loans import find_loan, insert_loan, transition_status
+from ..repositories.loan_events import find_loan_events
 from ..utils.auth import get_current_user
-from ..utils.credit_scoring import calculate_credit_score
+from ..utils.rate_limit import limit_apply
+from ..utils.credit_scoring import score_application
+from ..utils.pagination import encode_cursor, decode_cursor
+from ..utils.cache import versioned_cache, user_namespace, USERS_NAMESPACE
+from ..utils.serialization import FastJSONResponse, ResponseCoder
+from ..config import settings
+from ..utils.borrower_history import get_borrower_history
+from ..utils.loan_hooks import after_loan_created, after_status_change
+from ..utils.applications import build_loan_document, build_queued_loan_document, apply_loans_bulk
+from ..utils.events import event_stream
+from ..utils.scoring_policy import current_policy
+from ..utils.scoring_queue import check_scoring_capacity, enqueue_for_scoring
 router = APIRouter(
     prefix="/loans",
     tags=["loans"]
 )
 
-@router.post("/apply", response_model=Loan)
+# Indexes and query shapes used by this router
+declare_index("loans", [("user_email", 1), ("created_at", -1)])
+declare_query("loans", {"user_email": "borrower@example.com"}, sort=[("created_at", -1)])
+declare_query("loans", {"_id": ObjectId(), "user_email": "borrower@example.com"})
+
+@router.post("/apply", response_model=Loan, dependencies=[Depends(limit_apply)])
 async def apply_for_loan(
     loan: LoanCreate,
     current_user: dict = Depends(get_current_user),
     db = Depends(get_database)
 ):
-    loan_dict = loan.model_dump()
     current_time = datetime.utcnow()
 
-    # Get previous loans for credit score calculation
-    previous_loans_cursor = db.loans.find({
-        "user_email": current_user["email"]
-    })
-    previous_loans = await previous_loans_cursor.to_list(length=None)
-    previous_loans = [Loan.from_mongo(l) for l in previous_loans]
+    if settings.SCORING_MODE == "queued":
+        # Store the application now and let the scoring worker decide its status
+        await check_scoring_capacity()
+        loan_dict = build_queued_loan_document(loan, current_user["email"], current_user["email"], current_time)
+        created_loan = await insert_loan(db, loan_dict)
+        await after_loan_created(db, created_loan)
+        await enqueue_for_scoring(created_loan["_id"])
+        return Loan.from_mongo(created_loan)
+
+    # Get borrower history for credit score calculation
+    previous_count, approved_count = await get_borrower_history(db, current_user["email"])
 
     # Calculate credit score immediately
     current_loan = Loan(
@@ -37,34 +61,36 @@ async def apply_for_loan(
         created_at=current_time
     )
     
-    credit_score = await calculate_credit_score(current_loan, previous_loans)
-    
-    # Determine initial status based on credit score
-    initial_status = (
-        LoanStatus.REJECTED if credit_score < 60 
-        else LoanStatus.PENDING
-    )
-    
-    initial_status_change = StatusChange(
-        status=initial_status,
-        changed_at=current_time,
-        changed_by=current_user["email"],
-        notes=f"Automatic {'rejection' if initial_status == LoanStatus.REJECTED else 'submission'} based on credit score: {credit_score}"
-    )
+    policy = current_policy()
+    credit_score = await score_application(current_loan, previous_count, approved_count, policy)
     
-    loan_dict.update({
-        "user_email": current_user["email"],
-        "status": initial_status,
-        "created_at": current_time,
-        "credit_score": credit_score,
-        "status_history": [initial_status_change.model_dump()]
-    })
+    loan_dict = build_loan_document(loan, current_user["email"], credit_score, current_user["email"], current_time, policy)
     
-    result = await db.loans.insert_one(loan_dict)
-    created_loan = await db.loans.find_one({"_id": result.inserted_id})
+    created_loan = await insert_loan(db, loan_dict)
+    await after_loan_created(db, created_loan)
     
     return Loan.from_mongo(created_loan)
 
+@router.post("/bulk-apply", response_model=BulkApplyResponse)
+async def bulk_apply_for_loans(
+    records: List[Any] = Body(...),
+    current_user: dict = Depends(get_current_user),
+    db = Depends(get_database)
+):
+    """
+    Apply for many loans at once; admins may apply for any active borrower
+    Records are handled in order and each gets its own result, so invalid
+    ones are reported without failing the rest
+    """
+    if len(records) > settings.BULK_APPLY_MAX_RECORDS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.BULK_APPLY_MAX_RECORDS} records per request"
+        )
+    results = await apply_loans_bulk(db, records, current_user)
+    created = sum(1 for result in results if result["ok"])
+    return BulkApplyResponse(created=created, failed=len(results) - created, results=results)
+
 @router.patch("/{loan_id}/status", response_model=Loan)
 async def update_loan_status(
     loan_id: str,
@@ -72,14 +98,6 @@ async def update_loan_status(
     current_user: dict = Depends(get_current_user),
     db = Depends(get_database)
 ):
-    # First check if the loan exists
-    loan = await db.loans.find_one({"_id": ObjectId(loan_id)})
-    if not loan:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Loan not found"
-        )
-    
     # Create status change record
     status_change = StatusChange(
         status=status_update.status,
@@ -88,39 +106,41 @@ async def update_loan_status(
         notes=status_update.notes
     )
     
-    # Update the loan
-    result = await db.loans.update_one(
-        {"_id": ObjectId(loan_id)},
-        {
-            "$set": {
-                "status": status_update.status,
-                "updated_at": datetime.utcnow()
-            },
-            "$push": {
-                "status_history": status_change.model_dump()
-            }
-        }
-    )
-    
-    if result.modified_count == 0:
+    # Update the loan, reading the previous status in the same operation
+    result = await transition_status(db, loan_id, status_change)
+    if result is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Loan status update failed"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Loan not found"
         )
     
-    updated_loan = await db.loans.find_one({"_id": ObjectId(loan_id)})
+    previous_status, updated_loan = result
+    await after_status_change(db, updated_loan, previous_status, status_change)
     return Loan.from_mongo(updated_loan)
 
-@router.get("/status-history/{loan_id}", response_model=List[StatusChange])
+@router.get("/status-history/{loan_id}", response_model=StatusHistoryPage)
 async def get_loan_status_history(
     loan_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_user),
     db = Depends(get_database)
 ):
-    loan = await db.loans.find_one({
-        "_id": ObjectId(loan_id),
-        "user_email": current_user["email"]
-    })
+    """
+    Every status change of the loan, oldest first, one page at a time
+    Pass the returned next_cursor to get the following page
+    """
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid cursor"
+            )
+
+    loan = await find_loan(db, loan_id, current_user["email"], {"_id": 1})
     
     if not loan:
         raise HTTPException(
@@ -128,16 +148,36 @@ async def get_loan_status_history(
             detail="Loan not found"
         )
     
-    return loan.get("status_history", [])
+    events = await find_loan_events(db, loan["_id"], limit + 1, after)
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_cursor(events[-1]["changed_at"], events[-1]["_id"])
+    return {"items": events, "next_cursor": next_cursor}
 
 @router.get("/my-loans", response_model=List[Loan])
+@versioned_cache(
+    expire=settings.CACHE_TTL_SECONDS,
+    namespaces=lambda kwargs: [USERS_NAMESPACE, user_namespace(kwargs["current_user"]["email"])],
+    coder=ResponseCoder
+)
 async def get_my_loans(
     current_user: dict = Depends(get_current_user),
     db = Depends(get_database)
 ):
-    cursor = db.loans.find({"user_email": current_user["email"]})
+    cursor = db.loans.find({"user_email": current_user["email"]}).sort("created_at", -1)
     loans = await cursor.to_list(length=None)
-    return [Loan.from_mongo(loan) for loan in loans]
+    # Documents come straight from our collection, so skip model validation
+    return FastJSONResponse([Loan.dump_mongo(loan) for loan in loans])
+
+@router.get("/events")
+async def my_loan_events(current_user: dict = Depends(get_current_user)):
+    """Server-sent events for changes to the current user's loans"""
+    return StreamingResponse(
+        event_stream(current_user["email"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/{loan_id}", response_model=Loan)
 async def get_loan(
@@ -145,12 +185,7 @@ async def get_loan(
     current_user: dict = Depends(get_current_user),
     db = Depends(get_database)
 ):
-    from bson import ObjectId
-    
-    loan = await db.loans.find_one({
-        "_id": ObjectId(loan_id),
-        "user_email": current_user["email"]
-    })
+    loan = await find_loan(db, loan_id, current_user["email"])
     
     if not loan:
         raise HTTPException(
@@ -0,0 +1,64 @@
+"""
+Production server: several uvicorn workers on one socket
+
+Usage: python -m app.server
+
+Starts WEB_CONCURRENCY workers (one per available CPU when 0). On SIGTERM
+or SIGINT each worker stops accepting connections, closes its event streams
+so dashboards reconnect elsewhere, and gives in-flight requests up to
+SHUTDOWN_TIMEOUT_SECONDS to finish before it closes its pools.
+"""
+import os
+import tempfile
+from pathlib import Path
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+from .config import settings
+
+def worker_count() -> int:
+    if settings.WEB_CONCURRENCY > 0:
+        return settings.WEB_CONCURRENCY
+    try:
+        return len(os.sched_getaffinity(0))  # Honours CPU pinning, unlike os.cpu_count
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def prepare_metrics_dir(workers: int):
+    """
+    Workers must share a PROMETHEUS_MULTIPROC_DIR for /metrics to cover all
+    of them; it has to be set before they import prometheus_client, and
+    emptied so samples from the previous run do not carry over
+    """
+    if workers == 1 and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return
+    path = Path(os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="prometheus-")))
+    path.mkdir(parents=True, exist_ok=True)
+    for stale in path.glob("*.db"):
+        stale.unlink()
+
+class DrainingServer(uvicorn.Server):
+    def handle_exit(self, sig, frame):
+        # Imported here: the supervisor process never loads the app
+        from .utils.events import end_event_streams
+        if not self.should_exit:
+            end_event_streams()
+        super().handle_exit(sig, frame)
+
+def main():
+    workers = worker_count()
+    prepare_metrics_dir(workers)
+    config = uvicorn.Config(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=workers,
+        timeout_graceful_shutdown=settings.SHUTDOWN_TIMEOUT_SECONDS
+    )
+    server = DrainingServer(config)
+    if workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+// Reads the server-sent event feed with fetch so the bearer token can be sent
+// as a header (EventSource cannot set headers). Calls onEvents with each
+// batch of events; after a dropped connection it reconnects and calls
+// onReconnect first, since events may have been missed in between.
+async function subscribeToLoanEvents(url, onEvents, onReconnect) {
+    let connectedBefore = false;
+    while (true) {
+        const token = localStorage.getItem('access_token');
+        try {
+            const response = await fetch(url, {
+                headers: {
+                    'Authorization': `Bearer ${token}`,
+                    'Accept': 'text/event-stream'
+                }
+            });
+            if (response.status === 401) {
+                window.location.href = '/login';
+                return;
+            }
+            if (response.ok) {
+                if (connectedBefore) {
+                    await onReconnect();
+                }
+                connectedBefore = true;
+                await readEventStream(response, onEvents);
+            }
+        } catch (error) {
+            console.error('Event feed error:', error);
+        }
+        await new Promise(resolve => setTimeout(resolve, 3000));
+    }
+}
+
+async function readEventStream(response, onEvents) {
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    while (true) {
+        const {value, done} = await reader.read();
+        if (done) return;
+        buffer += value;
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const data = frame.split('\n')
+                .filter(line => line.startsWith('data: '))
+                .map(line => line.slice(6))
+                .join('\n');
+            if (data) onEvents(JSON.parse(data));
+        }
+    }
+}
@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from ..config import settings
+from ..models.loan import LoanCreate, LoanStatus, ScoringState, StatusChange
+from ..repositories.loans import insert_loans
+from ..repositories.users import find_users
+from .borrower_history import get_borrower_histories
+from .credit_scoring import score_batch
+from .loan_hooks import after_loans_created
+from .scoring_policy import ScoringPolicy, current_policy
+
+def initial_status(credit_score: float, policy: ScoringPolicy) -> LoanStatus:
+    return LoanStatus.REJECTED if credit_score < policy.threshold else LoanStatus.PENDING
+
+def automatic_status_change(credit_score: float, submitted_by: str, changed_at: datetime, policy: ScoringPolicy) -> StatusChange:
+    """The status change that follows from a new application's credit score"""
+    status = initial_status(credit_score, policy)
+    return StatusChange(
+        status=status,
+        changed_at=changed_at,
+        changed_by=submitted_by,
+        notes=f"Automatic {'rejection' if status == LoanStatus.REJECTED else 'submission'} based on credit score: {credit_score}"
+    )
+
+def build_loan_document(
+    loan: LoanCreate,
+    email: str,
+    credit_score: float,
+    submitted_by: str,
+    created_at: datetime,
+    policy: ScoringPolicy
+) -> dict:
+    """The stored form of a new application, with its automatic first status"""
+    status_change = automatic_status_change(credit_score, submitted_by, created_at, policy)
+    document = loan.model_dump()
+    document.update({
+        "user_email": email,
+        "status": status_change.status,
+        "created_at": created_at,
+        "credit_score": credit_score,
+        "score_policy_version": policy.version,
+        "status_history": [status_change.model_dump()]
+    })
+    return document
+
+def build_queued_loan_document(loan: LoanCreate, email: str, submitted_by: str, created_at: datetime) -> dict:
+    """
+    The stored form of a new application left for the scoring worker: pending,
+    without a score, and due to be enqueued again if not scored within the lease
+    """
+    status_change = StatusChange(
+        status=LoanStatus.PENDING,
+        changed_at=created_at,
+        changed_by=submitted_by,
+        notes="Submitted, awaiting credit score"
+    )
+    document = loan.model_dump()
+    document.update({
+        "user_email": email,
+        "status": LoanStatus.PENDING,
+        "created_at": created_at,
+        "credit_score": None,
+        "score_policy_version": None,
+        "scoring_state": ScoringState.QUEUED,
+        "scoring_attempts": 0,
+        "scoring_due_at": created_at + timedelta(seconds=settings.SCORING_LEASE_SECONDS),
+        "status_history": [status_change.model_dump()]
+    })
+    return document
+
+def _failure(index: int, error: str) -> dict:
+    return {"index": index, "ok": False, "error": error}
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'record'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+async def _check_borrowers(db, emails) -> Dict[str, str]:
+    """Map the emails that cannot apply to the reason why"""
+    users = {
+        user["email"]: user
+        for user in await find_users(db, emails, {"_id": 0, "email": 1, "is_active": 1})
+    }
+    problems = {}
+    for email in emails:
+        if email not in users:
+            problems[email] = "Unknown borrower"
+        elif not users[email].get("is_active", True):
+            problems[email] = "Inactive borrower"
+    return problems
+
+async def apply_batch(
+    db,
+    records: List[Any],
+    submitter: dict,
+    histories: Dict[str, Tuple[int, int]],
+    offset: int = 0
+) -> List[dict]:
+    """
+    Validate, score and insert one batch of applications
+    Non-admins may only apply for themselves. `histories` maps borrower
+    email to (total loans, approved loans) and is carried from batch to
+    batch, so every application is scored against the ones before it, as
+    if they had been submitted one at a time. Returns one result per
+    record, in order; indexes start at offset.
+    """
+    results: List[Optional[dict]] = [None] * len(records)
+    valid: List[Tuple[int, LoanCreate]] = []
+    for position, record in enumerate(records):
+        try:
+            loan = LoanCreate.model_validate(record)
+        except ValidationError as e:
+            results[position] = _failure(offset + position, _describe(e))
+            continue
+        if not submitter.get("is_admin") and loan.user_email != submitter["email"]:
+            results[position] = _failure(offset + position, "Cannot apply on behalf of another borrower")
+            continue
+        valid.append((position, loan))
+
+    borrowers = {loan.user_email for _, loan in valid}
+    problems = await _check_borrowers(db, borrowers) if submitter.get("is_admin") else {}
+    accepted = []
+    for position, loan in valid:
+        if problems.get(loan.user_email):
+            results[position] = _failure(offset + position, problems[loan.user_email])
+        else:
+            accepted.append((position, loan))
+    if not accepted:
+        return results
+
+    histories.update(await get_borrower_histories(
+        db, {loan.user_email for _, loan in accepted if loan.user_email not in histories}
+    ))
+    previous_counts, approved_counts = [], []
+    for _, loan in accepted:
+        total, approved = histories[loan.user_email]
+        previous_counts.append(total)
+        approved_counts.append(approved)
+        histories[loan.user_email] = (total + 1, approved)  # New loans are never approved
+
+    policy = current_policy()
+    scores = score_batch(
+        [loan.amount for _, loan in accepted],
+        [loan.duration_months for _, loan in accepted],
+        [loan.purpose for _, loan in accepted],
+        previous_counts,
+        approved_counts,
+        policy
+    ).total_score
+
+    created_at = datetime.utcnow()
+    documents = [
+        build_loan_document(loan, loan.user_email, float(score), submitter["email"], created_at, policy)
+        for (_, loan), score in zip(accepted, scores)
+    ]
+    errors = await insert_loans(db, documents)
+
+    inserted = []
+    for i, ((position, loan), document) in enumerate(zip(accepted, documents)):
+        if i in errors:
+            # Later batches should not count it; this batch was already scored with it
+            total, approved = histories[loan.user_email]
+            histories[loan.user_email] = (total - 1, approved)
+            results[position] = _failure(offset + position, errors[i])
+            continue
+        inserted.append(document)
+        results[position] = {
+            "index": offset + position,
+            "ok": True,
+            "loan_id": str(document["_id"]),
+            "status": document["status"],
+            "credit_score": document["credit_score"]
+        }
+
+    if inserted:
+        await after_loans_created(db, inserted)
+    return results
+
+async def apply_loans_bulk(db, records: List[Any], submitter: dict) -> List[dict]:
+    histories: Dict[str, Tuple[int, int]] = {}
+    results = []
+    for offset in range(0, len(records), settings.BULK_APPLY_BATCH_SIZE):
+        batch = records[offset:offset + settings.BULK_APPLY_BATCH_SIZE]
+        results.extend(await apply_batch(db, batch, submitter, histories, offset))
+    return results
@@ -1,15 +1,49 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+import time
 from datetime import datetime, timedelta
 from typing import Optional
+from ..config import settings
 from ..dependencies.database import get_database
+from .user_cache import LRUCache, MemoryUserCache, RedisUserCache, USER_PROJECTION
 
 # Security configurations
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
-SECRET_KEY = "secret"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+SECRET_KEY = settings.SECRET_KEY
+ALGORITHM = settings.ALGORITHM
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
+
+# Decoded claims per token, and slim user records per email
+claims_cache = LRUCache(settings.AUTH_CACHE_MAX_ENTRIES, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+user_cache = MemoryUserCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+
+def configure_user_cache(redis=None):
+    """Share the user cache across workers through Redis when AUTH_CACHE_BACKEND is redis"""
+    global user_cache
+    if settings.AUTH_CACHE_BACKEND == "redis" and redis is not None:
+        user_cache = RedisUserCache(redis, settings.AUTH_CACHE_TTL_SECONDS)
+
+async def invalidate_user(email: str):
+    """Drop a cached user so changes like deactivation or promotion apply on the next request"""
+    await user_cache.invalidate(email)
+
+async def auth_cache_stats() -> dict:
+    return {
+        "claims": claims_cache.stats(),
+        "users": await user_cache.stats()
+    }
+
+def decode_token(token: str) -> dict:
+    """Decode and verify a JWT, reusing the claims of tokens seen before"""
+    payload = claims_cache.get(token)
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    remaining = payload.get("exp", 0) - time.time()
+    if remaining > 0:
+        claims_cache.set(token, payload, ttl=remaining)
+    return payload
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -21,6 +55,28 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+async def load_user(db, email: str) -> Optional[dict]:
+    """The slim user record for an email, from the user cache when possible"""
+    user = await user_cache.get(email)
+    if user is None:
+        user = await db.users.find_one({"email": email}, USER_PROJECTION)
+        if user is not None:
+            await user_cache.set(email, user)
+    return user
+
+async def admin_from_token(db, token: str) -> Optional[dict]:
+    """The active admin a bearer token belongs to, or None; for code outside dependencies"""
+    try:
+        email = decode_token(token).get("sub")
+    except JWTError:
+        return None
+    if email is None:
+        return None
+    user = await load_user(db, email)
+    if user is None or not user.get("is_active", True) or not user.get("is_admin", False):
+        return None
+    return user
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db = Depends(get_database)
@@ -31,16 +87,21 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
         
-    user = await db.users.find_one({"email": email})
+    user = await load_user(db, email)
     if user is None:
         raise credentials_exception
+    if not user.get("is_active", True):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Inactive user"
+        )
     return user
 
 async def get_current_admin(
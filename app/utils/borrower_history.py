@@ -0,0 +1,170 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+from pymongo import UpdateOne
+from ..dependencies.indexes import declare_query
+from ..models.loan import LoanStatus
+
+# One document per borrower, keyed by email:
+# {_id, total_loans, approved_count, last_status_change: {loan_id, status, changed_at}}
+declare_query("borrower_summaries", {"_id": "borrower@example.com"})
+declare_query("borrower_summaries", {"_id": {"$in": ["borrower@example.com"]}})
+
+def _approved(status) -> int:
+    return 1 if status == LoanStatus.APPROVED else 0
+
+async def get_borrower_history(db, email: str) -> Tuple[int, int]:
+    """Return (total loans, approved loans) for a borrower"""
+    summary = await db.borrower_summaries.find_one({"_id": email})
+    if not summary:
+        return 0, 0
+    return summary.get("total_loans", 0), summary.get("approved_count", 0)
+
+async def get_borrower_histories(db, emails: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    """Return {email: (total loans, approved loans)} for many borrowers in one query"""
+    emails = list(emails)
+    histories = {email: (0, 0) for email in emails}
+    async for summary in db.borrower_summaries.find({"_id": {"$in": emails}}):
+        histories[summary["_id"]] = (summary.get("total_loans", 0), summary.get("approved_count", 0))
+    return histories
+
+async def get_previous_history(db, loan: dict) -> Tuple[int, int]:
+    """
+    Return (previous loans, approved loans) for the borrower of a stored loan,
+    leaving out the loan itself
+    """
+    email = loan.get("user_email", loan.get("email"))
+    if email is None:
+        return 0, 0
+    total, approved = await get_borrower_history(db, email)
+    return max(total - 1, 0), max(approved - _approved(loan.get("status")), 0)
+
+async def record_loan_created(db, email: str, loan_id, status, changed_at: datetime):
+    await db.borrower_summaries.update_one(
+        {"_id": email},
+        {
+            "$inc": {"total_loans": 1, "approved_count": _approved(status)},
+            "$set": {
+                "last_status_change": {
+                    "loan_id": loan_id,
+                    "status": status,
+                    "changed_at": changed_at
+                }
+            }
+        },
+        upsert=True
+    )
+
+async def record_loans_created(db, loans: List[dict]):
+    """record_loan_created for a batch of new loans, one write per borrower"""
+    updates = {}
+    for loan in loans:
+        email = loan["user_email"]
+        total, approved, _ = updates.get(email, (0, 0, None))
+        updates[email] = (total + 1, approved + _approved(loan["status"]), loan)
+    if not updates:
+        return
+    await db.borrower_summaries.bulk_write(
+        [
+            UpdateOne(
+                {"_id": email},
+                {
+                    "$inc": {"total_loans": total, "approved_count": approved},
+                    "$set": {
+                        "last_status_change": {
+                            "loan_id": last["_id"],
+                            "status": last["status"],
+                            "changed_at": last["created_at"]
+                        }
+                    }
+                },
+                upsert=True
+            )
+            for email, (total, approved, last) in updates.items()
+        ],
+        ordered=False
+    )
+
+async def record_status_change(db, email: str, loan_id, old_status, new_status, changed_at: datetime):
+    if email is None:
+        return
+    await db.borrower_summaries.update_one(
+        {"_id": email},
+        {
+            "$inc": {"approved_count": _approved(new_status) - _approved(old_status)},
+            "$set": {
+                "last_status_change": {
+                    "loan_id": loan_id,
+                    "status": new_status,
+                    "changed_at": changed_at
+                }
+            }
+        },
+        upsert=True
+    )
+
+async def record_status_changes(db, changes: List[Tuple[str, object, object, object, datetime]]):
+    """record_status_change for a batch of (email, loan id, old status, new status, changed at), one write per borrower"""
+    updates = {}
+    for email, loan_id, old_status, new_status, changed_at in changes:
+        if email is None:
+            continue
+        approved_delta, _ = updates.get(email, (0, None))
+        updates[email] = (
+            approved_delta + _approved(new_status) - _approved(old_status),
+            {"loan_id": loan_id, "status": new_status, "changed_at": changed_at}
+        )
+    if not updates:
+        return
+    await db.borrower_summaries.bulk_write(
+        [
+            UpdateOne(
+                {"_id": email},
+                {
+                    "$inc": {"approved_count": approved_delta},
+                    "$set": {"last_status_change": last_status_change}
+                },
+                upsert=True
+            )
+            for email, (approved_delta, last_status_change) in updates.items()
+        ],
+        ordered=False
+    )
+
+async def rebuild_borrower_summaries(db) -> int:
+    """
+    Recompute every borrower summary from the loans collection
+    Writes that happen while the rebuild runs may be lost, so run it
+    while the app is not taking applications or reviews
+    Returns the number of borrowers
+    """
+    pipeline = [
+        {
+            "$addFields": {
+                "borrower": {"$ifNull": ["$user_email", "$email"]},
+                "changed_at": {
+                    "$ifNull": [{"$arrayElemAt": ["$status_history.changed_at", -1]}, "$created_at"]
+                }
+            }
+        },
+        {"$match": {"borrower": {"$ne": None}}},
+        {"$sort": {"changed_at": 1}},
+        {
+            "$group": {
+                "_id": "$borrower",
+                "total_loans": {"$sum": 1},
+                "approved_count": {
+                    "$sum": {"$cond": [{"$eq": ["$status", LoanStatus.APPROVED.value]}, 1, 0]}
+                },
+                "last_status_change": {
+                    "$last": {
+                        "loan_id": "$_id",
+                        "status": "$status",
+                        "changed_at": "$changed_at"
+                    }
+                }
+            }
+        },
+        {"$out": "borrower_summaries"}
+    ]
+    await db.loans.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    return await db.borrower_summaries.count_documents({})
@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import uuid
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple, Type
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends import Backend
+from fastapi_cache.coder import Coder
+from fastapi_cache.decorator import cache
+from .metrics import CACHE_REQUESTS, CACHE_INVALIDATIONS
+
+logger = logging.getLogger(__name__)
+
+# Every cached read keys on the current version of the namespaces it depends on.
+# Write paths bump those versions, which makes the old entries unreachable; they
+# then age out of the backend through their TTL.
+LOANS_NAMESPACE = "loans"
+USERS_NAMESPACE = "users"  # Epoch shared by every per-user namespace
+
+def user_namespace(email: str) -> str:
+    return f"user:{email}"
+
+class CountingBackend(Backend):
+    """Backend wrapper that counts cache hits, misses and invalidations"""
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self.counters = Counter()
+        self._local_versions: Dict[str, int] = {}
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[str]]:
+        ttl, value = await self.backend.get_with_ttl(key)
+        hit = value is not None
+        self.counters["hits" if hit else "misses"] += 1
+        CACHE_REQUESTS.labels("hit" if hit else "miss").inc()
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: str, expire: Optional[int] = None) -> None:
+        self.counters["sets"] += 1
+        return await self.backend.set(key, value, expire)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        return await self.backend.clear(namespace, key)
+
+    async def get_versions(self, namespaces: List[str]) -> List[int]:
+        redis = getattr(self.backend, "redis", None)
+        if redis is None:
+            return [self._local_versions.get(namespace, 0) for namespace in namespaces]
+        versions = await redis.mget([_version_key(namespace) for namespace in namespaces])
+        return [int(version or 0) for version in versions]
+
+    async def bump_versions(self, namespaces: List[str]):
+        self.counters["invalidations"] += len(namespaces)
+        CACHE_INVALIDATIONS.inc(len(namespaces))
+        redis = getattr(self.backend, "redis", None)
+        if redis is None:
+            for namespace in namespaces:
+                self._local_versions[namespace] = self._local_versions.get(namespace, 0) + 1
+            return
+        async with redis.pipeline(transaction=False) as pipe:
+            for namespace in namespaces:
+                pipe.incr(_version_key(namespace))
+            await pipe.execute()
+
+    async def stats(self) -> dict:
+        stats = {
+            "hits": self.counters["hits"],
+            "misses": self.counters["misses"],
+            "sets": self.counters["sets"],
+            "invalidations": self.counters["invalidations"]
+        }
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+
+        redis = getattr(self.backend, "redis", None)
+        if redis is not None:
+            info = await redis.info("stats")
+            stats["evicted_keys"] = info.get("evicted_keys")
+            stats["expired_keys"] = info.get("expired_keys")
+        return stats
+
+def _version_key(namespace: str) -> str:
+    return f"{FastAPICache.get_prefix()}:version:{namespace}"
+
+def _counting_backend() -> Optional[CountingBackend]:
+    try:
+        backend = FastAPICache.get_backend()
+    except AssertionError:
+        # Cache not initialised, e.g. when running from the CLI
+        return None
+    return backend if isinstance(backend, CountingBackend) else None
+
+async def invalidate(*namespaces: str):
+    """Bump namespace versions after a write so cached reads of them are refetched"""
+    backend = _counting_backend()
+    if backend is None:
+        return
+    try:
+        await backend.bump_versions(list(namespaces))
+    except Exception:
+        logger.warning("Failed to invalidate cache namespaces %s", namespaces, exc_info=True)
+
+async def invalidate_loans(*emails: str):
+    """Invalidate the admin views and the loan views of the given borrowers"""
+    await invalidate(LOANS_NAMESPACE, *[user_namespace(email) for email in emails if email])
+
+def versioned_cache(expire: int, namespaces: Callable[[dict], List[str]], coder: Optional[Type[Coder]] = None):
+    """
+    Cache a GET endpoint under the current versions of the namespaces it reads
+    `namespaces` maps the endpoint kwargs to namespace names; the query string
+    is part of the key so every filter combination gets its own entry
+    The coder is part of the key too, so changing it never replays old entries
+    """
+    async def key_builder(func, namespace="", *, request=None, response=None, args=(), kwargs=None):
+        names = namespaces(kwargs or {})
+        backend = _counting_backend()
+        try:
+            versions = await backend.get_versions(names) if backend else [0] * len(names)
+        except Exception:
+            # Without the versions no entry is known to be current; a key nothing
+            # else uses makes fastapi-cache miss and run the endpoint, as it does
+            # when the backend read itself fails
+            logger.warning("Failed to read cache versions for %s, skipping the cache", names, exc_info=True)
+            return f"{FastAPICache.get_prefix()}:uncached:{uuid.uuid4().hex}"
+        version_tag = ",".join(f"{name}@{version}" for name, version in zip(names, versions))
+
+        query = sorted(request.query_params.multi_items()) if request else []
+        coder_name = coder.__name__ if coder else ""
+        digest = hashlib.md5(f"{func.__module__}:{func.__name__}:{coder_name}:{query}".encode()).hexdigest()
+        return f"{FastAPICache.get_prefix()}:{version_tag}:{digest}"
+
+    return cache(expire=expire, coder=coder, key_builder=key_builder)
+
+async def cache_stats() -> Optional[dict]:
+    backend = _counting_backend()
+    return await backend.stats() if backend else None
@@ -1,87 +1,216 @@
-from typing import List
+import time
+from bisect import bisect_left
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
 from ..models.loan import Loan, LoanStatus
+from .scoring_policy import ScoringPolicy, current_policy
+from .metrics import SCORING_LATENCY, SCORED_LOANS
 
-CREDIT_SCORE_THRESHOLD = 60.0  # Minimum score for admin review
+_SINGLE_LATENCY, _SINGLE_LOANS = SCORING_LATENCY.labels("single"), SCORED_LOANS.labels("single")
+_BATCH_LATENCY, _BATCH_LOANS = SCORING_LATENCY.labels("batch"), SCORED_LOANS.labels("batch")
 
-def calculate_amount_score(amount: float) -> float:
+# Scoring rules come from the active ScoringPolicy (app/scoring_policy.json by
+# default). Every function takes an optional policy; callers that score more
+# than once per request should take current_policy() once and pass it along,
+# so a reload in the middle cannot mix two policies.
+
+class ScoreBreakdown(NamedTuple):
+    """Per-component scores for a batch of loans, one array entry per loan"""
+    amount_score: np.ndarray
+    duration_score: np.ndarray
+    purpose_score: np.ndarray
+    history_score: np.ndarray
+    total_score: np.ndarray
+    policy_version: str
+
+def score_amounts(amounts, policy: Optional[ScoringPolicy] = None) -> np.ndarray:
+    """
+    Vectorized amount score
+    Lower amounts get higher scores (less risk)
+    """
+    policy = policy or current_policy()
+    amounts = np.asarray(amounts, dtype=np.float64)
+    return policy.amount_scores_array[np.searchsorted(policy.amount_breakpoints_array, amounts, side="left")]
+
+def score_durations(durations, policy: Optional[ScoringPolicy] = None) -> np.ndarray:
+    """
+    Vectorized duration score
+    Shorter durations get higher scores
+    """
+    policy = policy or current_policy()
+    durations = np.asarray(durations, dtype=np.float64)
+    return policy.duration_scores_array[np.searchsorted(policy.duration_breakpoints_array, durations, side="left")]
+
+def score_purposes(purposes: Sequence[str], policy: Optional[ScoringPolicy] = None) -> np.ndarray:
+    """
+    Vectorized purpose score
+    Only the distinct purposes of the batch are looked up; mapping the
+    column through a dict is much faster than numpy string operations
+    """
+    policy = policy or current_policy()
+    if isinstance(purposes, np.ndarray):
+        purposes = purposes.tolist()
+    lookup = {
+        purpose: policy.purpose_scores.get(purpose.lower(), policy.default_purpose_score)
+        for purpose in set(purposes)
+    }
+    return np.fromiter(map(lookup.__getitem__, purposes), dtype=np.float64, count=len(purposes))
+
+def score_histories(previous_counts, approved_counts, policy: Optional[ScoringPolicy] = None) -> np.ndarray:
+    """
+    Vectorized history score from the number of previous loans
+    and how many of them were approved
+    """
+    policy = policy or current_policy()
+    previous_counts = np.asarray(previous_counts)
+    approved_counts = np.asarray(approved_counts)
+    return np.select(
+        [previous_counts == 0, approved_counts >= policy.proven_after, approved_counts >= 1],
+        [policy.new_borrower_score, policy.proven_score, policy.some_approvals_score],
+        default=policy.no_approvals_score
+    )
+
+def normalise_scores(total_scores, policy: Optional[ScoringPolicy] = None) -> np.ndarray:
+    """Normalize raw scores to the 0-100 range, rounded to 2 decimals"""
+    policy = policy or current_policy()
+    return np.round(np.asarray(total_scores) / policy.max_raw_score * 100, 2)
+
+def score_batch(
+    amounts,
+    durations,
+    purposes: Sequence[str],
+    previous_counts,
+    approved_counts,
+    policy: Optional[ScoringPolicy] = None
+) -> ScoreBreakdown:
+    """
+    Score a batch of loans given as columns
+    Returns every component and the normalized total in one pass
+    """
+    policy = policy or current_policy()
+    with _BATCH_LATENCY.time():
+        amount_score = score_amounts(amounts, policy)
+        duration_score = score_durations(durations, policy)
+        purpose_score = score_purposes(purposes, policy)
+        history_score = score_histories(previous_counts, approved_counts, policy)
+
+        total_score = normalise_scores(
+            amount_score + duration_score + purpose_score + history_score, policy
+        )
+    _BATCH_LOANS.inc(len(total_score))
+    return ScoreBreakdown(
+        amount_score=amount_score,
+        duration_score=duration_score,
+        purpose_score=purpose_score,
+        history_score=history_score,
+        total_score=total_score,
+        policy_version=policy.version
+    )
+
+def count_history(previous_loans: List[Loan]) -> Tuple[int, int]:
+    """Return (previous loan count, approved loan count)"""
+    approved = sum(1 for loan in previous_loans
+                   if loan.status == LoanStatus.APPROVED)
+    return len(previous_loans), approved
+
+def calculate_amount_score(amount: float, policy: Optional[ScoringPolicy] = None) -> float:
     """
     Calculate score based on loan amount
     Lower amounts get higher scores (less risk)
     """
-    if amount <= 5000:
-        return 40.0
-    elif amount <= 10000:
-        return 30.0
-    elif amount <= 20000:
-        return 20.0
-    else:
-        return 10.0
+    policy = policy or current_policy()
+    return policy.amount_scores[bisect_left(policy.amount_breakpoints, amount)]
 
-def calculate_duration_score(duration_months: int) -> float:
+def calculate_duration_score(duration_months: int, policy: Optional[ScoringPolicy] = None) -> float:
     """
     Calculate score based on loan duration
     Shorter durations get higher scores
     """
-    if duration_months <= 6:
-        return 30.0
-    elif duration_months <= 12:
-        return 25.0
-    elif duration_months <= 24:
-        return 20.0
-    else:
-        return 15.0
+    policy = policy or current_policy()
+    return policy.duration_scores[bisect_left(policy.duration_breakpoints, duration_months)]
 
-def calculate_purpose_score(purpose: str) -> float:
+def calculate_purpose_score(purpose: str, policy: Optional[ScoringPolicy] = None) -> float:
     """
     Calculate score based on loan purpose
     Different purposes have different risk levels
     """
-    purpose_scores = {
-        "education": 30.0,
-        "home renovation": 25.0,
-        "business": 20.0,
-        "debt consolidation": 15.0,
-        "other": 10.0
-    }
-    return purpose_scores.get(purpose.lower(), 10.0)
+    policy = policy or current_policy()
+    return policy.purpose_scores.get(purpose.lower(), policy.default_purpose_score)
 
-def calculate_history_score(previous_loans: List[Loan]) -> float:
+def calculate_history_score(previous_loans: List[Loan], policy: Optional[ScoringPolicy] = None) -> float:
     """
     Calculate score based on previous loan history
     """
-    if not previous_loans:
-        return 20.0  # New borrower score
-    
-    completed_loans = sum(1 for loan in previous_loans 
-                         if loan.status == "approved")
-    
-    if completed_loans >= 2:
-        return 30.0
-    elif completed_loans == 1:
-        return 25.0
-    else:
-        return 15.0
+    return calculate_history_score_from_counts(*count_history(previous_loans), policy)
+
+def calculate_history_score_from_counts(
+    previous_count: int,
+    approved_count: int,
+    policy: Optional[ScoringPolicy] = None
+) -> float:
+    """
+    Calculate history score from precomputed borrower counts
+    """
+    policy = policy or current_policy()
+    if previous_count == 0:
+        return policy.new_borrower_score
+    if approved_count >= policy.proven_after:
+        return policy.proven_score
+    if approved_count >= 1:
+        return policy.some_approvals_score
+    return policy.no_approvals_score
 
 async def calculate_credit_score(
     loan: Loan,
-    previous_loans: List[Loan]
+    previous_loans: List[Loan],
+    policy: Optional[ScoringPolicy] = None
 ) -> float:
     """
     Calculate overall credit score
     Returns a score between 0 and 100
     """
-    amount_score = calculate_amount_score(loan.amount)
-    duration_score = calculate_duration_score(loan.duration_months)
-    purpose_score = calculate_purpose_score(loan.purpose)
-    history_score = calculate_history_score(previous_loans)
-    
-    total_score = amount_score + duration_score + purpose_score + history_score
-    # Normalize to 0-100 range
-    normalized_score = (total_score / 130.0) * 100
-    
-    return round(normalized_score, 2) 
-
-async def evaluate_loan_eligibility(credit_score: float) -> str:
-    if credit_score < CREDIT_SCORE_THRESHOLD:
+    return await calculate_credit_score_from_history(loan, *count_history(previous_loans), policy)
+
+async def calculate_credit_score_from_history(
+    loan: Loan,
+    previous_count: int,
+    approved_count: int,
+    policy: Optional[ScoringPolicy] = None
+) -> float:
+    """
+    Calculate overall credit score from precomputed borrower counts
+    Returns a score between 0 and 100
+    """
+    policy = policy or current_policy()
+    raw_score = (
+        calculate_amount_score(loan.amount, policy)
+        + calculate_duration_score(loan.duration_months, policy)
+        + calculate_purpose_score(loan.purpose, policy)
+        + calculate_history_score_from_counts(previous_count, approved_count, policy)
+    )
+    # Builtin round gives the same result as normalise_scores' np.round for these
+    # scores (tests/test_credit_scoring.py) at a fraction of the cost
+    return round(raw_score / policy.max_raw_score * 100, 2)
+
+async def score_application(
+    loan: Loan,
+    previous_count: int,
+    approved_count: int,
+    policy: ScoringPolicy
+) -> float:
+    """
+    calculate_credit_score_from_history for the one loan of a request,
+    recorded in the scoring metrics; the scorer itself is not timed, so
+    loops over it pay nothing for them
+    """
+    start = time.perf_counter()
+    score = await calculate_credit_score_from_history(loan, previous_count, approved_count, policy)
+    _SINGLE_LATENCY.observe(time.perf_counter() - start)
+    _SINGLE_LOANS.inc()
+    return score
+
+async def evaluate_loan_eligibility(credit_score: float, policy: Optional[ScoringPolicy] = None) -> str:
+    policy = policy or current_policy()
+    if credit_score < policy.threshold:
         return LoanStatus.REJECTED
-    return LoanStatus.IN_REVIEW
\ No newline at end of file
+    return LoanStatus.IN_REVIEW
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Set
+from ..config import settings
+from ..models.loan import Loan, LoanStatus
+from .serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# Loan events pushed to the dashboards. Every event has a type; loan events
+# also carry loan_id and email (the borrower), and stats_delta maps statuses
+# to the {count, total_amount} change they cause in /admin/stats.
+#   created         loan: the new loan
+#   status_changed  status, previous_status, changed_at
+#   scored          credit_score
+#   resync          events were missed or many loans changed at once; reload
+EVENTS_CHANNEL = "loan-events"
+RESYNC = {"type": "resync"}
+
+def _status(value) -> Optional[str]:
+    return value.value if isinstance(value, LoanStatus) else value
+
+def loan_created_event(loan: dict) -> dict:
+    status = _status(loan["status"])
+    return {
+        "type": "created",
+        "loan_id": str(loan["_id"]),
+        "email": loan.get("user_email", loan.get("email")),
+        "loan": Loan.dump_mongo(loan),
+        "stats_delta": {status: {"count": 1, "total_amount": loan.get("amount", 0)}}
+    }
+
+def status_changed_event(loan: dict, previous_status, status, changed_at: datetime) -> dict:
+    previous_status, status = _status(previous_status), _status(status)
+    amount = loan.get("amount", 0)
+    stats_delta = {}
+    if previous_status != status:
+        stats_delta = {
+            status: {"count": 1, "total_amount": amount},
+            previous_status: {"count": -1, "total_amount": -amount}
+        }
+    return {
+        "type": "status_changed",
+        "loan_id": str(loan["_id"]),
+        "email": loan.get("user_email", loan.get("email")),
+        "status": status,
+        "previous_status": previous_status,
+        "changed_at": changed_at,
+        "stats_delta": stats_delta
+    }
+
+def loan_scored_event(loan: dict) -> dict:
+    return {
+        "type": "scored",
+        "loan_id": str(loan["_id"]),
+        "email": loan.get("user_email", loan.get("email")),
+        "credit_score": loan.get("credit_score")
+    }
+
+class Subscription:
+    """One connected dashboard; email limits it to that borrower's loans"""
+
+    def __init__(self, max_queue: int, email: Optional[str] = None):
+        self.email = email
+        self.queue: "asyncio.Queue[Optional[List[dict]]]" = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def offer(self, events: List[dict]):
+        if self.closed:
+            return
+        if self.email is not None:
+            events = [event for event in events if event["type"] == "resync" or event.get("email") == self.email]
+        if not events:
+            return
+        try:
+            self.queue.put_nowait(events)
+        except asyncio.QueueFull:
+            # A slow client missed events; drop its backlog and make it reload
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait([RESYNC])
+
+    def close(self):
+        """End the stream; None tells event_stream to stop"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+class MemoryEventBus:
+    """Delivers events to the subscribers connected to this worker"""
+
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self.subscriptions: Set[Subscription] = set()
+        self.ended = False
+
+    def subscribe(self, email: Optional[str] = None) -> Subscription:
+        subscription = Subscription(self.max_queue, email)
+        if self.ended:
+            subscription.close()
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+
+    def deliver(self, events: List[dict]):
+        for subscription in list(self.subscriptions):
+            subscription.offer(events)
+
+    def end_streams(self):
+        """Close every open stream and any opened later; clients reconnect to another worker"""
+        self.ended = True
+        for subscription in list(self.subscriptions):
+            subscription.close()
+
+    async def publish(self, events: List[dict]):
+        self.deliver(events)
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+class RedisEventBus(MemoryEventBus):
+    """Delivers events to the subscribers of every worker through Redis pub/sub"""
+
+    def __init__(self, redis, max_queue: int, channel: str = EVENTS_CHANNEL):
+        super().__init__(max_queue)
+        self.redis = redis
+        self.channel = channel
+        self._listener: Optional[asyncio.Task] = None
+
+    async def publish(self, events: List[dict]):
+        try:
+            await self.redis.publish(self.channel, dumps(events))
+        except Exception:
+            logger.warning("Failed to publish loan events", exc_info=True)
+            self.deliver(events)  # Other workers miss them; their clients catch up on reconnect
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Loan event subscription failed, resubscribing", exc_info=True)
+                self.deliver([RESYNC])
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+event_bus = MemoryEventBus(settings.EVENTS_MAX_QUEUE)
+
+async def configure_event_bus(redis=None):
+    """Fan events out across workers through Redis when EVENTS_BACKEND is redis"""
+    global event_bus
+    if settings.EVENTS_BACKEND == "redis" and redis is not None:
+        event_bus = RedisEventBus(redis, settings.EVENTS_MAX_QUEUE)
+    await event_bus.start()
+
+async def close_event_bus():
+    await event_bus.close()
+
+def end_event_streams():
+    """
+    Event streams never finish on their own, so a draining worker would
+    hold them until SHUTDOWN_TIMEOUT_SECONDS; call this when it starts draining
+    """
+    event_bus.end_streams()
+
+async def publish(*events: dict):
+    if events:
+        await event_bus.publish(list(events))
+
+async def event_stream(email: Optional[str] = None) -> AsyncIterator[bytes]:
+    """
+    Server-sent events: one `data:` frame per published batch of events,
+    and a comment every EVENTS_KEEPALIVE_SECONDS to keep proxies from
+    closing an idle connection
+    """
+    subscription = event_bus.subscribe(email)
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                events = await asyncio.wait_for(subscription.queue.get(), settings.EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if events is None:
+                return
+            yield b"data: " + dumps(events) + b"\n\n"
+    finally:
+        event_bus.unsubscribe(subscription)
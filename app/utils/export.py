@@ -0,0 +1,143 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, List, Optional
+from ..config import settings
+from ..dependencies.indexes import declare_query
+from ..models.loan import ExportFormat, Loan, LoanFilter
+from ..repositories.loan_events import find_events_for_loans
+from ..repositories.loans import SAMPLE_LOAN_FILTERS, build_loan_query
+from .serialization import dumps
+
+LOAN_COLUMNS = [
+    "_id",
+    "email",
+    "amount",
+    "purpose",
+    "duration_months",
+    "status",
+    "credit_score",
+    "score_policy_version",
+    "scoring_state",
+    "created_at",
+    "updated_at"
+]
+# With flatten_history every status change becomes its own record carrying these
+# fields. Changes come from loan_events, which has all of them, rather than the
+# embedded status_history, which keeps only the last STATUS_HISTORY_LIMIT.
+HISTORY_COLUMNS = [
+    "history_status",
+    "history_changed_at",
+    "history_changed_by",
+    "history_notes"
+]
+
+# Every filter the export accepts, read in _id order
+for sample_filter in SAMPLE_LOAN_FILTERS:
+    declare_query("loans", build_loan_query(sample_filter), sort=[("_id", 1)])
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv"
+}
+
+def export_media_type(export_format: ExportFormat, compress: bool) -> str:
+    return "application/gzip" if compress else MEDIA_TYPES[export_format]
+
+def export_filename(export_format: ExportFormat, compress: bool) -> str:
+    return f"loans.{export_format.value}" + (".gz" if compress else "")
+
+def _records(document: dict, flatten_history: bool, events: Optional[List[dict]] = None) -> List[dict]:
+    loan = Loan.dump_mongo(document)
+    if not flatten_history:
+        return [loan]
+    embedded = loan.pop("status_history")
+    # Loans with no events yet predate the log and have not been archived
+    history = events or embedded
+    if not history:
+        return [{**loan, **dict.fromkeys(HISTORY_COLUMNS)}]
+    return [
+        {
+            **loan,
+            "history_status": change["status"],
+            "history_changed_at": change["changed_at"],
+            "history_changed_by": change["changed_by"],
+            "history_notes": change.get("notes")
+        }
+        for change in history
+    ]
+
+async def _encode_batch(db, documents: List[dict], export_format: ExportFormat, columns: List[str], flatten_history: bool) -> bytes:
+    events = {}
+    if flatten_history:
+        events = await find_events_for_loans(db, [document["_id"] for document in documents])
+    records = []
+    for document in documents:
+        records.extend(_records(document, flatten_history, events.get(document["_id"])))
+    return _encode(records, export_format, columns)
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def _encode_csv(rows: List[list]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+def _encode(records: List[dict], export_format: ExportFormat, columns: List[str]) -> bytes:
+    if export_format == ExportFormat.CSV:
+        return _encode_csv([[_csv_value(record[column]) for column in columns] for record in records])
+    return b"".join(dumps(record) + b"\n" for record in records)
+
+async def stream_loans(
+    db,
+    loan_filter: LoanFilter,
+    export_format: ExportFormat,
+    flatten_history: bool = False,
+    compress: bool = False,
+    batch_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yield matching loans, oldest first, one encoded chunk per cursor batch
+    Only one batch of documents is held at a time, however many loans match.
+    With compress set the chunks form a gzip stream, flushed after every
+    batch so the client can decode what it has received so far. With
+    flatten_history each batch also reads its loans' events in one query.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    columns = LOAN_COLUMNS + (HISTORY_COLUMNS if flatten_history else [])
+    projection = None
+    if export_format == ExportFormat.CSV and not flatten_history:
+        projection = {"status_history": 0}
+    cursor = db.loans.find(build_loan_query(loan_filter), projection) \
+        .sort("_id", 1) \
+        .batch_size(batch_size)
+
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+
+    def emit(chunk: bytes) -> bytes:
+        if compressor is None:
+            return chunk
+        return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    if export_format == ExportFormat.CSV:
+        yield emit(_encode_csv([columns]))
+
+    documents = []
+    async for document in cursor:
+        documents.append(document)
+        if len(documents) >= batch_size:
+            yield emit(await _encode_batch(db, documents, export_format, columns, flatten_history))
+            documents = []
+    if documents:
+        yield emit(await _encode_batch(db, documents, export_format, columns, flatten_history))
+    if compressor is not None:
+        yield compressor.flush()
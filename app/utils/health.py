@@ -0,0 +1,31 @@
+import asyncio
+import time
+from ..config import settings
+from .metrics import mongo_pool_metrics
+
+# Both checks go through the connection pools, so an exhausted pool fails
+# them too once its wait outlasts HEALTH_CHECK_TIMEOUT_SECONDS
+
+async def _timed(check) -> dict:
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(check, settings.HEALTH_CHECK_TIMEOUT_SECONDS)
+        result = {"ok": True}
+    except Exception as e:
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}" if str(e) else type(e).__name__}
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+async def check_mongo(db) -> dict:
+    result = await _timed(db.command("ping"))
+    result["pool"] = {
+        "checked_out": mongo_pool_metrics.checked_out,
+        "max_size": settings.MONGO_MAX_POOL_SIZE,
+        "checkout_timeouts": mongo_pool_metrics.checkout_timeouts
+    }
+    return result
+
+async def check_redis(redis) -> dict:
+    result = await _timed(redis.ping())
+    result["pool"] = {"max_size": redis.connection_pool.max_connections}
+    return result
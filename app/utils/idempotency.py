@@ -0,0 +1,270 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from jose import JWTError
+from ..config import settings
+from .auth import decode_token
+from .metrics import IDEMPOTENCY_REQUESTS
+from .user_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Requests that may carry an Idempotency-Key header. The first request with a
+# key runs and its response is stored for IDEMPOTENCY_TTL_SECONDS; retries with
+# the same key and body get that response back without running the endpoint,
+# and duplicates that arrive while it runs wait for it. Keys are scoped to the
+# caller and the path, so two borrowers, or two loans, never share one.
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+MAX_KEY_LENGTH = 255
+IDEMPOTENT_ROUTES = [
+    ("POST", re.compile(r"^/loans/apply$")),
+    ("PATCH", re.compile(r"^/loans/[^/]+/status$"))
+]
+IN_FLIGHT = "in-flight"
+POLL_SECONDS = 0.05
+
+class IdempotencyBusy(Exception):
+    """The request holding the key did not finish within IDEMPOTENCY_WAIT_SECONDS"""
+
+class MemoryIdempotencyStore:
+    """Stored responses and in-flight keys, local to this worker"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.responses = LRUCache(max_entries, ttl)
+        self.in_flight: Dict[str, asyncio.Future] = {}
+
+    async def claim(self, key: str, wait: float) -> Optional[dict]:
+        """
+        The stored response for key, or None once the caller holds the key
+        and must run the request; waits while another request holds it
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            stored = self.responses.get(key)
+            if stored is not None:
+                return stored
+            future = self.in_flight.get(key)
+            if future is None:
+                self.in_flight[key] = asyncio.get_running_loop().create_future()
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IdempotencyBusy()
+            try:
+                await asyncio.wait_for(asyncio.shield(future), remaining)
+            except asyncio.TimeoutError:
+                raise IdempotencyBusy()
+
+    def _finish(self, key: str):
+        future = self.in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def complete(self, key: str, response: dict):
+        self.responses.set(key, response)
+        self._finish(key)
+
+    async def release(self, key: str):
+        """Give the key up without a response, so the next request with it runs"""
+        self._finish(key)
+
+class RedisIdempotencyStore:
+    """
+    Stored responses shared by every worker through Redis; a key is held
+    with SET NX for up to IDEMPOTENCY_LOCK_SECONDS while its request runs.
+    Falls back to the in-process store while Redis is unreachable.
+    """
+
+    def __init__(self, redis, ttl: int, lock_seconds: float, fallback: MemoryIdempotencyStore, prefix: str = "idempotency"):
+        self.redis = redis
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.fallback = fallback
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def claim(self, key: str, wait: float) -> Optional[dict]:
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                if await self.redis.set(self._key(key), IN_FLIGHT, nx=True, px=int(self.lock_seconds * 1000)):
+                    return None
+                raw = await self.redis.get(self._key(key))
+            except Exception:
+                logger.warning("Idempotency store read failed, using the local store", exc_info=True)
+                return await self.fallback.claim(key, max(deadline - time.monotonic(), 0))
+            if raw is not None and raw != IN_FLIGHT:
+                return json.loads(raw)
+            if time.monotonic() >= deadline:
+                raise IdempotencyBusy()
+            await asyncio.sleep(POLL_SECONDS)
+
+    async def complete(self, key: str, response: dict):
+        try:
+            await self.redis.set(self._key(key), json.dumps(response), ex=self.ttl)
+        except Exception:
+            logger.warning("Idempotency store write failed, using the local store", exc_info=True)
+            await self.fallback.complete(key, response)
+            return
+        await self.fallback.release(key)
+
+    async def release(self, key: str):
+        try:
+            await self.redis.delete(self._key(key))
+        except Exception:
+            logger.warning("Idempotency store release failed; the key frees itself after IDEMPOTENCY_LOCK_SECONDS", exc_info=True)
+        await self.fallback.release(key)
+
+idempotency_store = MemoryIdempotencyStore(settings.IDEMPOTENCY_MAX_ENTRIES, settings.IDEMPOTENCY_TTL_SECONDS)
+
+def configure_idempotency_store(redis=None):
+    """Share stored responses across workers through Redis when IDEMPOTENCY_BACKEND is redis"""
+    global idempotency_store
+    if settings.IDEMPOTENCY_BACKEND == "redis" and redis is not None:
+        idempotency_store = RedisIdempotencyStore(
+            redis,
+            settings.IDEMPOTENCY_TTL_SECONDS,
+            settings.IDEMPOTENCY_LOCK_SECONDS,
+            MemoryIdempotencyStore(settings.IDEMPOTENCY_MAX_ENTRIES, settings.IDEMPOTENCY_TTL_SECONDS)
+        )
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+def _caller(scope) -> Optional[str]:
+    """The email in the bearer token, without a database read; None if there is no valid token"""
+    authorization = (_header(scope, b"authorization") or b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_token(token).get("sub")
+    except JWTError:
+        return None
+
+def _storable(status_code: int) -> bool:
+    # Server errors and rate limiting say nothing about the request; let a retry run it again
+    return status_code < 500 and status_code != 429
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            raise ConnectionError("Client disconnected")
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+async def _send_json(send, status_code: int, detail: str, headers: List[Tuple[bytes, bytes]] = ()):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *headers
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _replay(send, stored: dict):
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored["headers"]]
+    headers.append((REPLAYED_HEADER, b"true"))
+    await send({"type": "http.response.start", "status": stored["status"], "headers": headers})
+    await send({"type": "http.response.body", "body": base64.b64decode(stored["body"])})
+
+class IdempotencyMiddleware:
+    """
+    Handles the Idempotency-Key header on IDEMPOTENT_ROUTES before routing,
+    so a replayed response costs no database reads. Plain ASGI, like
+    MetricsMiddleware; requests without the header pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        raw_key = _header(scope, IDEMPOTENCY_HEADER)
+        if raw_key is None or not any(
+            scope["method"] == method and pattern.match(scope["path"]) for method, pattern in IDEMPOTENT_ROUTES
+        ):
+            await self.app(scope, receive, send)
+            return
+        caller = _caller(scope)
+        if caller is None:
+            await self.app(scope, receive, send)  # The endpoint rejects it
+            return
+        if not raw_key or len(raw_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+            return
+
+        body = await _read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        key = hashlib.sha256(b"\n".join([
+            caller.encode(), scope["method"].encode(), scope["path"].encode(), raw_key
+        ])).hexdigest()
+
+        try:
+            stored = await idempotency_store.claim(key, settings.IDEMPOTENCY_WAIT_SECONDS)
+        except IdempotencyBusy:
+            IDEMPOTENCY_REQUESTS.labels("busy").inc()
+            await _send_json(send, 409, "A request with this Idempotency-Key is still in progress", [
+                (b"retry-after", b"1")
+            ])
+            return
+        if stored is not None:
+            if stored["fingerprint"] != fingerprint:
+                IDEMPOTENCY_REQUESTS.labels("mismatch").inc()
+                await _send_json(send, 422, "Idempotency-Key was already used with a different request body")
+                return
+            IDEMPOTENCY_REQUESTS.labels("replayed").inc()
+            await _replay(send, stored)
+            return
+
+        IDEMPOTENCY_REQUESTS.labels("new").inc()
+        response = {"status": 500, "headers": [], "body": b"", "fingerprint": fingerprint}
+        body_sent = False
+
+        async def receive_wrapper():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    (name.decode("latin-1"), value.decode("latin-1")) for name, value in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        completed = False
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+            completed = _storable(response["status"])
+        finally:
+            if completed:
+                response["body"] = base64.b64encode(response["body"]).decode()
+                await idempotency_store.complete(key, response)
+            else:
+                await idempotency_store.release(key)
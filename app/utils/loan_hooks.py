@@ -0,0 +1,83 @@
+from ..models.loan import StatusChange
+from typing import List, Tuple
+from .borrower_history import record_loan_created, record_loans_created, record_status_change, record_status_changes
+from .loan_stats import (
+    record_loan_created_stats,
+    record_loans_created_stats,
+    record_status_transition_stats,
+    record_status_transitions_stats
+)
+from .cache import invalidate_loans
+from .events import publish, loan_created_event, status_changed_event, loan_scored_event
+from ..repositories.loan_events import insert_loan_events, loan_event
+
+# Bookkeeping that has to follow every loan write: the loan_events log,
+# borrower summaries, stats counters, cache versions and dashboard events
+
+def loan_owner(loan: dict):
+    return loan.get("user_email", loan.get("email"))
+
+async def after_loan_created(db, loan: dict):
+    await insert_loan_events(db, [loan_event(loan, change) for change in loan.get("status_history", [])])
+    await record_loan_created(db, loan_owner(loan), loan["_id"], loan["status"], loan["created_at"])
+    await record_loan_created_stats(db, loan["status"], loan.get("amount", 0), loan["created_at"])
+    await invalidate_loans(loan_owner(loan))
+    await publish(loan_created_event(loan))
+
+async def after_loans_created(db, loans: List[dict]):
+    """after_loan_created for a batch, with one write per collection instead of per loan"""
+    await insert_loan_events(db, [
+        loan_event(loan, change) for loan in loans for change in loan.get("status_history", [])
+    ])
+    await record_loans_created(db, loans)
+    await record_loans_created_stats(db, loans)
+    await invalidate_loans(*{loan_owner(loan) for loan in loans})
+    await publish(*[loan_created_event(loan) for loan in loans])
+
+async def after_status_change(db, loan: dict, previous_status, status_change: StatusChange):
+    await insert_loan_events(db, [loan_event(loan, status_change.model_dump(), previous_status)])
+    await record_status_change(
+        db,
+        loan_owner(loan),
+        loan["_id"],
+        previous_status,
+        status_change.status,
+        status_change.changed_at
+    )
+    await record_status_transition_stats(
+        db,
+        previous_status,
+        status_change.status,
+        loan.get("amount", 0),
+        status_change.changed_at
+    )
+    await invalidate_loans(loan_owner(loan))
+    await publish(status_changed_event(loan, previous_status, status_change.status, status_change.changed_at))
+
+async def after_status_changes(db, changes: List[Tuple[dict, object, StatusChange]]):
+    """after_status_change for a batch of (loan, previous status, change)"""
+    await insert_loan_events(db, [
+        loan_event(loan, change.model_dump(), previous_status) for loan, previous_status, change in changes
+    ])
+    await record_status_changes(db, [
+        (loan_owner(loan), loan["_id"], previous_status, change.status, change.changed_at)
+        for loan, previous_status, change in changes
+    ])
+    await record_status_transitions_stats(db, [
+        (previous_status, change.status, loan.get("amount", 0), change.changed_at)
+        for loan, previous_status, change in changes
+    ])
+    await invalidate_loans(*{loan_owner(loan) for loan, _, _ in changes})
+    await publish(*[
+        status_changed_event(loan, previous_status, change.status, change.changed_at)
+        for loan, previous_status, change in changes
+    ])
+
+async def after_loan_scored(db, loan: dict):
+    await invalidate_loans(loan_owner(loan))
+    await publish(loan_scored_event(loan))
+
+async def after_loans_scored(db, loans: List[dict]):
+    """after_loan_scored for a batch"""
+    await invalidate_loans(*{loan_owner(loan) for loan in loans})
+    await publish(*[loan_scored_event(loan) for loan in loans])
@@ -0,0 +1,208 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+from pymongo import UpdateOne
+from ..dependencies.indexes import declare_query
+from ..models.loan import LoanStatus
+
+# loan_stats holds one document, {_id: "totals", statuses: {<status>: {count, total_amount}}},
+# with the current number and amount of loans in each status.
+# loan_stats_daily holds one document per day, {_id: "YYYY-MM-DD", statuses: {...}},
+# counting the loans that entered each status on that day. A change that leaves
+# the status as it was, like a queued application scored and left pending,
+# enters nothing and counts nowhere.
+TOTALS_ID = "totals"
+
+declare_query("loan_stats", {"_id": TOTALS_ID})
+declare_query("loan_stats_daily", {"_id": {"$gte": "2024-01-01"}}, sort=[("_id", 1)])
+
+def _day(at: datetime) -> str:
+    return at.strftime("%Y-%m-%d")
+
+def _status(value) -> str:
+    return value.value if isinstance(value, LoanStatus) else value
+
+async def record_loan_created_stats(db, status, amount: float, created_at: datetime):
+    status = _status(status)
+    increments = {
+        f"statuses.{status}.count": 1,
+        f"statuses.{status}.total_amount": amount
+    }
+    await db.loan_stats.update_one({"_id": TOTALS_ID}, {"$inc": increments}, upsert=True)
+    await db.loan_stats_daily.update_one({"_id": _day(created_at)}, {"$inc": increments}, upsert=True)
+
+async def record_loans_created_stats(db, loans: List[dict]):
+    """record_loan_created_stats for a batch of new loans, one write per day touched"""
+    totals = defaultdict(int)
+    daily = defaultdict(lambda: defaultdict(int))
+    for loan in loans:
+        status = _status(loan["status"])
+        for increments in (totals, daily[_day(loan["created_at"])]):
+            increments[f"statuses.{status}.count"] += 1
+            increments[f"statuses.{status}.total_amount"] += loan.get("amount", 0)
+    if not totals:
+        return
+    await db.loan_stats.update_one({"_id": TOTALS_ID}, {"$inc": dict(totals)}, upsert=True)
+    await db.loan_stats_daily.bulk_write(
+        [
+            UpdateOne({"_id": day}, {"$inc": dict(increments)}, upsert=True)
+            for day, increments in daily.items()
+        ],
+        ordered=False
+    )
+
+async def record_status_transition_stats(db, old_status, new_status, amount: float, changed_at: datetime):
+    old_status, new_status = _status(old_status), _status(new_status)
+    if old_status == new_status:
+        return
+    entered = {
+        f"statuses.{new_status}.count": 1,
+        f"statuses.{new_status}.total_amount": amount
+    }
+    await db.loan_stats.update_one(
+        {"_id": TOTALS_ID},
+        {
+            "$inc": {
+                **entered,
+                f"statuses.{old_status}.count": -1,
+                f"statuses.{old_status}.total_amount": -amount
+            }
+        },
+        upsert=True
+    )
+    await db.loan_stats_daily.update_one({"_id": _day(changed_at)}, {"$inc": entered}, upsert=True)
+
+async def record_status_transitions_stats(db, transitions: List[tuple]):
+    """record_status_transition_stats for a batch of (old status, new status, amount, changed at)"""
+    totals = defaultdict(int)
+    daily = defaultdict(lambda: defaultdict(int))
+    for old_status, new_status, amount, changed_at in transitions:
+        old_status, new_status = _status(old_status), _status(new_status)
+        if old_status == new_status:
+            continue
+        daily_increments = daily[_day(changed_at)]
+        daily_increments[f"statuses.{new_status}.count"] += 1
+        daily_increments[f"statuses.{new_status}.total_amount"] += amount
+        totals[f"statuses.{new_status}.count"] += 1
+        totals[f"statuses.{new_status}.total_amount"] += amount
+        totals[f"statuses.{old_status}.count"] -= 1
+        totals[f"statuses.{old_status}.total_amount"] -= amount
+    if totals:
+        await db.loan_stats.update_one({"_id": TOTALS_ID}, {"$inc": dict(totals)}, upsert=True)
+    if daily:
+        await db.loan_stats_daily.bulk_write(
+            [
+                UpdateOne({"_id": day}, {"$inc": dict(increments)}, upsert=True)
+                for day, increments in daily.items()
+            ],
+            ordered=False
+        )
+
+def format_stats(totals: dict) -> dict:
+    """Shape stored totals like the $group output the stats endpoint has always returned"""
+    statuses = (totals or {}).get("statuses", {})
+    loan_stats = [
+        {"_id": status, "count": values.get("count", 0), "total_amount": values.get("total_amount", 0)}
+        for status, values in sorted(statuses.items())
+        if values.get("count", 0)
+    ]
+    return {
+        "loan_stats": loan_stats,
+        "total_loans": sum(stat["count"] for stat in loan_stats),
+        "total_amount": sum(stat["total_amount"] for stat in loan_stats)
+    }
+
+async def read_loan_stats(db) -> dict:
+    return format_stats(await db.loan_stats.find_one({"_id": TOTALS_ID}))
+
+async def read_daily_stats(db, days: int) -> List[dict]:
+    since = _day(datetime.utcnow() - timedelta(days=days - 1))
+    cursor = db.loan_stats_daily.find({"_id": {"$gte": since}}).sort("_id", 1)
+    return [
+        {"date": bucket["_id"], "statuses": bucket.get("statuses", {})}
+        for bucket in await cursor.to_list(length=days)
+    ]
+
+async def _compute_totals(db) -> Dict[str, dict]:
+    pipeline = [
+        {
+            "$group": {
+                "_id": "$status",
+                "count": {"$sum": 1},
+                "total_amount": {"$sum": "$amount"}
+            }
+        }
+    ]
+    rows = await db.loans.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    return {row["_id"]: {"count": row["count"], "total_amount": row["total_amount"]} for row in rows}
+
+async def _compute_daily(db) -> Dict[str, Dict[str, dict]]:
+    # Loans only embed their latest status changes, so count from the full log,
+    # leaving out the changes that kept the status it had
+    pipeline = [
+        {"$match": {"$expr": {"$ne": ["$status", "$previous_status"]}}},
+        {
+            "$group": {
+                "_id": {
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$changed_at"}},
+                    "status": "$status"
+                },
+                "count": {"$sum": 1},
+                "total_amount": {"$sum": "$amount"}
+            }
+        }
+    ]
+    rows = await db.loan_events.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    daily = {}
+    for row in rows:
+        daily.setdefault(row["_id"]["day"], {})[row["_id"]["status"]] = {
+            "count": row["count"],
+            "total_amount": row["total_amount"]
+        }
+    return daily
+
+def _drift(expected: Dict[str, dict], stored: Dict[str, dict]) -> Dict[str, dict]:
+    drift = {}
+    for status in set(expected) | set(stored):
+        want = expected.get(status, {})
+        have = stored.get(status, {})
+        count_drift = have.get("count", 0) - want.get("count", 0)
+        amount_drift = round(have.get("total_amount", 0) - want.get("total_amount", 0), 2)
+        if count_drift or amount_drift:
+            drift[status] = {"count": count_drift, "total_amount": amount_drift}
+    return drift
+
+async def reconcile_loan_stats(db, fix: bool = False) -> dict:
+    """
+    Recompute the counters from the loans collection and report how far the
+    stored ones have drifted (stored minus recomputed)
+    With fix set the stored counters are replaced by the recomputed ones.
+    Writes made while this runs show up as drift, so fix while the app is idle.
+    """
+    totals = await _compute_totals(db)
+    stored_totals = (await db.loan_stats.find_one({"_id": TOTALS_ID}) or {}).get("statuses", {})
+
+    daily = await _compute_daily(db)
+    stored_daily = {
+        bucket["_id"]: bucket.get("statuses", {})
+        for bucket in await db.loan_stats_daily.find({}).to_list(length=None)
+    }
+
+    report = {
+        "totals": _drift(totals, stored_totals),
+        "daily": {}
+    }
+    for day in sorted(set(daily) | set(stored_daily)):
+        day_drift = _drift(daily.get(day, {}), stored_daily.get(day, {}))
+        if day_drift:
+            report["daily"][day] = day_drift
+
+    if fix:
+        await db.loan_stats.replace_one({"_id": TOTALS_ID}, {"statuses": totals}, upsert=True)
+        await db.loan_stats_daily.delete_many({})
+        if daily:
+            await db.loan_stats_daily.insert_many(
+                [{"_id": day, "statuses": statuses} for day, statuses in daily.items()]
+            )
+    report["fixed"] = fix
+    return report
@@ -0,0 +1,276 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    REGISTRY
+)
+from pymongo import monitoring
+from ..config import settings
+
+# Labels only ever hold route templates, command and collection names and
+# other fixed sets, never ids or emails, so every series count stays bounded.
+UNMATCHED_ROUTE = "unmatched"
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route template and status code",
+    ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the end of its response; event streams are not observed",
+    ["method", "route"]
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled, including open event streams",
+    multiprocess_mode="livesum"
+)
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command round trips as reported by the driver",
+    ["command", "collection", "outcome"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "mongodb_pool_connections_checked_out",
+    "MongoDB connections in use by this worker",
+    multiprocess_mode="livesum"
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongodb_pool_checkout_failures_total",
+    "Failed connection checkouts; timeout means the pool stayed exhausted for MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    ["reason"]
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Response cache lookups",
+    ["result"]
+)
+CACHE_INVALIDATIONS = Counter(
+    "cache_invalidations_total",
+    "Response cache namespace version bumps"
+)
+RATE_LIMIT_DECISIONS = Counter(
+    "rate_limit_decisions_total",
+    "Admission decisions: allowed, limited_ip or limited_user (429), or busy (503, concurrency cap)",
+    ["route", "outcome"]
+)
+RATE_LIMIT_DECISION_LATENCY = Histogram(
+    "rate_limit_decision_duration_seconds",
+    "Time to check the token buckets of one request",
+    buckets=(.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025)
+)
+IDEMPOTENCY_REQUESTS = Counter(
+    "idempotency_requests_total",
+    "Requests with an Idempotency-Key: new, replayed, mismatch (same key, other body) or busy (still running)",
+    ["outcome"]
+)
+SCORING_LATENCY = Histogram(
+    "scoring_duration_seconds",
+    "Credit scoring calls; batch calls score many loans at once",
+    ["mode"],
+    buckets=(.00001, .00005, .0001, .0005, .001, .005, .01, .05, .1, .5, 1)
+)
+SCORED_LOANS = Counter(
+    "scoring_loans_total",
+    "Loans scored",
+    ["mode"]
+)
+SCORING_QUEUE_DEPTH = Gauge(
+    "scoring_queue_depth",
+    "Applications waiting for the scoring worker; with the redis backend every worker reports the shared stream",
+    multiprocess_mode="liveall"
+)
+SCORING_QUEUE_REJECTED = Counter(
+    "scoring_queue_rejected_total",
+    "Applications refused because the scoring queue was full"
+)
+SCORING_QUEUE_WAIT = Histogram(
+    "scoring_queue_wait_seconds",
+    "Time from a queued application being stored to its score being written",
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300)
+)
+SCORING_QUEUE_RETRIES = Counter(
+    "scoring_queue_retries_total",
+    "Queued applications whose scoring failed, by whether they will be retried",
+    ["outcome"]
+)
+PASSWORD_HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt calls, including the wait for a free worker",
+    ["operation"],
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke a sleeping task; high values mean blocking work on the loop",
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+)
+
+def route_label(scope: dict) -> str:
+    """The template of the matched route, e.g. /loans/{loan_id}"""
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE) if route is not None else UNMATCHED_ROUTE
+
+class MetricsMiddleware:
+    """
+    Counts and times every HTTP request by route template
+    Plain ASGI rather than BaseHTTPMiddleware, which would add a task and
+    a memory stream to every request and buffer streamed responses
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # Label lookups take a lock and build a tuple; keep the children per series
+        self._series: Dict[Tuple[str, str, int], tuple] = {}
+
+    def _children(self, method: str, route: str, status_code: int) -> tuple:
+        key = (method, route, status_code)
+        children = self._series.get(key)
+        if children is None:
+            children = self._series[key] = (
+                HTTP_REQUESTS.labels(method, route, str(status_code)),
+                HTTP_LATENCY.labels(method, route)
+            )
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Routing has run by now and left the matched route in the scope
+            requests, latency = self._children(scope["method"], route_label(scope), status_code)
+            requests.inc()
+            if not streaming:
+                latency.observe(time.perf_counter() - start)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Times every command the driver sends; pass it to the client's event_listeners
+    Called on the driver's threads, and prometheus_client metrics are thread safe
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[object, int], str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")  # getMore
+        self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, outcome: str):
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        MONGO_LATENCY.labels(event.command_name, collection, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+mongo_command_metrics = MongoCommandMetrics()
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks connections checked out of the driver's pools, for metrics and the readiness check"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.checkout_timeouts = 0
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+        MONGO_POOL_CHECKED_OUT.inc()
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+        MONGO_POOL_CHECKED_OUT.dec()
+
+    def connection_check_out_failed(self, event):
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            with self._lock:
+                self.checkout_timeouts += 1
+        MONGO_POOL_CHECKOUT_FAILURES.labels(event.reason).inc()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+mongo_pool_metrics = MongoPoolMetrics()
+
+async def watch_loop_lag(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(loop.time() - start - interval, 0))
+
+def start_loop_lag_monitor() -> Optional[asyncio.Task]:
+    if settings.METRICS_LOOP_LAG_INTERVAL <= 0:
+        return None
+    return asyncio.create_task(watch_loop_lag(settings.METRICS_LOOP_LAG_INTERVAL))
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    The exposition text and its content type
+    With several workers set PROMETHEUS_MULTIPROC_DIR so every worker's
+    samples are merged instead of showing whichever worker answered
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
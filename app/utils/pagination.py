@@ -0,0 +1,44 @@
+import base64
+from typing import Any, Tuple
+from bson import json_util
+
+def encode_cursor(sort_value: Any, last_id) -> str:
+    """Opaque cursor holding the sort key of the last item of a page"""
+    raw = json_util.dumps([sort_value, last_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """Raises ValueError for cursors that were not produced by encode_cursor"""
+    try:
+        sort_value, last_id = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    return sort_value, last_id
+
+def keyset_filter(sort_field: str, sort_value: Any, last_id) -> dict:
+    """
+    Filter selecting the items after (sort_value, last_id) in
+    descending (sort_field, _id) order
+    Missing values sort last, so they follow every present value
+    """
+    if sort_value is None:
+        return {sort_field: None, "_id": {"$lt": last_id}}
+    return {
+        "$or": [
+            {sort_field: {"$lt": sort_value}},
+            {sort_field: sort_value, "_id": {"$lt": last_id}},
+            {sort_field: None}
+        ]
+    }
+
+def keyset_filter_after(sort_field: str, sort_value: Any, last_id) -> dict:
+    """
+    Filter selecting the items after (sort_value, last_id) in
+    ascending (sort_field, _id) order, for fields that are always set
+    """
+    return {
+        "$or": [
+            {sort_field: {"$gt": sort_value}},
+            {sort_field: sort_value, "_id": {"$gt": last_id}}
+        ]
+    }
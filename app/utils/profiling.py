@@ -0,0 +1,279 @@
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import monitoring
+from ..config import settings
+from .auth import admin_from_token
+from .metrics import route_label
+
+# Admins send this header (any value) to profile one request
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+# A sample belongs to the category of its outermost frame from one of these
+# modules, so pydantic checks made while encoding a response count as
+# serialization and a handler building models counts as validation
+CATEGORIES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("validation", ("pydantic",)),
+    ("serialization", ("fastapi.encoders", "json", "orjson", "starlette.responses", "app.utils.serialization")),
+    ("mongo", ("motor", "pymongo", "bson")),
+    ("idle", ("selectors",)),  # The loop waiting for I/O
+]
+MAX_STACK_DEPTH = 64
+MAX_MONGO_COMMANDS = 200
+
+class RequestProfile:
+    """What one request spent its time on"""
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = str(ObjectId())
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.trigger = trigger  # "header" or "sampled"
+        self.started_at = datetime.utcnow()
+        self.duration_ms = 0.0
+        self.status: Optional[int] = None
+        self.stacks: Counter = Counter()  # Folded stack, outermost frame first -> samples
+        self.sample_interval_ms: Optional[float] = None
+        self.mongo_commands: List[dict] = []
+        self.mongo_count = 0
+        self.mongo_ms = 0.0
+        self._pending: Dict[Tuple[object, int], Tuple[str, str, float]] = {}
+        self._start = time.perf_counter()
+
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds of event loop time per category, estimated from the stack samples"""
+        total = sum(self.stacks.values())
+        if not total:
+            return {}
+        per_sample = self.duration_ms / total
+        totals = Counter()
+        for stack, count in self.stacks.items():
+            totals[_categorise(stack)] += count
+        return {category: round(count * per_sample, 2) for category, count in totals.most_common()}
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 2),
+            "mongo_count": self.mongo_count,
+            "mongo_ms": round(self.mongo_ms, 2)
+        }
+
+    def report(self, top: int = 50) -> dict:
+        return {
+            **self.summary(),
+            "breakdown_ms": self.breakdown(),
+            "sample_interval_ms": self.sample_interval_ms,
+            "samples": sum(self.stacks.values()),
+            "top_stacks": [
+                {"stack": stack.split(";"), "samples": count}
+                for stack, count in self.stacks.most_common(top)
+            ],
+            "mongo_commands": self.mongo_commands
+        }
+
+    def folded(self) -> str:
+        """The samples in the collapsed format read by flamegraph tools"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def _categorise(stack: str) -> str:
+    for frame in stack.split(";"):
+        module = frame.split(":", 1)[0]
+        for category, prefixes in CATEGORIES:
+            if any(module == prefix or module.startswith(prefix + ".") for prefix in prefixes):
+                return category
+    return "other"
+
+# The profile of the request being handled; Motor copies the context into
+# its executor threads, so the Mongo listener sees it too
+_active_profile: ContextVar[Optional[RequestProfile]] = ContextVar("active_profile", default=None)
+
+class ProfileCommandListener(monitoring.CommandListener):
+    """Records the Mongo commands of profiled requests; a no-op for the others"""
+
+    def started(self, event):
+        profile = _active_profile.get()
+        if profile is None:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")
+        profile._pending[(event.connection_id, event.request_id)] = (
+            event.command_name, collection, (time.perf_counter() - profile._start) * 1000
+        )
+
+    def _finish(self, event, ok: bool):
+        profile = _active_profile.get()
+        if profile is None:
+            return
+        command, collection, at_ms = profile._pending.pop(
+            (event.connection_id, event.request_id), (event.command_name, "", None)
+        )
+        duration_ms = event.duration_micros / 1000
+        profile.mongo_count += 1
+        profile.mongo_ms += duration_ms
+        if len(profile.mongo_commands) < MAX_MONGO_COMMANDS:
+            profile.mongo_commands.append({
+                "command": command,
+                "collection": collection,
+                "at_ms": round(at_ms, 2) if at_ms is not None else None,
+                "duration_ms": round(duration_ms, 3),
+                "ok": ok
+            })
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+profile_command_listener = ProfileCommandListener()
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of one thread (the event loop's) at a fixed interval
+    The loop also runs other requests' coroutines, so under concurrent load
+    a profile includes some of their work too
+    """
+
+    def __init__(self, thread_id: int, interval: float, stacks: Counter):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = stacks
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None and len(frames) < MAX_STACK_DEPTH:
+                frames.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    async def stop(self):
+        """Stop sampling; joined off the loop, which would otherwise wait out a sample"""
+        self._stopped.set()
+        await asyncio.to_thread(self.join)
+
+class ProfileStore:
+    """The last `size` profiles of this worker"""
+
+    def __init__(self, size: int):
+        self.profiles: Deque[RequestProfile] = deque(maxlen=size)
+
+    def add(self, profile: RequestProfile):
+        self.profiles.append(profile)
+
+    def list(self) -> List[dict]:
+        return [profile.summary() for profile in reversed(self.profiles)]
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return next((profile for profile in self.profiles if profile.id == profile_id), None)
+
+profile_store = ProfileStore(settings.PROFILE_BUFFER_SIZE)
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+def _event_stream(headers) -> bool:
+    return any(
+        name.lower() in (b"accept", b"content-type") and value.startswith(b"text/event-stream")
+        for name, value in headers
+    )
+
+class ProfilingMiddleware:
+    """
+    Profiles requests that carry the X-Profile header with an admin token,
+    and a PROFILE_SAMPLE_RATE share of all requests
+    Only added to the app when PROFILING_ENABLED is set, so it costs nothing
+    otherwise. One request is stack-sampled at a time; others profiled
+    meanwhile still get their timings and Mongo commands. Server-sent event
+    streams are never profiled: they last as long as the client stays
+    connected, and would hold the sampler all that time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._sampling = False
+
+    async def _trigger(self, scope) -> Optional[str]:
+        if _header(scope, PROFILE_HEADER) is not None:
+            authorization = (_header(scope, b"authorization") or b"").decode("latin-1")
+            scheme, _, token = authorization.partition(" ")
+            if scheme.lower() == "bearer" and await admin_from_token(scope["app"].mongodb, token):
+                return "header"
+        if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _event_stream(scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+        trigger = await self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], trigger)
+        sampler = None
+        streaming = False
+
+        async def stop_sampling():
+            nonlocal sampler
+            if sampler is not None:
+                running, sampler = sampler, None
+                await running.stop()
+                self._sampling = False
+
+        async def send_wrapper(message):
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                # An event stream the client did not ask for by its Accept header
+                streaming = _event_stream(message.get("headers", []))
+                if streaming:
+                    await stop_sampling()
+                else:
+                    headers = list(message.get("headers", []))
+                    headers.append((PROFILE_ID_HEADER, profile.id.encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        if not self._sampling:
+            self._sampling = True
+            sampler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL, profile.stacks)
+            profile.sample_interval_ms = settings.PROFILE_SAMPLE_INTERVAL * 1000
+            sampler.start()
+        token = _active_profile.set(profile)
+        profile._start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration_ms = (time.perf_counter() - profile._start) * 1000
+            _active_profile.reset(token)
+            await stop_sampling()
+            if not streaming:
+                profile.route = route_label(scope)
+                profile_store.add(profile)
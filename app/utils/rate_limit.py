@@ -0,0 +1,227 @@
+import logging
+import math
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+from ..config import settings
+from .auth import get_current_user
+from .metrics import RATE_LIMIT_DECISIONS, RATE_LIMIT_DECISION_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Admission control for the expensive endpoints: every request spends a token
+# from a per-IP and a per-user bucket, and waits for none; an empty bucket is
+# a 429 with Retry-After. Requests that get through also count against a
+# per-worker cap on concurrent requests to the route, which answers 503 when
+# reached. Buckets live in Redis, updated by one Lua script per decision, or
+# in this process with RATE_LIMIT_BACKEND=memory and while Redis is down.
+
+class Rate(NamedTuple):
+    capacity: float  # Burst size
+    per_second: float  # Refill rate
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+def parse_rate(spec: str) -> Optional[Rate]:
+    """'30/minute' is a bucket of 30 refilled at 30 per minute; '' means no limit"""
+    if not spec:
+        return None
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(second|minute|hour|day)\s*", spec)
+    if match is None:
+        raise ValueError(f"Invalid rate {spec!r}, expected e.g. '30/minute'")
+    count = int(match.group(1))
+    return Rate(count, count / PERIODS[match.group(2)])
+
+class RouteLimits(NamedTuple):
+    per_ip: Optional[Rate]
+    per_user: Optional[Rate]
+    max_concurrent: int  # 0 means no cap
+
+# Every key's bucket is refilled for the time since it was last touched, then
+# one token is taken from each, only if all of them have one. Returns
+# {allowed, index of the first empty bucket, milliseconds until it has a token}.
+# KEYS: bucket keys; ARGV: now in ms, then capacity and tokens per ms per key
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens = {}
+local denied, wait = 0, 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    tokens[i] = level
+    if level < 1 and denied == 0 then
+        denied = i
+        wait = math.ceil((1 - level) / rate)
+    end
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local level = tokens[i]
+    if denied == 0 then
+        level = level - 1
+    end
+    redis.call('HMSET', key, 'tokens', tostring(level), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil((capacity - level) / rate) + 1000)
+end
+if denied == 0 then
+    return {1, 0, 0}
+end
+return {0, denied - 1, wait}
+"""
+
+class Decision(NamedTuple):
+    allowed: bool
+    limited: Optional[int] = None  # Index of the bucket that was empty
+    retry_after: float = 0  # Seconds
+
+class MemoryRateLimiter:
+    """Token buckets local to this worker, oldest forgotten beyond max_buckets"""
+
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def check(self, buckets: List[Tuple[str, Rate]]) -> Decision:
+        now = time.monotonic()
+        levels = []
+        decision = Decision(True)
+        for index, (key, rate) in enumerate(buckets):
+            level, updated_at = self._buckets.get(key, (rate.capacity, now))
+            level = min(rate.capacity, level + (now - updated_at) * rate.per_second)
+            levels.append(level)
+            if level < 1 and decision.allowed:
+                decision = Decision(False, index, (1 - level) / rate.per_second)
+        for (key, _), level in zip(buckets, levels):
+            self._buckets[key] = (level - 1 if decision.allowed else level, now)
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return decision
+
+class RedisRateLimiter:
+    """Token buckets shared by every worker, one script call per decision"""
+
+    def __init__(self, redis, fallback: MemoryRateLimiter, prefix: str = "rate-limit"):
+        self.redis = redis
+        self.fallback = fallback
+        self.prefix = prefix
+        self.script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self._warned_at = 0.0
+
+    async def check(self, buckets: List[Tuple[str, Rate]]) -> Decision:
+        args = [int(time.time() * 1000)]
+        for _, rate in buckets:
+            args += [rate.capacity, rate.per_second / 1000]
+        try:
+            allowed, limited, wait_ms = await self.script(
+                keys=[f"{self.prefix}:{key}" for key, _ in buckets], args=args
+            )
+        except Exception:
+            if time.monotonic() - self._warned_at > 60:
+                self._warned_at = time.monotonic()
+                logger.warning("Rate limit check failed, using local buckets", exc_info=True)
+            return await self.fallback.check(buckets)
+        if allowed:
+            return Decision(True)
+        return Decision(False, int(limited), int(wait_ms) / 1000)
+
+class ConcurrencyLimit:
+    """Requests to one route in progress in this worker"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.limit and self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+ROUTE_LIMITS: Dict[str, RouteLimits] = {
+    "login": RouteLimits(
+        parse_rate(settings.RATE_LIMIT_LOGIN_PER_IP),
+        parse_rate(settings.RATE_LIMIT_LOGIN_PER_USER),
+        settings.RATE_LIMIT_LOGIN_MAX_CONCURRENT
+    ),
+    "apply": RouteLimits(
+        parse_rate(settings.RATE_LIMIT_APPLY_PER_IP),
+        parse_rate(settings.RATE_LIMIT_APPLY_PER_USER),
+        settings.RATE_LIMIT_APPLY_MAX_CONCURRENT
+    )
+}
+concurrency_limits = {route: ConcurrencyLimit(limits.max_concurrent) for route, limits in ROUTE_LIMITS.items()}
+rate_limiter = MemoryRateLimiter(settings.RATE_LIMIT_MAX_LOCAL_BUCKETS)
+
+def configure_rate_limiter(redis=None):
+    """Share buckets across workers through Redis when RATE_LIMIT_BACKEND is redis"""
+    global rate_limiter
+    if settings.RATE_LIMIT_BACKEND == "redis" and redis is not None:
+        rate_limiter = RedisRateLimiter(redis, MemoryRateLimiter(settings.RATE_LIMIT_MAX_LOCAL_BUCKETS))
+
+def client_ip(request: Request) -> str:
+    # Behind a proxy uvicorn puts the forwarded address here (--forwarded-allow-ips)
+    return request.client.host if request.client else "unknown"
+
+@asynccontextmanager
+async def admit(request: Request, route: str, user: Optional[str]):
+    """Take a token for the caller's IP and user, and a concurrency slot for the route"""
+    if not settings.RATE_LIMIT_ENABLED:
+        yield
+        return
+    limits = ROUTE_LIMITS[route]
+    buckets, scopes = [], []
+    if limits.per_ip:
+        buckets.append((f"{route}:ip:{client_ip(request)}", limits.per_ip))
+        scopes.append("ip")
+    if limits.per_user and user:
+        buckets.append((f"{route}:user:{user.lower()}", limits.per_user))
+        scopes.append("user")
+
+    if buckets:
+        start = time.perf_counter()
+        decision = await rate_limiter.check(buckets)
+        RATE_LIMIT_DECISION_LATENCY.observe(time.perf_counter() - start)
+        if not decision.allowed:
+            RATE_LIMIT_DECISIONS.labels(route, f"limited_{scopes[decision.limited]}").inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": str(max(1, math.ceil(decision.retry_after)))}
+            )
+
+    concurrency = concurrency_limits[route]
+    if not concurrency.try_acquire():
+        RATE_LIMIT_DECISIONS.labels(route, "busy").inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry",
+            headers={"Retry-After": "1"}
+        )
+    RATE_LIMIT_DECISIONS.labels(route, "allowed").inc()
+    try:
+        yield
+    finally:
+        concurrency.release()
+
+async def limit_login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    """Admission for POST /auth/token; the user is the username being tried"""
+    async with admit(request, "login", form_data.username):
+        yield
+
+async def limit_apply(request: Request, current_user: dict = Depends(get_current_user)):
+    """Admission for POST /loans/apply"""
+    async with admit(request, "apply", current_user["email"]):
+        yield
@@ -0,0 +1,209 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
+from ..config import settings
+from ..dependencies.indexes import declare_query
+from ..models.loan import LoanStatus
+from ..models.rescore import RescoreFilter, RescoreJobStatus
+from ..repositories.loans import SAMPLE_LOAN_FILTERS, build_loan_query
+from .credit_scoring import score_batch
+from .cache import invalidate, LOANS_NAMESPACE, USERS_NAMESPACE
+from .events import publish, RESYNC
+
+logger = logging.getLogger(__name__)
+
+# Only the fields the scorer needs are read from the loans collection
+SCORING_PROJECTION = {
+    "amount": 1,
+    "duration_months": 1,
+    "purpose": 1,
+    "status": 1,
+    "user_email": 1,
+    "email": 1
+}
+
+# Query shapes used by rescore jobs; loans.user_email is indexed by the loans router
+declare_query("loans", {"user_email": {"$in": ["borrower@example.com"]}})
+for sample_filter in SAMPLE_LOAN_FILTERS:
+    declare_query("loans", {**build_loan_query(sample_filter), "_id": {"$gt": ObjectId()}}, sort=[("_id", 1)])
+declare_query("rescore_jobs", {"_id": ObjectId()})
+
+async def load_history_counts(db, emails: Optional[List[str]] = None) -> Dict[str, Tuple[int, int]]:
+    """
+    Count loans and approved loans per borrower in one aggregation,
+    for the given borrowers or for all of them
+    Returns {email: (total loans, approved loans)}
+    """
+    pipeline = [
+        {"$match": {"user_email": {"$in": emails}} if emails is not None else {}},
+        {
+            "$group": {
+                "_id": "$user_email",
+                "total": {"$sum": 1},
+                "approved": {
+                    "$sum": {"$cond": [{"$eq": ["$status", LoanStatus.APPROVED.value]}, 1, 0]}
+                }
+            }
+        }
+    ]
+    counts = await db.loans.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    return {row["_id"]: (row["total"], row["approved"]) for row in counts}
+
+def scoring_columns(loans: List[dict], history: Dict[str, Tuple[int, int]]) -> tuple:
+    """
+    The score_batch arguments for loan documents read with SCORING_PROJECTION,
+    each loan counted against all other loans of its borrower
+    history is the output of load_history_counts
+    """
+    previous_counts = []
+    approved_counts = []
+    for loan in loans:
+        total, approved = history.get(loan.get("user_email", loan.get("email")), (0, 0))
+        # The aggregation counted the loan itself when it is keyed by user_email
+        if "user_email" in loan:
+            total -= 1
+            if loan.get("status") == LoanStatus.APPROVED:
+                approved -= 1
+        previous_counts.append(total)
+        approved_counts.append(approved)
+    return (
+        [loan.get("amount", 0) for loan in loans],
+        [loan.get("duration_months", 0) for loan in loans],
+        [loan.get("purpose", "Not specified") for loan in loans],
+        previous_counts,
+        approved_counts
+    )
+
+async def rescore_loans(db, loans: List[dict]) -> int:
+    """
+    Rescore a batch of loan documents against all other loans of their borrower
+    and write the scores back with one unordered bulk write
+    Returns the number of modified loans
+    """
+    if not loans:
+        return 0
+
+    emails = list({loan.get("user_email", loan.get("email")) for loan in loans} - {None})
+    history = await load_history_counts(db, emails)
+    breakdown = score_batch(*scoring_columns(loans, history))
+
+    now = datetime.utcnow()
+    result = await db.loans.bulk_write(
+        [
+            UpdateOne(
+                {"_id": loan["_id"]},
+                {"$set": {
+                    "credit_score": float(score),
+                    "score_policy_version": breakdown.policy_version,
+                    "updated_at": now
+                }}
+            )
+            for loan, score in zip(loans, breakdown.total_score)
+        ],
+        ordered=False
+    )
+    return result.modified_count
+
+async def create_rescore_job(db, loan_filter: RescoreFilter, created_by: str) -> dict:
+    now = datetime.utcnow()
+    job = {
+        "filter": loan_filter.model_dump(),
+        "status": RescoreJobStatus.RUNNING,
+        "created_by": created_by,
+        "total": await db.loans.count_documents(build_loan_query(loan_filter)),
+        "processed": 0,
+        "updated": 0,
+        "last_id": None,
+        "started_at": now,
+        "updated_at": now
+    }
+    result = await db.rescore_jobs.insert_one(job)
+    job["_id"] = result.inserted_id
+    return job
+
+async def claim_rescore_job(db, job_id: str) -> dict:
+    """
+    Mark a failed or abandoned job as running again so it can be resumed
+    A running job counts as abandoned once its checkpoint is older than
+    RESCORE_STALE_AFTER_SECONDS
+    Returns None when the job is missing, finished or still alive
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.RESCORE_STALE_AFTER_SECONDS)
+    return await db.rescore_jobs.find_one_and_update(
+        {
+            "_id": ObjectId(job_id),
+            "$or": [
+                {"status": RescoreJobStatus.FAILED},
+                {"status": RescoreJobStatus.RUNNING, "updated_at": {"$lt": stale_before}}
+            ]
+        },
+        {
+            "$set": {
+                "status": RescoreJobStatus.RUNNING,
+                "updated_at": datetime.utcnow(),
+                "error": None
+            }
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+async def run_rescore_job(db, job_id: ObjectId):
+    """
+    Stream the loans matched by the job filter in _id order and rescore them batch by batch
+    The last processed _id is checkpointed after every batch so the job
+    can resume from there after a crash
+    """
+    job = await db.rescore_jobs.find_one({"_id": job_id})
+    loan_filter = RescoreFilter(**job["filter"])
+    batch_size = loan_filter.batch_size or settings.RESCORE_BATCH_SIZE
+    query = build_loan_query(loan_filter)
+    last_id = job.get("last_id")
+
+    try:
+        while True:
+            batch_query = dict(query)
+            if last_id is not None:
+                batch_query["_id"] = {"$gt": last_id}
+
+            cursor = db.loans.find(batch_query, SCORING_PROJECTION).sort("_id", 1).limit(batch_size)
+            loans = await cursor.to_list(length=batch_size)
+            if not loans:
+                break
+
+            modified = await rescore_loans(db, loans)
+            last_id = loans[-1]["_id"]
+            await db.rescore_jobs.update_one(
+                {"_id": job_id},
+                {
+                    "$set": {"last_id": last_id, "updated_at": datetime.utcnow()},
+                    "$inc": {"processed": len(loans), "updated": modified}
+                }
+            )
+            await invalidate(LOANS_NAMESPACE, USERS_NAMESPACE)
+
+        await db.rescore_jobs.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": RescoreJobStatus.COMPLETED,
+                    "updated_at": datetime.utcnow(),
+                    "finished_at": datetime.utcnow()
+                }
+            }
+        )
+        # Too many scores changed to send one by one
+        await publish(RESYNC)
+    except Exception as e:
+        logger.exception("Rescore job %s failed", job_id)
+        await db.rescore_jobs.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": RescoreJobStatus.FAILED,
+                    "updated_at": datetime.utcnow(),
+                    "error": str(e)
+                }
+            }
+        )
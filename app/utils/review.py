@@ -0,0 +1,86 @@
+from datetime import datetime
+from typing import List, Optional
+from bson import ObjectId
+from ..models.loan import BatchReviewItem, REVIEW_TRANSITIONS, StatusChange
+from ..repositories.loans import find_loans, find_loans_changed_by_batch, apply_status_changes
+from .loan_hooks import after_status_changes
+
+REVIEW_PROJECTION = {"status": 1, "amount": 1, "user_email": 1, "email": 1}
+
+def _failure(loan_id: str, error: str, previous_status=None) -> dict:
+    return {"loan_id": loan_id, "ok": False, "previous_status": previous_status, "error": error}
+
+async def review_loans_batch(db, items: List[BatchReviewItem], reviewer: str) -> List[dict]:
+    """
+    Apply many reviews with one read and one bulk_write
+    Each item must be a valid transition from the loan's current status, and
+    is only applied if that status has not changed since it was read.
+    Returns one result per item, in order.
+    """
+    changed_at = datetime.utcnow()
+    # Marks the loans this batch's write changed, whatever else writes at the same time
+    batch_id = ObjectId()
+
+    results: List[Optional[dict]] = [None] * len(items)
+    positions = {}
+    for position, item in enumerate(items):
+        if not ObjectId.is_valid(item.loan_id):
+            results[position] = _failure(item.loan_id, "Invalid loan id")
+        elif item.loan_id in positions:
+            results[position] = _failure(item.loan_id, "Loan appears more than once in the batch")
+        else:
+            positions[item.loan_id] = position
+
+    loans = {
+        str(loan["_id"]): loan
+        for loan in await find_loans(db, [ObjectId(loan_id) for loan_id in positions], REVIEW_PROJECTION)
+    }
+    changes = []
+    for loan_id, position in positions.items():
+        item = items[position]
+        loan = loans.get(loan_id)
+        if loan is None:
+            results[position] = _failure(loan_id, "Loan not found")
+            continue
+        current_status = loan.get("status")
+        if item.status not in REVIEW_TRANSITIONS.get(current_status, set()):
+            results[position] = _failure(
+                loan_id,
+                f"Cannot move a loan from {getattr(current_status, 'value', current_status)} to {item.status.value}",
+                current_status
+            )
+            continue
+        status_change = StatusChange(
+            status=item.status,
+            changed_at=changed_at,
+            changed_by=reviewer,
+            notes=item.notes
+        )
+        changes.append((position, loan, status_change))
+
+    modified = await apply_status_changes(
+        db, [(loan["_id"], loan["status"], status_change) for _, loan, status_change in changes], batch_id
+    )
+    conflicts = set()
+    if modified < len(changes):
+        # Some loans changed status between the read and the write; find out which
+        loan_ids = [loan["_id"] for _, loan, _ in changes]
+        conflicts = set(loan_ids) - set(await find_loans_changed_by_batch(db, loan_ids, batch_id))
+
+    applied = []
+    for position, loan, status_change in changes:
+        loan_id = str(loan["_id"])
+        if loan["_id"] in conflicts:
+            results[position] = _failure(loan_id, "Loan status changed during the review, retry", loan["status"])
+            continue
+        applied.append((loan, loan["status"], status_change))
+        results[position] = {
+            "loan_id": loan_id,
+            "ok": True,
+            "previous_status": loan["status"],
+            "status": status_change.status
+        }
+
+    if applied:
+        await after_status_changes(db, applied)
+    return results
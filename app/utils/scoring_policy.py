@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+import numpy as np
+from ..config import settings
+from ..models.scoring_policy import ScoringPolicyDocument
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICY_PATH = Path(__file__).resolve().parent.parent / "scoring_policy.json"
+
+class ScoringPolicy(NamedTuple):
+    """
+    A policy document compiled for lookups: breakpoints as tuples for bisect
+    on single loans and as arrays for searchsorted on batches
+    Immutable, so a request that took a reference keeps a consistent policy
+    whatever reloads happen meanwhile.
+    """
+    version: str
+    threshold: float
+    amount_breakpoints: Tuple[float, ...]
+    amount_scores: Tuple[float, ...]
+    amount_breakpoints_array: np.ndarray
+    amount_scores_array: np.ndarray
+    duration_breakpoints: Tuple[float, ...]
+    duration_scores: Tuple[float, ...]
+    duration_breakpoints_array: np.ndarray
+    duration_scores_array: np.ndarray
+    purpose_scores: Dict[str, float]
+    default_purpose_score: float
+    new_borrower_score: float
+    proven_score: float
+    proven_after: int
+    some_approvals_score: float
+    no_approvals_score: float
+    max_raw_score: float  # Sum of the best score of every component
+    document: ScoringPolicyDocument
+
+def compile_policy(document: ScoringPolicyDocument) -> ScoringPolicy:
+    history = document.history
+    return ScoringPolicy(
+        version=document.version,
+        threshold=document.threshold,
+        amount_breakpoints=tuple(document.amount.breakpoints),
+        amount_scores=tuple(document.amount.scores),
+        amount_breakpoints_array=np.array(document.amount.breakpoints, dtype=np.float64),
+        amount_scores_array=np.array(document.amount.scores, dtype=np.float64),
+        duration_breakpoints=tuple(document.duration.breakpoints),
+        duration_scores=tuple(document.duration.scores),
+        duration_breakpoints_array=np.array(document.duration.breakpoints, dtype=np.float64),
+        duration_scores_array=np.array(document.duration.scores, dtype=np.float64),
+        purpose_scores={purpose.lower(): score for purpose, score in document.purpose.scores.items()},
+        default_purpose_score=document.purpose.default,
+        new_borrower_score=history.new_borrower,
+        proven_score=history.proven,
+        proven_after=history.proven_after,
+        some_approvals_score=history.some_approvals,
+        no_approvals_score=history.no_approvals,
+        max_raw_score=(
+            max(document.amount.scores)
+            + max(document.duration.scores)
+            + max([*document.purpose.scores.values(), document.purpose.default])
+            + max(history.new_borrower, history.proven, history.some_approvals, history.no_approvals)
+        ),
+        document=document
+    )
+
+def policy_path() -> Path:
+    return Path(settings.SCORING_POLICY_PATH) if settings.SCORING_POLICY_PATH else DEFAULT_POLICY_PATH
+
+def load_policy_file(path: Path) -> ScoringPolicy:
+    """Read, validate and compile a policy file; raises ValueError if it is invalid"""
+    with open(path) as file:
+        return compile_policy(ScoringPolicyDocument.model_validate(json.load(file)))
+
+# The active policy. Replacing this one reference is the whole reload, so
+# readers never see a half-built policy and never wait for a lock.
+_active_policy: ScoringPolicy = load_policy_file(policy_path())
+
+def current_policy() -> ScoringPolicy:
+    return _active_policy
+
+def swap_policy(policy: ScoringPolicy) -> ScoringPolicy:
+    """Make policy the active one and return the policy it replaced"""
+    global _active_policy
+    previous, _active_policy = _active_policy, policy
+    if previous.version != policy.version:
+        logger.info("Scoring policy %s replaced by %s", previous.version, policy.version)
+    return previous
+
+async def reload_policy() -> ScoringPolicy:
+    """
+    Load the policy file again and swap it in
+    The file is read and compiled in a worker thread so requests keep being
+    served meanwhile; if it is invalid the active policy stays in place.
+    """
+    policy = await asyncio.to_thread(load_policy_file, policy_path())
+    swap_policy(policy)
+    return policy
+
+def _modified_at(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+async def watch_policy_file(interval: float):
+    """Reload the policy whenever its file changes, so every worker picks up edits"""
+    last_modified = await asyncio.to_thread(_modified_at, policy_path())
+    while True:
+        await asyncio.sleep(interval)
+        modified = await asyncio.to_thread(_modified_at, policy_path())
+        if modified is None or modified == last_modified:
+            continue
+        last_modified = modified
+        try:
+            await reload_policy()
+        except Exception:
+            logger.exception("Invalid scoring policy file, keeping version %s", current_policy().version)
+
+def start_policy_watcher() -> Optional[asyncio.Task]:
+    if settings.SCORING_POLICY_RELOAD_SECONDS <= 0:
+        return None
+    return asyncio.create_task(watch_policy_file(settings.SCORING_POLICY_RELOAD_SECONDS))
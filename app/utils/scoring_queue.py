@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import os
+import socket
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException, status
+from redis.exceptions import ResponseError
+from ..config import settings
+from ..dependencies.indexes import declare_index, declare_query
+from ..models.loan import LoanStatus, ScoringState
+from ..repositories.loans import (
+    apply_queued_scores,
+    claim_due_queued_loans,
+    find_queued_loans,
+    record_scoring_failures
+)
+from .applications import automatic_status_change
+from .borrower_history import get_borrower_histories
+from .credit_scoring import score_batch
+from .loan_hooks import after_loans_scored, after_status_changes
+from .metrics import SCORING_QUEUE_DEPTH, SCORING_QUEUE_REJECTED, SCORING_QUEUE_RETRIES, SCORING_QUEUE_WAIT
+from .scoring_policy import current_policy
+
+logger = logging.getLogger(__name__)
+
+# With SCORING_MODE=queued, POST /loans/apply stores the loan as pending with
+# scoring_state "queued" and puts its id on a queue; run_scoring_worker takes
+# ids off it in micro-batches and writes the score and the automatic status.
+# The loans collection is the source of truth, the queue only the fast path:
+# every queued loan carries a lease (scoring_due_at), and the sweep enqueues
+# again those whose lease ran out, so ids lost to a crash, a full queue or a
+# failed batch are scored later, and scoring the same id twice is harmless.
+SCORING_STREAM = "scoring-queue"
+SCORING_GROUP = "scorers"
+
+declare_index("loans", [("scoring_state", 1), ("scoring_due_at", 1)], sparse=True)
+declare_query("loans", {"scoring_state": ScoringState.QUEUED.value, "scoring_due_at": {"$lte": datetime(2024, 1, 1)}}, sort=[("scoring_due_at", 1)])
+declare_query("loans", {"user_email": {"$in": ["borrower@example.com"]}, "created_at": {"$gte": datetime(2024, 1, 1)}})
+
+QUEUED_PROJECTION = {
+    "user_email": 1,
+    "amount": 1,
+    "purpose": 1,
+    "duration_months": 1,
+    "status": 1,
+    "created_at": 1
+}
+
+class MemoryScoringQueue:
+    """Loan ids waiting for the scoring worker of this process"""
+
+    def __init__(self, max_depth: int):
+        self.queue: "asyncio.Queue[ObjectId]" = asyncio.Queue(maxsize=max_depth)
+
+    async def start(self):
+        pass
+
+    async def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def put(self, loan_ids: List[ObjectId]):
+        for loan_id in loan_ids:
+            self.queue.put_nowait(loan_id)  # QueueFull: the sweep enqueues it again later
+        SCORING_QUEUE_DEPTH.set(self.queue.qsize())
+
+    async def take(self, max_items: int, wait: float) -> List[ObjectId]:
+        """Wait for one id, then up to `wait` seconds for the batch to fill"""
+        loan_ids = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while len(loan_ids) < max_items:
+            try:
+                loan_ids.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                loan_ids.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        SCORING_QUEUE_DEPTH.set(self.queue.qsize())
+        return loan_ids
+
+class RedisScoringQueue:
+    """
+    Loan ids in a Redis stream read by every worker's scoring worker through
+    one consumer group, so each id goes to a single worker. Entries are read
+    without acknowledgement and deleted once read; the lease covers ids lost
+    by a worker that dies holding them.
+    """
+
+    def __init__(self, redis, stream: str = SCORING_STREAM, group: str = SCORING_GROUP):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+
+    async def start(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def depth(self) -> int:
+        depth = await self.redis.xlen(self.stream)
+        SCORING_QUEUE_DEPTH.set(depth)
+        return depth
+
+    async def put(self, loan_ids: List[ObjectId]):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for loan_id in loan_ids:
+                pipe.xadd(self.stream, {"loan_id": str(loan_id)})
+            await pipe.execute()
+
+    async def _read(self, count: int, block: Optional[int]) -> List[ObjectId]:
+        try:
+            response = await self.redis.xreadgroup(
+                self.group, self.consumer, {self.stream: ">"}, count=count, block=block, noack=True
+            )
+        except ResponseError:
+            # Usually NOGROUP: the stream was deleted, e.g. by FLUSHDB
+            await self.start()
+            return []
+        if not response:
+            return []
+        entries = response[0][1]
+        await self.redis.xdel(self.stream, *[entry_id for entry_id, _ in entries])
+        return [ObjectId(fields["loan_id"]) for _, fields in entries]
+
+    async def take(self, max_items: int, wait: float) -> List[ObjectId]:
+        """Wait up to a second for ids, then up to `wait` seconds for the batch to fill"""
+        loan_ids = await self._read(max_items, 1000)
+        if loan_ids and len(loan_ids) < max_items and wait > 0:
+            await asyncio.sleep(wait)
+            loan_ids += await self._read(max_items - len(loan_ids), None)
+        await self.depth()
+        return loan_ids
+
+scoring_queue = MemoryScoringQueue(settings.SCORING_QUEUE_MAX_DEPTH)
+
+async def configure_scoring_queue(redis=None):
+    """Share one stream between the workers when SCORING_QUEUE_BACKEND is redis"""
+    global scoring_queue
+    if settings.SCORING_QUEUE_BACKEND == "redis" and redis is not None:
+        scoring_queue = RedisScoringQueue(redis)
+    await scoring_queue.start()
+
+async def check_scoring_capacity():
+    """Refuse new applications while the queue is full, rather than let it grow without limit"""
+    if await scoring_queue.depth() >= settings.SCORING_QUEUE_MAX_DEPTH:
+        SCORING_QUEUE_REJECTED.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many applications waiting to be scored, please retry",
+            headers={"Retry-After": str(max(1, round(settings.SCORING_SWEEP_SECONDS)))}
+        )
+
+async def enqueue_for_scoring(*loan_ids: ObjectId):
+    """Best effort: an id that does not make it onto the queue is picked up by the sweep"""
+    try:
+        await scoring_queue.put(list(loan_ids))
+    except Exception:
+        logger.warning("Failed to enqueue %d loans for scoring; the sweep will retry", len(loan_ids), exc_info=True)
+
+async def _previous_counts(db, loans: List[dict], histories: Dict[str, Tuple[int, int]]) -> List[int]:
+    """
+    Loans each borrower had before each of these: their total, minus the loan
+    itself and every loan they applied for after it
+    """
+    emails = {loan["user_email"] for loan in loans}
+    later: Dict[str, List[Tuple[datetime, ObjectId]]] = defaultdict(list)
+    cursor = db.loans.find(
+        {"user_email": {"$in": list(emails)}, "created_at": {"$gte": min(loan["created_at"] for loan in loans)}},
+        {"user_email": 1, "created_at": 1}
+    )
+    async for other in cursor:
+        later[other["user_email"]].append((other["created_at"], other["_id"]))
+    for keys in later.values():
+        keys.sort()
+
+    counts = []
+    for loan in loans:
+        keys = later[loan["user_email"]]
+        after = len(keys) - bisect_right(keys, (loan["created_at"], loan["_id"]))
+        total, _ = histories[loan["user_email"]]
+        counts.append(max(total - after - 1, 0))
+    return counts
+
+async def score_queued_loans(db, loan_ids: List[ObjectId]) -> int:
+    """
+    Score the loans among loan_ids that are still queued and give those
+    still pending their automatic status; returns the number scored
+    """
+    loans = await find_queued_loans(db, list(set(loan_ids)), QUEUED_PROJECTION)
+    if not loans:
+        return 0
+
+    histories = await get_borrower_histories(db, {loan["user_email"] for loan in loans})
+    previous_counts = await _previous_counts(db, loans, histories)
+    policy = current_policy()
+    scores = score_batch(
+        [loan["amount"] for loan in loans],
+        [loan["duration_months"] for loan in loans],
+        [loan["purpose"] for loan in loans],
+        previous_counts,
+        [histories[loan["user_email"]][1] for loan in loans],
+        policy
+    ).total_score
+
+    scored_at = datetime.utcnow()
+    updates = []
+    for loan, score in zip(loans, scores):
+        # A reviewer may have moved the loan on already; then it only gets its score
+        change = None
+        if loan["status"] == LoanStatus.PENDING:
+            change = automatic_status_change(float(score), loan["user_email"], scored_at, policy)
+        updates.append((loan, float(score), policy.version, change))
+
+    modified = await apply_queued_scores(db, updates, scored_at)
+    if modified < len(updates):
+        # Some changed status or were scored elsewhere in the meantime; leave them to the sweep
+        still_queued = {loan["_id"] for loan in await find_queued_loans(db, [loan["_id"] for loan in loans], {"_id": 1})}
+        updates = [update for update in updates if update[0]["_id"] not in still_queued]
+
+    scored, changes = [], []
+    for loan, score, version, change in updates:
+        loan.update({"credit_score": score, "score_policy_version": version, "updated_at": scored_at})
+        if change is not None:
+            previous_status = loan["status"]
+            loan["status"] = change.status
+            changes.append((loan, previous_status, change))
+        scored.append(loan)
+        SCORING_QUEUE_WAIT.observe(max((scored_at - loan["created_at"]).total_seconds(), 0))
+
+    if changes:
+        await after_status_changes(db, changes)
+    await after_loans_scored(db, scored)
+    return len(scored)
+
+async def _record_failure(db, loan_ids: List[ObjectId]):
+    try:
+        retried, failed = await record_scoring_failures(db, list(set(loan_ids)), datetime.utcnow())
+    except Exception:
+        # The leases still run out, so the sweep retries them without counting the attempt
+        logger.warning("Failed to record a failed scoring attempt", exc_info=True)
+        return
+    SCORING_QUEUE_RETRIES.labels("retry").inc(retried)
+    SCORING_QUEUE_RETRIES.labels("failed").inc(failed)
+
+async def run_scoring_worker(db):
+    while True:
+        try:
+            loan_ids = await scoring_queue.take(settings.SCORING_BATCH_SIZE, settings.SCORING_BATCH_WAIT_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Reading the scoring queue failed", exc_info=True)
+            await asyncio.sleep(1)
+            continue
+        if not loan_ids:
+            continue
+        try:
+            await score_queued_loans(db, loan_ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Scoring %d queued loans failed", len(loan_ids))
+            await _record_failure(db, loan_ids)
+
+async def sweep_queued_loans(db) -> int:
+    """Enqueue again the queued loans whose lease ran out, as far as the queue has room"""
+    room = settings.SCORING_QUEUE_MAX_DEPTH - await scoring_queue.depth()
+    if room <= 0:
+        return 0
+    loan_ids = await claim_due_queued_loans(db, datetime.utcnow(), min(room, settings.SCORING_BATCH_SIZE * 10))
+    if loan_ids:
+        await enqueue_for_scoring(*loan_ids)
+    return len(loan_ids)
+
+async def watch_queued_loans(db, interval: float):
+    while True:
+        try:
+            swept = await sweep_queued_loans(db)
+            if swept:
+                logger.info("Enqueued %d loans again for scoring", swept)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Scoring sweep failed", exc_info=True)
+        await asyncio.sleep(interval)
+
+def start_scoring_worker(db) -> List[asyncio.Task]:
+    """The worker and its sweep, which also picks up loans left queued by a restart"""
+    if settings.SCORING_MODE != "queued":
+        return []
+    return [
+        asyncio.create_task(run_scoring_worker(db)),
+        asyncio.create_task(watch_queued_loans(db, settings.SCORING_SWEEP_SECONDS))
+    ]
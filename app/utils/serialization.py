@@ -0,0 +1,35 @@
+import orjson
+from bson import ObjectId
+from fastapi_cache.coder import Coder
+from starlette.responses import Response
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content) -> bytes:
+    """orjson encoding; datetimes come out in the same ISO format pydantic uses"""
+    return orjson.dumps(content, default=_default)
+
+class FastJSONResponse(Response):
+    """
+    JSON response rendered with orjson
+    FastAPI does not validate a returned Response against the endpoint's
+    response_model, so the content must already have the model's shape
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+class ResponseCoder(Coder):
+    """Caches the rendered body of a FastJSONResponse and replays it as is"""
+
+    @classmethod
+    def encode(cls, value: Response) -> bytes:
+        return value.body
+
+    @classmethod
+    def decode(cls, value) -> Response:
+        return Response(content=value, media_type="application/json")
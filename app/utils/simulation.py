@@ -0,0 +1,107 @@
+import time
+from typing import List
+import numpy as np
+from ..config import settings
+from ..models.simulation import SimulationRequest, SimulationResult
+from ..repositories.loans import build_loan_query
+from .credit_scoring import score_batch
+from .rescoring import SCORING_PROJECTION, load_history_counts, scoring_columns
+from .scoring_policy import ScoringPolicy, compile_policy, current_policy
+
+SIMULATION_PROJECTION = {**SCORING_PROJECTION, "credit_score": 1}
+
+class _Outcome:
+    """Running totals of one policy over the batches of a simulation"""
+
+    def __init__(self, policy: ScoringPolicy, bin_edges: np.ndarray):
+        self.policy = policy
+        self.bin_edges = bin_edges
+        self.passed = 0
+        self.score_sum = 0.0
+        self.histogram = np.zeros(len(bin_edges) - 1, dtype=np.int64)
+
+    def add(self, scores: np.ndarray) -> np.ndarray:
+        """Count a batch of scores and return which of them pass"""
+        passes = scores >= self.policy.threshold
+        self.passed += int(np.count_nonzero(passes))
+        self.score_sum += float(scores.sum())
+        self.histogram += np.histogram(scores, bins=self.bin_edges)[0]
+        return passes
+
+    def report(self, loans: int) -> dict:
+        return {
+            "policy_version": self.policy.version,
+            "threshold": self.policy.threshold,
+            "passed": self.passed,
+            "rejected": loans - self.passed,
+            "mean_score": round(self.score_sum / loans, 2) if loans else None,
+            "histogram": self.histogram.tolist()
+        }
+
+def _loan_cursor(db, request: SimulationRequest):
+    query = build_loan_query(request)
+    if request.sample_size:
+        return db.loans.aggregate(
+            [
+                {"$match": query},
+                {"$sample": {"size": request.sample_size}},
+                {"$project": SIMULATION_PROJECTION}
+            ],
+            allowDiskUse=True
+        )
+    return db.loans.find(query, SIMULATION_PROJECTION).batch_size(settings.SIMULATION_BATCH_SIZE)
+
+async def simulate_policy(db, request: SimulationRequest) -> SimulationResult:
+    """
+    Replay the candidate policy and the active one over the stored loans
+    Borrower histories come from one aggregation up front; loans are then
+    streamed in projected batches and each batch is scored under both
+    policies with the vectorized scorer. Like a rescore, every loan is
+    scored against all other loans of its borrower.
+    """
+    started = time.perf_counter()
+    bin_edges = np.append(np.arange(0, 100, request.bin_width), 100.0)
+    current = _Outcome(current_policy(), bin_edges)
+    candidate = _Outcome(compile_policy(request.policy), bin_edges)
+
+    history = await load_history_counts(db)
+    cursor = _loan_cursor(db, request)
+    loans = 0
+    flips_to_rejected = flips_to_passed = 0
+    flips: List[dict] = []
+    while True:
+        batch = await cursor.to_list(length=settings.SIMULATION_BATCH_SIZE)
+        if not batch:
+            break
+        loans += len(batch)
+        columns = scoring_columns(batch, history)
+        current_scores = score_batch(*columns, current.policy).total_score
+        candidate_scores = score_batch(*columns, candidate.policy).total_score
+        current_passes = current.add(current_scores)
+        candidate_passes = candidate.add(candidate_scores)
+
+        flipped = current_passes != candidate_passes
+        flips_to_rejected += int(np.count_nonzero(flipped & current_passes))
+        flips_to_passed += int(np.count_nonzero(flipped & candidate_passes))
+        for i in np.flatnonzero(flipped)[:request.max_flips - len(flips)]:
+            loan = batch[i]
+            flips.append({
+                "loan_id": str(loan["_id"]),
+                "email": loan.get("user_email", loan.get("email")),
+                "status": loan.get("status"),
+                "stored_score": loan.get("credit_score"),
+                "current_score": float(current_scores[i]),
+                "candidate_score": float(candidate_scores[i])
+            })
+
+    return SimulationResult(
+        loans=loans,
+        sampled=request.sample_size is not None,
+        bin_edges=bin_edges.tolist(),
+        current=current.report(loans),
+        candidate=candidate.report(loans),
+        flips_to_rejected=flips_to_rejected,
+        flips_to_passed=flips_to_passed,
+        flips=flips,
+        elapsed_seconds=round(time.perf_counter() - started, 3)
+    )
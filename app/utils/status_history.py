@@ -0,0 +1,49 @@
+from typing import Tuple
+from bson import ObjectId
+from ..config import settings
+from ..dependencies.indexes import declare_query
+from ..repositories.loan_events import archive_loan_events, loan_event
+
+ARCHIVE_PROJECTION = {"user_email": 1, "email": 1, "amount": 1, "status_history": 1}
+
+declare_query("loans", {"status_history.0": {"$exists": True}}, sort=[("_id", 1)])
+declare_query("loans", {"status_history.0": {"$exists": True}, "_id": {"$gt": ObjectId()}}, sort=[("_id", 1)])
+
+async def archive_status_history(db, batch_size: int = 1000) -> Tuple[int, int]:
+    """
+    Copy the embedded status history of every loan into loan_events, then
+    trim the arrays that are longer than STATUS_HISTORY_LIMIT
+    Changes already in loan_events are skipped, so it is safe to run again:
+    once before deploying the capped history (to copy everything) and once
+    after (for changes made by the old code in between).
+    Returns (events archived, loans trimmed)
+    """
+    limit = settings.STATUS_HISTORY_LIMIT
+    archived = trimmed = 0
+    last_id = None
+    while True:
+        query = {"status_history.0": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        loans = await db.loans.find(query, ARCHIVE_PROJECTION).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not loans:
+            break
+
+        events = []
+        for loan in loans:
+            previous_status = None
+            for change in loan["status_history"]:
+                events.append(loan_event(loan, change, previous_status))
+                previous_status = change["status"]
+        archived += await archive_loan_events(db, events)
+
+        # Only trim once every change of the batch is safely in loan_events
+        oversized = [loan["_id"] for loan in loans if len(loan["status_history"]) > limit]
+        if oversized:
+            result = await db.loans.update_many(
+                {"_id": {"$in": oversized}},
+                {"$push": {"status_history": {"$each": [], "$slice": -limit}}}
+            )
+            trimmed += result.modified_count
+        last_id = loans[-1]["_id"]
+    return archived, trimmed
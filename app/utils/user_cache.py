@@ -0,0 +1,112 @@
+import time
+import logging
+from collections import Counter, OrderedDict
+from typing import Any, Hashable, Optional
+from bson import json_util
+
+logger = logging.getLogger(__name__)
+
+# Fields of the users collection needed by authenticated requests; never the password hash
+USER_PROJECTION = {
+    "_id": 0,
+    "email": 1,
+    "full_name": 1,
+    "created_at": 1,
+    "is_active": 1,
+    "is_admin": 1
+}
+
+class LRUCache:
+    """Bounded in-process LRU whose entries expire after at most ttl seconds"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.counters = Counter()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.counters["expired"] += 1
+            self.counters["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def delete(self, key: Hashable):
+        if self._entries.pop(key, None) is not None:
+            self.counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), **self.counters}
+
+class MemoryUserCache:
+    """Slim user records per email, local to this worker"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.entries = LRUCache(max_entries, ttl)
+
+    async def get(self, email: str) -> Optional[dict]:
+        return self.entries.get(email)
+
+    async def set(self, email: str, user: dict):
+        self.entries.set(email, user)
+
+    async def invalidate(self, email: str):
+        self.entries.delete(email)
+
+    async def stats(self) -> dict:
+        return {"backend": "memory", **self.entries.stats()}
+
+class RedisUserCache:
+    """Slim user records per email, shared by every worker through Redis"""
+
+    def __init__(self, redis, ttl: int, prefix: str = "auth-user"):
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self.counters = Counter()
+
+    def _key(self, email: str) -> str:
+        return f"{self.prefix}:{email}"
+
+    async def get(self, email: str) -> Optional[dict]:
+        try:
+            raw = await self.redis.get(self._key(email))
+        except Exception:
+            logger.warning("Auth cache read failed", exc_info=True)
+            raw = None
+        self.counters["hits" if raw is not None else "misses"] += 1
+        return json_util.loads(raw) if raw is not None else None
+
+    async def set(self, email: str, user: dict):
+        try:
+            await self.redis.set(self._key(email), json_util.dumps(user), ex=self.ttl)
+        except Exception:
+            logger.warning("Auth cache write failed", exc_info=True)
+
+    async def invalidate(self, email: str):
+        self.counters["invalidations"] += 1
+        try:
+            await self.redis.delete(self._key(email))
+        except Exception:
+            # The change is stored; the cached record expires within the TTL
+            logger.warning("Auth cache invalidation failed for %s", email, exc_info=True)
+
+    async def stats(self) -> dict:
+        return {"backend": "redis", **self.counters}
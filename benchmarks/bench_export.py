@@ -0,0 +1,116 @@
+"""
+Loan export benchmark
+
+Seeds a MongoDB database with generated loans, then reads them all either
+the way GET /admin/loans used to (to_list(length=None), a Loan per document,
+one JSON body) or through the streaming export. For each it reports
+time-to-first-byte, total time and peak RSS growth. Each mode runs in its
+own process so the peak RSS figures do not mix.
+
+Usage: python -m benchmarks.bench_export [--mongo-url mongodb://localhost:27017] [--loans 1000000]
+       [--format ndjson] [--gzip] [--flatten-history]
+"""
+import argparse
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.models.loan import ExportFormat, Loan, LoanFilter
+from app.utils.export import stream_loans
+
+DB_NAME = "bench_export"
+PURPOSES = ["education", "business", "home", "car", "personal"]
+STATUSES = ["pending", "in_review", "approved", "rejected"]
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+async def seed(db, n: int, chunk: int = 10_000):
+    if await db.loans.estimated_document_count() == n:
+        return
+    await db.loans.drop()
+    rng = np.random.default_rng(42)
+    start = datetime(2023, 1, 1)
+    for offset in range(0, n, chunk):
+        documents = []
+        for i in range(offset, min(offset + chunk, n)):
+            created_at = start + timedelta(seconds=30 * i)
+            documents.append({
+                "user_email": f"user{i % 50_000}@example.com",
+                "amount": float(rng.integers(500, 50_000)),
+                "purpose": PURPOSES[i % len(PURPOSES)],
+                "duration_months": int(rng.integers(3, 60)),
+                "status": STATUSES[i % len(STATUSES)],
+                "credit_score": round(float(rng.uniform(0, 100)), 2),
+                "created_at": created_at,
+                "updated_at": created_at + timedelta(hours=1),
+                "status_history": [
+                    {"status": "pending", "changed_at": created_at, "changed_by": f"user{i % 50_000}@example.com", "notes": None},
+                    {"status": STATUSES[i % len(STATUSES)], "changed_at": created_at + timedelta(hours=1), "changed_by": "admin@example.com", "notes": "Reviewed"}
+                ]
+            })
+        await db.loans.insert_many(documents, ordered=False)
+
+async def run_list(db, args):
+    # Nothing can be sent until the whole body exists, so TTFB is the total time
+    start = time.perf_counter()
+    documents = await db.loans.find({}).to_list(length=None)
+    body = JSONResponse(jsonable_encoder([Loan.from_mongo(document) for document in documents])).body
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, len(body)
+
+async def run_stream(db, args):
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    async for chunk in stream_loans(
+        db,
+        LoanFilter(),
+        ExportFormat(args.format),
+        flatten_history=args.flatten_history,
+        compress=args.gzip
+    ):
+        if first_byte is None and chunk:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    return first_byte, time.perf_counter() - start, size
+
+async def run_mode(args):
+    client = AsyncIOMotorClient(args.mongo_url)
+    db = client[DB_NAME]
+    baseline = peak_rss_mb()
+    run = run_list if args.mode == "list" else run_stream
+    ttfb, total, size = await run(db, args)
+    client.close()
+    print(f"{args.mode:6} ttfb {ttfb * 1000:9.1f}ms | total {total:7.2f}s | "
+          f"{size / 1e6:8.1f}MB sent | peak RSS +{peak_rss_mb() - baseline:8.1f}MB")
+
+async def prepare(args):
+    client = AsyncIOMotorClient(args.mongo_url)
+    await seed(client[DB_NAME], args.loans)
+    client.close()
+
+def main(args):
+    if args.mode:
+        asyncio.run(run_mode(args))
+        return
+    asyncio.run(prepare(args))
+    print(f"{args.loans} loans, format={args.format} gzip={args.gzip} flatten_history={args.flatten_history}")
+    for mode in ["stream", "list"]:
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_export", "--mode", mode, *sys.argv[1:]], check=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--loans", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=[f.value for f in ExportFormat], default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--flatten-history", action="store_true")
+    parser.add_argument("--mode", choices=["stream", "list"], help=argparse.SUPPRESS)
+    main(parser.parse_args())
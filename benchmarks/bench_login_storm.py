@@ -0,0 +1,70 @@
+"""
+Login storm benchmark
+
+Fires a burst of bcrypt verifications, as /auth/token does, while an
+unrelated handler keeps running on the same event loop, and reports that
+handler's latency with bcrypt called inline versus through the worker pool.
+
+Usage: python -m benchmarks.bench_login_storm [--logins 200] [--executor thread]
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+from app.utils.passwords import PasswordHasher, pwd_context
+
+async def unrelated_handler():
+    # Stands in for a cheap endpoint: a tiny bit of work around one await
+    await asyncio.sleep(0.001)
+
+async def probe(latencies, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await unrelated_handler()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.005)
+
+async def inline_login(password, hashed):
+    # What the login handler used to do: bcrypt directly on the event loop
+    pwd_context.verify(password, hashed)
+    await asyncio.sleep(0)
+
+async def pooled_login(hasher, password, hashed):
+    try:
+        await hasher.verify_and_update(password, hashed)
+    except Exception:
+        pass  # 503 when saturated
+
+async def storm(make_login, logins: int):
+    latencies = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(latencies, stop))
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[make_login() for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe_task
+    return elapsed, np.array(latencies) * 1000
+
+def report(name, elapsed, latencies):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"{name:8} storm {elapsed:6.2f}s | unrelated handler p50 {p50:7.2f}ms "
+          f"p95 {p95:7.2f}ms p99 {p99:7.2f}ms max {latencies.max():7.2f}ms")
+
+async def main(args):
+    hashed = pwd_context.hash("correct horse")
+    hasher = PasswordHasher(args.executor, args.workers, args.logins)
+
+    report("inline", *await storm(lambda: inline_login("correct horse", hashed), args.logins))
+    report("pooled", *await storm(lambda: pooled_login(hasher, "correct horse", hashed), args.logins))
+    hasher.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+"""
+Metrics middleware overhead benchmark
+
+Calls a small FastAPI app directly through ASGI, with and without
+MetricsMiddleware, and reports the added time per request. Going through
+ASGI directly keeps the network and the HTTP parser out of the numbers.
+
+Usage: python -m benchmarks.bench_metrics_overhead [--requests 20000]
+"""
+import argparse
+import asyncio
+import time
+from fastapi import FastAPI
+from app.utils.metrics import MetricsMiddleware
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+
+    @app.get("/loans/{loan_id}")
+    async def get_loan(loan_id: str):
+        return {"id": loan_id}
+
+    return app
+
+async def run(app, n: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for i in range(n):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/loans/{i}",
+            "raw_path": f"/loans/{i}".encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+            "server": ("test", 80),
+            "client": ("test", 1234)
+        }
+        await app(scope, receive, send)
+    return time.perf_counter() - start
+
+async def main(n: int):
+    plain, instrumented = build_app(False), build_app(True)
+    await run(plain, 1000)  # Warm up both stacks
+    await run(instrumented, 1000)
+    # Alternate short rounds and keep the best of each, so load from other
+    # processes does not land on one side only
+    rounds, per_round = 20, max(n // 20, 1)
+    plain_us = instrumented_us = float("inf")
+    for _ in range(rounds):
+        plain_us = min(plain_us, await run(plain, per_round) / per_round * 1e6)
+        instrumented_us = min(instrumented_us, await run(instrumented, per_round) / per_round * 1e6)
+    print(f"without metrics: {plain_us:7.1f} us/request")
+    print(f"with metrics:    {instrumented_us:7.1f} us/request "
+          f"(+{instrumented_us - plain_us:.1f} us, {(instrumented_us / plain_us - 1) * 100:+.1f}%)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000)
+    asyncio.run(main(parser.parse_args().requests))
@@ -0,0 +1,113 @@
+"""
+Scoring policy lookup benchmark
+
+Scores the same synthetic loans three ways and checks they agree:
+  if-chains  the hard-coded rules the scorer started with
+  policy     bisect lookups on the compiled policy, one loan at a time
+  batch      searchsorted on the compiled policy arrays, all loans at once
+Also times compiling the policy file, which is what a reload costs.
+
+Usage: python -m benchmarks.bench_policy_lookup [--loans 200000]
+"""
+import argparse
+import time
+import numpy as np
+from app.utils.credit_scoring import (
+    calculate_amount_score,
+    calculate_duration_score,
+    calculate_purpose_score,
+    calculate_history_score_from_counts,
+    score_batch
+)
+from app.utils.scoring_policy import current_policy, load_policy_file, policy_path
+
+PURPOSES = ["education", "home renovation", "business", "debt consolidation", "other", "Education", "vacation"]
+
+def legacy_score(amount, duration_months, purpose, previous_count, approved_count) -> float:
+    if amount <= 5000:
+        amount_score = 40.0
+    elif amount <= 10000:
+        amount_score = 30.0
+    elif amount <= 20000:
+        amount_score = 20.0
+    else:
+        amount_score = 10.0
+
+    if duration_months <= 6:
+        duration_score = 30.0
+    elif duration_months <= 12:
+        duration_score = 25.0
+    elif duration_months <= 24:
+        duration_score = 20.0
+    else:
+        duration_score = 15.0
+
+    purpose_scores = {
+        "education": 30.0,
+        "home renovation": 25.0,
+        "business": 20.0,
+        "debt consolidation": 15.0,
+        "other": 10.0
+    }
+    purpose_score = purpose_scores.get(purpose.lower(), 10.0)
+
+    if previous_count == 0:
+        history_score = 20.0
+    elif approved_count >= 2:
+        history_score = 30.0
+    elif approved_count == 1:
+        history_score = 25.0
+    else:
+        history_score = 15.0
+
+    return amount_score + duration_score + purpose_score + history_score
+
+def policy_score(amount, duration_months, purpose, previous_count, approved_count, policy) -> float:
+    return (
+        calculate_amount_score(amount, policy)
+        + calculate_duration_score(duration_months, policy)
+        + calculate_purpose_score(purpose, policy)
+        + calculate_history_score_from_counts(previous_count, approved_count, policy)
+    )
+
+def generate_columns(n: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    amounts = np.round(rng.uniform(500, 50000, n), 2)
+    durations = rng.integers(1, 60, n)
+    purposes = rng.choice(PURPOSES, n)
+    previous = rng.integers(0, 6, n)
+    approved = np.minimum(previous, rng.integers(0, 4, n))
+    return amounts, durations, purposes, previous, approved
+
+def timed(label: str, n: int, run):
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    print(f"{label:10} {n / elapsed:14,.0f} loans/s  ({elapsed * 1e9 / n:7.1f} ns/loan)")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loans", type=int, default=200_000)
+    args = parser.parse_args()
+
+    policy = current_policy()
+    columns = generate_columns(args.loans)
+    rows = list(zip(*(column.tolist() for column in columns)))
+    print(f"policy {policy.version}, {args.loans} loans")
+
+    legacy = timed("if-chains", args.loans, lambda: [legacy_score(*row) for row in rows])
+    compiled = timed("policy", args.loans, lambda: [policy_score(*row, policy) for row in rows])
+    batch = timed("batch", args.loans, lambda: score_batch(*columns, policy))
+
+    raw_batch = batch.amount_score + batch.duration_score + batch.purpose_score + batch.history_score
+    if legacy != compiled or not np.array_equal(np.array(legacy), raw_batch):
+        raise SystemExit("compiled policy disagrees with the if-chains")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        load_policy_file(policy_path())
+    print(f"reload     {(time.perf_counter() - start) * 10:14.3f} ms per load and compile")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Rate limit decision cost benchmark
+
+Times rate_limiter.check the way admit() calls it for POST /loans/apply:
+one per-IP and one per-user bucket per decision, spread over many clients
+so most buckets already exist. Reports p50/p99 per decision for the local
+buckets and for the Redis script, and exits with status 1 when the p99 of
+either is over the budget (1 ms by default).
+
+Redis is picked by benchmarks.standins. The fakeredis stand-in runs the
+script in an embedded Lua interpreter and says nothing about a real
+server, so it is reported but not held to the budget.
+
+Usage: python -m benchmarks.bench_rate_limit [--decisions 20000] [--clients 1000]
+       [--budget-ms 1.0] [--redis-url URL]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import numpy as np
+from app.utils.rate_limit import MemoryRateLimiter, RedisRateLimiter, parse_rate
+from benchmarks.standins import open_redis
+
+PER_IP = parse_rate("120/minute")
+PER_USER = parse_rate("20/minute")
+
+async def time_decisions(limiter, decisions: int, clients: int) -> np.ndarray:
+    latencies = []
+    for i in range(decisions):
+        client = i % clients
+        buckets = [(f"apply:ip:10.0.{client // 256}.{client % 256}", PER_IP), (f"apply:user:user{client}@example.com", PER_USER)]
+        start = time.perf_counter()
+        await limiter.check(buckets)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+def report(name: str, latencies_ms: np.ndarray, budget_ms: float, enforced: bool) -> bool:
+    p50, p99 = np.percentile(latencies_ms, 50), np.percentile(latencies_ms, 99)
+    within = p99 <= budget_ms
+    verdict = ("ok" if within else "OVER BUDGET") if enforced else "not enforced for a stand-in"
+    print(f"{name:24} p50 {p50 * 1000:8.1f} us  p99 {p99 * 1000:8.1f} us  ({verdict})")
+    return within or not enforced
+
+async def main(args) -> bool:
+    ok = True
+    memory = MemoryRateLimiter(args.clients * 4)
+    await time_decisions(memory, args.clients, args.clients)  # Create every bucket first
+    ok &= report("memory", await time_decisions(memory, args.decisions, args.clients), args.budget_ms, True)
+
+    async with open_redis(args.redis_url) as (redis, backend):
+        await redis.flushdb()
+        limiter = RedisRateLimiter(redis, MemoryRateLimiter(1))
+        await time_decisions(limiter, args.clients, args.clients)
+        if not await redis.exists(f"{limiter.prefix}:apply:user:user0@example.com"):
+            raise SystemExit("The token bucket script did not run (fakeredis needs lupa for Lua)")
+        latencies = await time_decisions(limiter, args.decisions, args.clients)
+        ok &= report(f"redis ({backend})", latencies, args.budget_ms, backend != "fakeredis")
+        await redis.flushdb()
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--decisions", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--budget-ms", type=float, default=1.0, help="allowed p99 per decision")
+    parser.add_argument("--redis-url")
+    if not asyncio.run(main(parser.parse_args())):
+        sys.exit(1)
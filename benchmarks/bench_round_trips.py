@@ -0,0 +1,110 @@
+"""
+Round trips and latency per write endpoint
+
+Drives the app in-process against a MongoDB server and counts the
+commands each request sends, using pymongo command monitoring.
+Run it on two commits to compare them.
+
+Usage: python -m benchmarks.bench_round_trips [--mongo-url mongodb://localhost:27017] [--requests 200]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+import httpx
+import numpy as np
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from app.main import app
+from app.config import settings
+from app.dependencies.indexes import sync_indexes
+from app.utils.auth import create_access_token
+from app.utils.cache import CountingBackend
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = 0
+
+    def started(self, event):
+        self.commands += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def auth_header(email):
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+async def measure(name, counter, requests, send):
+    latencies = []
+    commands = []
+    for i in range(requests):
+        before = counter.commands
+        start = time.perf_counter()
+        response = await send(i)
+        latencies.append(time.perf_counter() - start)
+        commands.append(counter.commands - before)
+        if response.status_code >= 400:
+            raise SystemExit(f"{name} failed: {response.status_code} {response.text}")
+    latencies = np.array(latencies) * 1000
+    print(f"{name:34} {np.mean(commands):5.1f} round trips | "
+          f"p50 {np.percentile(latencies, 50):6.2f}ms p99 {np.percentile(latencies, 99):6.2f}ms")
+
+async def main(args):
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(args.mongo_url, event_listeners=[counter])
+    db_name = f"bench_round_trips_{uuid.uuid4().hex[:8]}"
+    app.mongodb_client = client
+    app.mongodb = client[db_name]
+    settings.RATE_LIMIT_ENABLED = False  # Every client shares one address here; measure the endpoints, not admission
+    FastAPICache.init(CountingBackend(InMemoryBackend()), prefix="bench")
+    await sync_indexes(app.mongodb)
+
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as http:
+            await http.post("/auth/create-admin", json={
+                "email": "admin@example.com", "full_name": "Admin", "password": "password"
+            })
+            admin = auth_header("admin@example.com")
+
+            await measure("POST /auth/register", counter, args.requests, lambda i: http.post(
+                "/auth/register",
+                json={"email": f"user{i}@example.com", "full_name": "User", "password": "password"}
+            ))
+
+            loan_ids = []
+            async def apply(i):
+                response = await http.post(
+                    "/loans/apply",
+                    json={"amount": 4000, "purpose": "education", "duration_months": 6,
+                          "user_email": f"user{i}@example.com"},
+                    headers=auth_header(f"user{i}@example.com")
+                )
+                loan_ids.append(response.json().get("_id"))
+                return response
+            await measure("POST /loans/apply", counter, args.requests, apply)
+
+            await measure("PATCH /loans/{id}/status", counter, args.requests, lambda i: http.patch(
+                f"/loans/{loan_ids[i]}/status",
+                json={"status": "in_review"},
+                headers=auth_header(f"user{i}@example.com")
+            ))
+            await measure("PATCH /admin/loans/{id}/review", counter, args.requests, lambda i: http.patch(
+                f"/admin/loans/{loan_ids[i]}/review", json={"status": "approved"}, headers=admin
+            ))
+            await measure("POST /admin/.../calculate-score", counter, args.requests, lambda i: http.post(
+                f"/admin/loans/{loan_ids[i]}/calculate-score", headers=admin
+            ))
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--requests", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
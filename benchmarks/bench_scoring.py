@@ -0,0 +1,85 @@
+"""
+Scoring throughput benchmark
+
+Times a synthetic loan book scored three ways, with the bundled default policy:
+  baseline  the frozen copy of the original if-chain scorer in tests/test_credit_scoring.py
+  single    calculate_credit_score, one loan at a time
+  batch     score_batch, all loans at once
+That the scorers agree with the baseline is checked by tests/test_credit_scoring.py.
+
+Usage: python -m benchmarks.bench_scoring [--loans 1000000] [--sample 5000]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import List
+import numpy as np
+from app.models.loan import Loan, LoanStatus
+from app.utils.credit_scoring import calculate_credit_score, score_batch
+from app.utils.scoring_policy import DEFAULT_POLICY_PATH, load_policy_file
+from tests.test_credit_scoring import baseline_credit_score
+
+PURPOSES = ["education", "home renovation", "business", "debt consolidation", "other", "Education", "vacation"]
+
+def generate_columns(n: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    amounts = np.round(rng.uniform(500, 50000, n), 2)
+    durations = rng.integers(1, 60, n)
+    purposes = rng.choice(PURPOSES, n)
+    previous = rng.integers(0, 6, n)
+    approved = np.minimum(previous, rng.integers(0, 4, n))
+    return amounts, durations, purposes, previous, approved
+
+def build_loans(amounts, durations, purposes, previous, approved):
+    now = datetime.utcnow()
+    for i in range(len(amounts)):
+        loan = Loan(
+            id="bench",
+            user_email="bench@example.com",
+            amount=float(amounts[i]),
+            purpose=str(purposes[i]),
+            duration_months=int(durations[i]),
+            created_at=now
+        )
+        history = [
+            Loan(
+                id=f"prev-{j}",
+                user_email="bench@example.com",
+                amount=1000,
+                purpose="other",
+                duration_months=12,
+                created_at=now,
+                status=LoanStatus.APPROVED if j < approved[i] else LoanStatus.REJECTED
+            )
+            for j in range(previous[i])
+        ]
+        yield loan, history
+
+def timed(label: str, n: int, run):
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    print(f"{label:9} {n / elapsed:14,.0f} loans/s  ({n} loans, {elapsed:.3f}s)")
+    return result
+
+async def single_scores(loans, policy) -> List[float]:
+    return [await calculate_credit_score(loan, history, policy) for loan, history in loans]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loans", type=int, default=1_000_000)
+    parser.add_argument("--sample", type=int, default=5_000,
+                        help="loans also scored by the baseline and the single-loan path")
+    args = parser.parse_args()
+
+    policy = load_policy_file(DEFAULT_POLICY_PATH)
+    columns = generate_columns(args.loans)
+    loans = list(build_loans(*(column[:args.sample] for column in columns)))
+
+    timed("baseline", len(loans), lambda: [baseline_credit_score(*loan) for loan in loans])
+    timed("single", len(loans), lambda: asyncio.run(single_scores(loans, policy)))
+    timed("batch", args.loans, lambda: score_batch(*columns, policy))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Loan listing serialization benchmark
+
+Renders a 10k-loan response the way the listing endpoints used to
+(Loan.from_mongo, then FastAPI validating against response_model and
+encoding with the stdlib JSON encoder) and through the trusted path
+(Loan.dump_mongo rendered by orjson), after checking both give the same JSON.
+
+Usage: python -m benchmarks.bench_serialization [--loans 10000] [--history 3] [--repeat 5]
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+import numpy as np
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app.models.loan import Loan
+from app.utils.serialization import FastJSONResponse
+
+PURPOSES = ["education", "business", "home", "car", "personal"]
+STATUSES = ["pending", "in_review", "approved", "rejected"]
+
+def make_documents(n: int, history: int) -> List[dict]:
+    rng = np.random.default_rng(42)
+    start = datetime(2024, 1, 1)
+    documents = []
+    for i in range(n):
+        created_at = start + timedelta(minutes=i, milliseconds=int(rng.integers(0, 1000)))
+        documents.append({
+            "_id": ObjectId(),
+            "user_email": f"user{i % 500}@example.com",
+            "amount": float(rng.integers(500, 50_000)),
+            "purpose": PURPOSES[i % len(PURPOSES)],
+            "duration_months": int(rng.integers(3, 60)),
+            "status": STATUSES[i % len(STATUSES)],
+            "credit_score": round(float(rng.uniform(0, 100)), 2) if i % 3 else None,
+            "created_at": created_at,
+            "updated_at": created_at + timedelta(hours=1),
+            "status_history": [
+                {
+                    "status": STATUSES[j % len(STATUSES)],
+                    "changed_at": created_at + timedelta(hours=j),
+                    "changed_by": "admin@example.com",
+                    "notes": "Reviewed" if j % 2 else None
+                }
+                for j in range(history)
+            ]
+        })
+    return documents
+
+async def validated_path(field, documents) -> bytes:
+    loans = [Loan.from_mongo(document) for document in documents]
+    content = await serialize_response(field=field, response_content=loans)
+    return JSONResponse(content).body
+
+def trusted_path(documents) -> bytes:
+    return FastJSONResponse([Loan.dump_mongo(document) for document in documents]).body
+
+def timed(func, repeat: int) -> np.ndarray:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+def main(args):
+    documents = make_documents(args.loans, args.history)
+    field = create_response_field(name="Response_get_my_loans", type_=List[Loan])
+
+    def run_validated():
+        return asyncio.run(validated_path(field, documents))
+
+    if json.loads(run_validated()) != json.loads(trusted_path(documents)):
+        raise SystemExit("Paths disagree")
+
+    validated = timed(run_validated, args.repeat)
+    trusted = timed(lambda: trusted_path(documents), args.repeat)
+    print(f"{args.loans} loans, {args.history} history entries each")
+    print(f"validated  median {np.median(validated):8.1f}ms")
+    print(f"trusted    median {np.median(trusted):8.1f}ms  ({np.median(validated) / np.median(trusted):.1f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loans", type=int, default=10_000)
+    parser.add_argument("--history", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
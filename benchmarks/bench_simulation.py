@@ -0,0 +1,62 @@
+"""
+Policy simulation benchmark
+
+Seeds a MongoDB database with generated loans (shared with bench_export),
+then replays a candidate policy over all of them with simulate_policy and
+compares that with the per-loan path: two history queries and a
+calculate_credit_score_from_history call for each loan, timed on a sample
+and extrapolated.
+
+Usage: python -m benchmarks.bench_simulation [--mongo-url mongodb://localhost:27017] [--loans 1000000]
+       [--sample 2000]
+"""
+import argparse
+import asyncio
+import time
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.models.loan import Loan, LoanStatus
+from app.models.simulation import SimulationRequest
+from app.utils.credit_scoring import calculate_credit_score_from_history
+from app.utils.scoring_policy import current_policy
+from app.utils.simulation import simulate_policy
+from benchmarks.bench_export import DB_NAME, seed
+
+def candidate_policy() -> dict:
+    document = current_policy().document.model_dump()
+    document["version"] = "bench-candidate"
+    document["threshold"] = 65
+    document["amount"]["breakpoints"] = [7500, 15000, 30000]
+    return document
+
+async def per_loan(db, sample: int) -> float:
+    start = time.perf_counter()
+    async for document in db.loans.find({}).limit(sample):
+        email = document["user_email"]
+        previous = await db.loans.count_documents({"user_email": email, "_id": {"$ne": document["_id"]}})
+        approved = await db.loans.count_documents(
+            {"user_email": email, "_id": {"$ne": document["_id"]}, "status": LoanStatus.APPROVED.value}
+        )
+        await calculate_credit_score_from_history(Loan.from_mongo(document), previous, approved)
+    return time.perf_counter() - start
+
+async def main(args):
+    client = AsyncIOMotorClient(args.mongo_url)
+    db = client[DB_NAME]
+    await seed(db, args.loans)
+
+    result = await simulate_policy(db, SimulationRequest(policy=candidate_policy()))
+    print(f"simulate_policy: {result.loans} loans in {result.elapsed_seconds:.2f}s "
+          f"({result.loans / result.elapsed_seconds:,.0f} loans/s), "
+          f"{result.flips_to_rejected} flip to rejected, {result.flips_to_passed} to passed")
+
+    elapsed = await per_loan(db, args.sample)
+    print(f"per-loan path:   {args.sample} loans in {elapsed:.2f}s "
+          f"({args.sample / elapsed:,.0f} loans/s, ~{elapsed / args.sample * args.loans / 60:,.0f} min for all)")
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--loans", type=int, default=1_000_000)
+    parser.add_argument("--sample", type=int, default=2_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,246 @@
+"""
+Load scenarios against the whole app
+
+Seeds a database with benchmarks.datagen, then drives the app in-process
+through httpx with a fixed number of concurrent clients:
+  login_storm      POST /auth/token for many borrowers at once
+  apply_burst      POST /loans/apply from many borrowers at once
+  admin_dashboard  what the admin dashboard loads: stats, daily stats and
+                   a few pages of the loan list, one request per load
+  bulk_rescore     POST /admin/loans/rescore over every loan, run to completion
+
+MongoDB and Redis are picked by benchmarks.standins: the given URLs, local
+mongod / redis-server binaries, or in-process stand-ins. Results are
+written as JSON with throughput and p50/p95/p99 latency per scenario.
+Given a baseline file from an earlier run, the suite prints the change
+per scenario and exits with status 1 when throughput dropped or p95 rose
+by more than the tolerance, or there were more errors.
+
+Usage: python -m benchmarks.bench_suite [--scenario apply_burst ...] [--users 1000] [--loans 5000]
+       [--seed 42] [--requests 200] [--concurrency 16] [--output results.json]
+       [--baseline baseline.json] [--tolerance 0.1] [--mongo-url URL] [--redis-url URL]
+"""
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List
+import httpx
+import numpy as np
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from app.main import app
+from app.config import settings
+from app.dependencies.indexes import sync_indexes
+from app.utils.auth import configure_user_cache, create_access_token
+from app.utils.cache import CountingBackend
+from app.utils.events import close_event_bus, configure_event_bus
+from benchmarks.datagen import ADMIN_EMAIL, PASSWORD, PURPOSES, seed_database
+from benchmarks.standins import open_mongo, open_redis
+
+DB_NAME = "bench_suite"
+SCENARIOS = ["login_storm", "admin_dashboard", "apply_burst", "bulk_rescore"]
+
+def auth_header(email: str) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+def summarise(latencies: List[float], errors: int, elapsed: float, units: int) -> dict:
+    """units is what throughput counts: requests, or loans for bulk work"""
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(units / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2)
+    }
+
+async def run_load(requests: int, concurrency: int, send: Callable[[int], Awaitable[httpx.Response]]) -> dict:
+    """Send `requests` requests from `concurrency` clients, each starting the next as soon as one returns"""
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def client():
+        nonlocal next_index, errors
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            response = await send(index)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarise(latencies, errors, time.perf_counter() - start, requests)
+
+async def active_borrowers(db) -> List[str]:
+    users = await db.users.find({"is_active": True, "is_admin": False}, {"email": 1}).sort("email", 1).to_list(length=None)
+    return [user["email"] for user in users]
+
+async def login_storm(http, db, args) -> dict:
+    borrowers = await active_borrowers(db)
+    return await run_load(args.requests, args.concurrency, lambda i: http.post(
+        "/auth/token", data={"username": borrowers[i % len(borrowers)], "password": PASSWORD}
+    ))
+
+async def apply_burst(http, db, args) -> dict:
+    borrowers = await active_borrowers(db)
+    headers = {email: auth_header(email) for email in borrowers}
+    rng = np.random.default_rng(args.seed + 2)
+    applications = [
+        {
+            "amount": float(np.clip(np.round(rng.lognormal(np.log(8000), 0.8), -2), 500, 50000)),
+            "purpose": PURPOSES[int(rng.integers(len(PURPOSES)))],
+            "duration_months": int(rng.choice([6, 12, 24, 36, 48])),
+            "user_email": borrowers[int(rng.integers(len(borrowers)))]
+        }
+        for _ in range(args.requests)
+    ]
+    return await run_load(args.requests, args.concurrency, lambda i: http.post(
+        "/loans/apply", json=applications[i], headers=headers[applications[i]["user_email"]]
+    ))
+
+async def admin_dashboard(http, db, args) -> dict:
+    admin = auth_header(ADMIN_EMAIL)
+    filters = [{}, {"status": "pending"}, {"status": "in_review"}]
+
+    async def load(i: int) -> httpx.Response:
+        for path in ["/admin/stats", "/admin/stats/daily"]:
+            response = await http.get(path, headers=admin)
+            if response.status_code >= 400:
+                return response
+        params = dict(filters[i % len(filters)], limit=50)
+        for _ in range(3):
+            response = await http.get("/admin/loans", params=params, headers=admin)
+            cursor = response.json().get("next_cursor") if response.status_code < 400 else None
+            if cursor is None:
+                break
+            params["cursor"] = cursor
+        return response
+
+    return await run_load(args.requests, args.concurrency, load)
+
+async def bulk_rescore(http, db, args) -> dict:
+    admin = auth_header(ADMIN_EMAIL)
+    latencies = []
+    errors = loans = 0
+    start = time.perf_counter()
+    for _ in range(args.rescore_runs):
+        run_start = time.perf_counter()
+        # The transport runs the background job before returning, but poll anyway
+        # so the scenario also holds against a real server
+        response = await http.post("/admin/loans/rescore", json={}, headers=admin)
+        job = response.json()
+        while response.status_code < 400 and job["status"] == "running":
+            await asyncio.sleep(0.05)
+            response = await http.get(f"/admin/rescore-jobs/{job['_id']}", headers=admin)
+            job = response.json()
+        latencies.append(time.perf_counter() - run_start)
+        if response.status_code >= 400 or job["status"] != "completed":
+            errors += 1
+        else:
+            loans += job["processed"]
+    return summarise(latencies, errors, time.perf_counter() - start, loans)
+
+def git_commit() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() or "unknown"
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Print the change against the baseline and return the regressed scenarios"""
+    if results["meta"]["backends"] != baseline["meta"].get("backends"):
+        print(f"warning: baseline used {baseline['meta'].get('backends')}, this run {results['meta']['backends']}")
+    regressions = []
+    print(f"{'scenario':16} {'throughput':>22} {'p95 ms':>22}")
+    for name, result in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        throughput_change = result["throughput"] / before["throughput"] - 1
+        p95_change = result["p95_ms"] / before["p95_ms"] - 1
+        regressed = throughput_change < -tolerance or p95_change > tolerance or result["errors"] > before["errors"]
+        print(f"{name:16} {before['throughput']:9.1f} -> {result['throughput']:9.1f} "
+              f"{before['p95_ms']:9.1f} -> {result['p95_ms']:9.1f}  "
+              f"{throughput_change:+7.1%} {p95_change:+7.1%}{'  REGRESSED' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+async def run_suite(args) -> dict:
+    async with open_mongo(args.mongo_url) as (client, mongo_backend), open_redis(args.redis_url) as (redis, redis_backend):
+        app.mongodb_client = client
+        app.mongodb = client[DB_NAME]
+        app.redis = redis
+        settings.RATE_LIMIT_ENABLED = False  # Every client shares one address here; measure the endpoints, not admission
+        FastAPICache.init(CountingBackend(RedisBackend(redis)), prefix="bench")
+        configure_user_cache(redis)
+        await configure_event_bus(redis)
+        await redis.flushdb()
+        await sync_indexes(app.mongodb)
+
+        start = time.perf_counter()
+        seeded = await seed_database(app.mongodb, args.users, args.loans, args.seed)
+        print(f"seeded {seeded} in {time.perf_counter() - start:.1f}s ({mongo_backend}, {redis_backend})")
+
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "started_at": datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "backends": {"mongo": mongo_backend, "redis": redis_backend},
+                "seed": args.seed,
+                "users": args.users,
+                "loans": args.loans,
+                "requests": args.requests,
+                "concurrency": args.concurrency
+            },
+            "scenarios": {}
+        }
+        try:
+            async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=None) as http:
+                for name in [name for name in SCENARIOS if name in args.scenario]:
+                    result = await globals()[name](http, app.mongodb, args)
+                    results["scenarios"][name] = result
+                    print(f"{name:16} {result['throughput']:10.1f}/s  p50 {result['p50_ms']:8.2f}ms  "
+                          f"p95 {result['p95_ms']:8.2f}ms  p99 {result['p99_ms']:8.2f}ms  errors {result['errors']}")
+        finally:
+            await close_event_bus()
+            if mongo_backend != "mongomock":
+                await client.drop_database(DB_NAME)
+        return results
+
+def main(args):
+    results = asyncio.run(run_suite(args))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--loans", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rescore-runs", type=int, default=3)
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed throughput drop / p95 rise, as a fraction")
+    parser.add_argument("--mongo-url")
+    parser.add_argument("--redis-url")
+    main(parser.parse_args())
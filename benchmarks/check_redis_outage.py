@@ -0,0 +1,66 @@
+"""
+Redis outage check
+
+Drives the app in-process with MongoDB stood in by mongomock-motor and a
+Redis client pointed at a port nothing listens on, and checks that the
+cached reads still answer, uncached, and that an admin can still update a
+user, instead of failing with a Redis error.
+
+Usage: python -m benchmarks.check_redis_outage
+"""
+import asyncio
+import sys
+from datetime import datetime
+import httpx
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from mongomock_motor import AsyncMongoMockClient
+from redis import asyncio as aioredis
+from app.main import app
+from app.config import settings
+from app.utils.auth import configure_user_cache, create_access_token
+from app.utils.cache import CountingBackend
+from benchmarks.standins import _free_port
+
+ADMIN_EMAIL = "admin@example.com"
+BORROWER_EMAIL = "borrower@example.com"
+
+def auth_header(email: str) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+async def main() -> bool:
+    settings.RATE_LIMIT_ENABLED = False
+    settings.AUTH_CACHE_BACKEND = "redis"
+    app.mongodb = AsyncMongoMockClient()["check_redis_outage"]
+    redis = aioredis.Redis(port=_free_port(), socket_connect_timeout=0.5, decode_responses=True)
+    app.redis = redis
+    FastAPICache.init(CountingBackend(RedisBackend(redis)), prefix="check")
+    configure_user_cache(redis)
+
+    await app.mongodb.users.insert_many([
+        {"email": ADMIN_EMAIL, "full_name": "Admin", "is_active": True, "is_admin": True, "created_at": datetime.utcnow()},
+        {"email": BORROWER_EMAIL, "full_name": "Borrower", "is_active": True, "is_admin": False, "created_at": datetime.utcnow()}
+    ])
+    checks = [
+        ("GET", "/admin/loans", ADMIN_EMAIL, None),
+        ("GET", "/admin/stats", ADMIN_EMAIL, None),
+        ("GET", "/loans/my-loans", BORROWER_EMAIL, None),
+        ("PATCH", f"/admin/users/{BORROWER_EMAIL}", ADMIN_EMAIL, {"is_active": False})
+    ]
+    ok = True
+    async with httpx.AsyncClient(app=app, base_url="http://check") as http:
+        for method, path, email, body in checks:
+            try:
+                response = await http.request(method, path, json=body, headers=auth_header(email))
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            passed = status == 200
+            ok &= passed
+            print(f"{method:5} {path:34} {status}  {'ok' if passed else 'FAILED'}")
+    await redis.close()
+    return ok
+
+if __name__ == "__main__":
+    if not asyncio.run(main()):
+        sys.exit(1)
@@ -0,0 +1,176 @@
+"""
+Seeded synthetic users and loans
+
+The same seed always gives the same data, so two runs of a benchmark on
+different commits start from identical databases. Loans are scored with
+the active policy against the borrower's earlier loans and then walked
+through a realistic review: most pending loans are reviewed, the better
+scores are approved more often, and a few bounce back to pending.
+
+Usage: python -m benchmarks.datagen [--users 2000] [--loans 20000] [--seed 42]
+       [--mongo-url mongodb://localhost:27017] [--db bench_suite]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import numpy as np
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.models.loan import LoanCreate, LoanStatus, StatusChange
+from app.repositories.loan_events import insert_loan_events, loan_event
+from app.utils.applications import build_loan_document
+from app.utils.borrower_history import rebuild_borrower_summaries
+from app.utils.credit_scoring import calculate_credit_score_from_history
+from app.utils.loan_stats import reconcile_loan_stats
+from app.utils.passwords import pwd_context
+from app.utils.scoring_policy import current_policy
+
+PASSWORD = "benchmark-password"
+ADMIN_EMAIL = "admin@bench.example.com"
+REVIEWER_EMAILS = [ADMIN_EMAIL, "reviewer1@bench.example.com", "reviewer2@bench.example.com"]
+
+# Purposes outside the policy table get its default score
+PURPOSES = ["debt consolidation", "home renovation", "education", "business", "other", "car", "medical"]
+PURPOSE_WEIGHTS = [0.30, 0.20, 0.15, 0.12, 0.10, 0.08, 0.05]
+DURATIONS = [6, 12, 18, 24, 36, 48, 60]
+DURATION_WEIGHTS = [0.05, 0.20, 0.10, 0.25, 0.25, 0.08, 0.07]
+START = datetime(2024, 1, 1)
+SPAN_DAYS = 365
+
+def user_email(i: int) -> str:
+    return f"user{i}@bench.example.com"
+
+def generate_users(n: int, seed: int) -> List[dict]:
+    """Borrowers plus the admin and reviewers; everyone shares PASSWORD"""
+    rng = np.random.default_rng(seed)
+    # One hash for everyone: bcrypt per user would dominate the seeding time
+    hashed_password = pwd_context.hash(PASSWORD)
+    users = [
+        {
+            "email": email,
+            "full_name": "Bench Admin",
+            "hashed_password": hashed_password,
+            "is_active": True,
+            "is_admin": True,
+            "created_at": START
+        }
+        for email in REVIEWER_EMAILS
+    ]
+    joined = rng.integers(0, SPAN_DAYS, n)
+    inactive = rng.random(n) < 0.02
+    for i in range(n):
+        users.append({
+            "email": user_email(i),
+            "full_name": f"Borrower {i}",
+            "hashed_password": hashed_password,
+            "is_active": not inactive[i],
+            "is_admin": False,
+            "created_at": START + timedelta(days=int(joined[i]))
+        })
+    return users
+
+def _review(document: dict, rng: np.random.Generator, threshold: float):
+    """Walk a pending loan through review and append the changes to its history"""
+    roll = rng.random()
+    if roll < 0.2:
+        return  # Still waiting
+    changed_at = document["created_at"]
+    reviewer = REVIEWER_EMAILS[int(rng.integers(len(REVIEWER_EMAILS)))]
+    steps = [LoanStatus.IN_REVIEW]
+    if roll < 0.3:
+        steps += [LoanStatus.PENDING, LoanStatus.IN_REVIEW]  # Sent back for documents
+    if roll >= 0.35:
+        # Approval gets likelier the further the score clears the threshold
+        approve_chance = min(0.95, 0.4 + (document["credit_score"] - threshold) / 50)
+        steps.append(LoanStatus.APPROVED if rng.random() < approve_chance else LoanStatus.REJECTED)
+    for status in steps:
+        changed_at += timedelta(hours=float(rng.uniform(1, 72)))
+        document["status_history"].append(StatusChange(
+            status=status,
+            changed_at=changed_at,
+            changed_by=reviewer,
+            notes=None if status == LoanStatus.IN_REVIEW else f"Reviewed by {reviewer}"
+        ).model_dump())
+    document["status"] = steps[-1]
+    document["updated_at"] = changed_at
+
+async def generate_loans(n: int, users: int, seed: int) -> List[dict]:
+    """
+    Loans in creation order, scored against each borrower's history so far
+    Loans per borrower are skewed: most have one or two, a few have many
+    """
+    rng = np.random.default_rng(seed + 1)
+    policy = current_policy()
+    weights = rng.pareto(1.5, users) + 1
+    borrowers = rng.choice(users, n, p=weights / weights.sum())
+    created = np.sort(rng.uniform(0, SPAN_DAYS * 86400, n))
+    amounts = np.clip(np.round(rng.lognormal(np.log(8000), 0.8, n), -2), 500, 50000)
+    purposes = rng.choice(PURPOSES, n, p=PURPOSE_WEIGHTS)
+    durations = rng.choice(DURATIONS, n, p=DURATION_WEIGHTS)
+
+    histories: Dict[str, Tuple[int, int]] = {}
+    loans = []
+    for i in range(n):
+        email = user_email(int(borrowers[i]))
+        loan = LoanCreate(
+            amount=float(amounts[i]),
+            purpose=str(purposes[i]),
+            duration_months=int(durations[i]),
+            user_email=email
+        )
+        total, approved = histories.get(email, (0, 0))
+        score = await calculate_credit_score_from_history(loan, total, approved, policy)
+        created_at = START + timedelta(seconds=float(created[i]))
+        document = build_loan_document(loan, email, score, email, created_at, policy)
+        document["_id"] = ObjectId.from_datetime(created_at)
+        if document["status"] == LoanStatus.PENDING:
+            _review(document, rng, policy.threshold)
+        # Reviews finish later than the loans created after this one; close enough for scoring
+        histories[email] = (total + 1, approved + (document["status"] == LoanStatus.APPROVED))
+        loans.append(document)
+    return loans
+
+async def seed_database(db, users: int, loans: int, seed: int, chunk: int = 5000) -> dict:
+    """Replace the database contents with generated data and rebuild the derived collections"""
+    for collection in ["users", "loans", "loan_events", "borrower_summaries", "loan_stats", "loan_stats_daily", "rescore_jobs"]:
+        await db[collection].delete_many({})
+    user_documents = generate_users(users, seed)
+    for offset in range(0, len(user_documents), chunk):
+        await db.users.insert_many(user_documents[offset:offset + chunk], ordered=False)
+    loan_documents = await generate_loans(loans, users, seed)
+    for offset in range(0, len(loan_documents), chunk):
+        await db.loans.insert_many(loan_documents[offset:offset + chunk], ordered=False)
+
+    # The derived collections: loan_events as the loan hooks write them (the
+    # daily stats are counted from it), the rest as the maintenance commands do
+    events = []
+    for loan in loan_documents:
+        previous_status = None
+        for change in loan["status_history"]:
+            events.append(loan_event(loan, change, previous_status))
+            previous_status = change["status"]
+    for offset in range(0, len(events), chunk):
+        await insert_loan_events(db, events[offset:offset + chunk])
+    await rebuild_borrower_summaries(db)
+    await reconcile_loan_stats(db, fix=True)
+    statuses = {}
+    for loan in loan_documents:
+        statuses[loan["status"].value] = statuses.get(loan["status"].value, 0) + 1
+    return {"users": len(user_documents), "loans": len(loan_documents), "loan_events": len(events), "statuses": statuses}
+
+async def main(args):
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        print(await seed_database(client[args.db], args.users, args.loans, args.seed))
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--loans", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="bench_suite")
+    asyncio.run(main(parser.parse_args()))
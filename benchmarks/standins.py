@@ -0,0 +1,96 @@
+"""
+MongoDB and Redis for benchmarks that must run offline
+
+Each backend is picked in order:
+  1. the URL given on the command line
+  2. a throwaway mongod / redis-server started from the binary on PATH
+  3. an in-process stand-in (mongomock-motor, fakeredis)
+
+The stand-ins are pure Python, so they are much slower than the real
+servers and behave differently under load. Only compare results taken
+with the same backends; the suite records which ones it used.
+"""
+import asyncio
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient
+from redis import asyncio as aioredis
+
+STARTUP_TIMEOUT = 20
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def _wait_until_ready(check, process: subprocess.Popen, name: str):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        try:
+            await check()
+            return
+        except Exception:
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"{name} did not start")
+            await asyncio.sleep(0.1)
+
+@asynccontextmanager
+async def _server(args) -> AsyncIterator[subprocess.Popen]:
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+@asynccontextmanager
+async def open_mongo(url: Optional[str] = None) -> AsyncIterator[Tuple[object, str]]:
+    """Yields (client, backend name); the client has the AsyncIOMotorClient interface"""
+    async with AsyncExitStack() as stack:
+        if url:
+            client, backend = AsyncIOMotorClient(url), "mongodb"
+        elif shutil.which("mongod"):
+            port = _free_port()
+            path = stack.enter_context(tempfile.TemporaryDirectory(prefix="bench-mongod-"))
+            process = await stack.enter_async_context(_server(
+                ["mongod", "--port", str(port), "--bind_ip", "127.0.0.1", "--dbpath", path, "--quiet"]
+            ))
+            client, backend = AsyncIOMotorClient(f"mongodb://127.0.0.1:{port}"), "mongod"
+            await _wait_until_ready(lambda: client.admin.command("ping"), process, "mongod")
+        else:
+            from mongomock_motor import AsyncMongoMockClient
+            client, backend = AsyncMongoMockClient(), "mongomock"
+        try:
+            yield client, backend
+        finally:
+            client.close()
+
+@asynccontextmanager
+async def open_redis(url: Optional[str] = None) -> AsyncIterator[Tuple[object, str]]:
+    """Yields (client, backend name) for a redis.asyncio client with decoded responses"""
+    async with AsyncExitStack() as stack:
+        if url:
+            redis, backend = aioredis.from_url(url, encoding="utf8", decode_responses=True), "redis"
+        elif shutil.which("redis-server"):
+            port = _free_port()
+            process = await stack.enter_async_context(_server(
+                ["redis-server", "--port", str(port), "--bind", "127.0.0.1", "--save", "", "--appendonly", "no"]
+            ))
+            redis = aioredis.from_url(f"redis://127.0.0.1:{port}", encoding="utf8", decode_responses=True)
+            backend = "redis-server"
+            await _wait_until_ready(redis.ping, process, "redis-server")
+        else:
+            from fakeredis import aioredis as fakeredis
+            redis, backend = fakeredis.FakeRedis(decode_responses=True), "fakeredis"
+        try:
+            yield redis, backend
+        finally:
+            await redis.close()
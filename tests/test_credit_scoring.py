@@ -0,0 +1,121 @@
+"""
+The policy-driven scorers against the rules the repository started with
+
+The bundled default policy must score every loan exactly as the original
+if-chains did, through both the single-loan and the batch path. The
+cases sit on and around every band boundary.
+"""
+import asyncio
+from datetime import datetime
+from itertools import product
+from typing import List
+import numpy as np
+import pytest
+from app.models.loan import Loan, LoanStatus
+from app.utils.credit_scoring import calculate_credit_score, score_batch
+from app.utils.scoring_policy import DEFAULT_POLICY_PATH, load_policy_file
+
+AMOUNTS = [500, 4999.99, 5000, 5000.01, 10000, 10000.01, 20000, 20000.01, 50000]
+DURATIONS = [1, 6, 7, 12, 13, 24, 25, 60]
+PURPOSES = ["education", "Education", "HOME RENOVATION", "Business", "debt consolidation", "other", "vacation", ""]
+HISTORIES = [(0, 0), (1, 0), (1, 1), (2, 1), (2, 2), (5, 3)]  # (previous loans, approved)
+
+# Frozen copy of app/utils/credit_scoring.py before scoring policies; do not
+# update it to follow the scorer, it is what the scorer is checked against
+def baseline_credit_score(loan: Loan, previous_loans: List[Loan]) -> float:
+    if loan.amount <= 5000:
+        amount_score = 40.0
+    elif loan.amount <= 10000:
+        amount_score = 30.0
+    elif loan.amount <= 20000:
+        amount_score = 20.0
+    else:
+        amount_score = 10.0
+
+    if loan.duration_months <= 6:
+        duration_score = 30.0
+    elif loan.duration_months <= 12:
+        duration_score = 25.0
+    elif loan.duration_months <= 24:
+        duration_score = 20.0
+    else:
+        duration_score = 15.0
+
+    purpose_scores = {
+        "education": 30.0,
+        "home renovation": 25.0,
+        "business": 20.0,
+        "debt consolidation": 15.0,
+        "other": 10.0
+    }
+    purpose_score = purpose_scores.get(loan.purpose.lower(), 10.0)
+
+    if not previous_loans:
+        history_score = 20.0
+    else:
+        completed_loans = sum(1 for previous in previous_loans if previous.status == "approved")
+        if completed_loans >= 2:
+            history_score = 30.0
+        elif completed_loans == 1:
+            history_score = 25.0
+        else:
+            history_score = 15.0
+
+    total_score = amount_score + duration_score + purpose_score + history_score
+    return round((total_score / 130.0) * 100, 2)
+
+CASES = list(product(AMOUNTS, DURATIONS, PURPOSES, HISTORIES))
+
+def build_loan(amount, duration_months, purpose, history):
+    now = datetime(2024, 1, 1)
+    previous, approved = history
+    loan = Loan(
+        id="case",
+        user_email="case@example.com",
+        amount=amount,
+        purpose=purpose,
+        duration_months=duration_months,
+        created_at=now
+    )
+    previous_loans = [
+        Loan(
+            id=f"prev-{i}",
+            user_email="case@example.com",
+            amount=1000,
+            purpose="other",
+            duration_months=12,
+            created_at=now,
+            status=LoanStatus.APPROVED if i < approved else LoanStatus.REJECTED
+        )
+        for i in range(previous)
+    ]
+    return loan, previous_loans
+
+@pytest.fixture(scope="module")
+def policy():
+    return load_policy_file(DEFAULT_POLICY_PATH)
+
+@pytest.fixture(scope="module")
+def expected():
+    return [baseline_credit_score(*build_loan(*case)) for case in CASES]
+
+def test_single_loan_path_matches_baseline(policy, expected):
+    async def score_all():
+        return [await calculate_credit_score(*build_loan(*case), policy) for case in CASES]
+
+    scores = asyncio.run(score_all())
+    mismatches = [(case, score, want) for case, score, want in zip(CASES, scores, expected) if score != want]
+    assert not mismatches, mismatches[:10]
+
+def test_batch_path_matches_baseline(policy, expected):
+    amounts, durations, purposes, histories = zip(*CASES)
+    scores = score_batch(
+        np.array(amounts, dtype=np.float64),
+        np.array(durations),
+        list(purposes),
+        np.array([previous for previous, _ in histories]),
+        np.array([approved for _, approved in histories]),
+        policy
+    ).total_score
+    mismatches = [(case, score, want) for case, score, want in zip(CASES, scores.tolist(), expected) if score != want]
+    assert not mismatches, mismatches[:10]
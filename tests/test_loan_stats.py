@@ -0,0 +1,31 @@
+"""
+Stats counters against reconcile_loan_stats, with mongomock-motor standing in for MongoDB
+"""
+import asyncio
+from datetime import datetime
+from mongomock_motor import AsyncMongoMockClient
+from app.models.loan import LoanCreate, LoanStatus
+from app.repositories.loans import insert_loan
+from app.utils.applications import build_queued_loan_document
+from app.utils.loan_hooks import after_loan_created
+from app.utils.loan_stats import read_daily_stats, read_loan_stats, reconcile_loan_stats
+from app.utils.scoring_queue import score_queued_loans
+
+def test_queued_loan_left_pending_counts_once():
+    async def run():
+        db = AsyncMongoMockClient()["test_loan_stats"]
+        # Scores well above the threshold, so scoring leaves it pending
+        application = LoanCreate(amount=1000, purpose="education", duration_months=6, user_email="borrower@example.com")
+        loan = build_queued_loan_document(application, "borrower@example.com", "borrower@example.com", datetime.utcnow())
+        await after_loan_created(db, await insert_loan(db, loan))
+        before = (await read_loan_stats(db), await read_daily_stats(db, 1))
+
+        assert await score_queued_loans(db, [loan["_id"]]) == 1
+        stored = await db.loans.find_one({"_id": loan["_id"]})
+        assert stored["status"] == LoanStatus.PENDING and stored["credit_score"] is not None
+        return before, (await read_loan_stats(db), await read_daily_stats(db, 1)), await reconcile_loan_stats(db)
+
+    before, after, report = asyncio.run(run())
+    assert after == before
+    assert after[1][0]["statuses"][LoanStatus.PENDING.value]["count"] == 1
+    assert not report["totals"] and not report["daily"]
@@ -0,0 +1,36 @@
+"""
+Every declared query shape must be served by an index
+
+Needs a real MongoDB, since the stand-in cannot explain queries: set
+MONGODB_TEST_URL, or have mongod on PATH for a throwaway server.
+Skipped otherwise.
+"""
+import asyncio
+import os
+import pytest
+import app.main  # noqa: F401  Registers every declared index and query
+from app.dependencies.indexes import check_query_plans, declared_queries, sync_indexes
+from benchmarks.standins import open_mongo
+
+async def collscans():
+    async with open_mongo(os.environ.get("MONGODB_TEST_URL")) as (client, backend):
+        if backend == "mongomock":
+            pytest.skip("needs MONGODB_TEST_URL or mongod on PATH")
+        await client.drop_database("test_query_plans")
+        db = client["test_query_plans"]
+        try:
+            await sync_indexes(db, drop_stale=True)
+            return await check_query_plans(db)
+        finally:
+            await client.drop_database("test_query_plans")
+
+def test_queries_are_declared():
+    collections = {query.collection for query in declared_queries()}
+    assert {"users", "loans", "loan_events"} <= collections
+
+def test_declared_queries_use_an_index():
+    failures = asyncio.run(collscans())
+    assert not failures, "\n".join(
+        f"COLLSCAN on {query.collection}: filter={query.filter} sort={query.sort} plan={stages}"
+        for query, stages in failures
+    )